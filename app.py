@@ -17,6 +17,7 @@ from utils.firebase_config import ensure_firebase
 from routes.wms import bp as wms_bp
 from routes.report import bp as report_bp
 from routes.sdd import bp as sdd_bp
+from utils import seatalk
 import config
 
 # ───── Setup Flask ─────
@@ -218,6 +219,10 @@ def run_flask():
     # Check if running in development mode
     dev_mode = os.getenv("FLASK_ENV", "development") == "development" or "--dev" in sys.argv
 
+    # SeaTalk outbox: chỉ process phục vụ request mới gửi (dev reloader có thêm process cha)
+    if not dev_mode or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        seatalk.outbox.start()
+
     if dev_mode:
         # Enable watchdog debug logging (if watchdog is used)
         os.environ["WATCHDOG_LOG_LEVEL"] = "DEBUG"
@@ -29,3 +29,87 @@ AUTH_PASSWORD_HASH = hashlib.sha256(AUTH_PASSWORD.encode()).hexdigest()
 
 SESSION_SECRET_KEY = os.getenv("SESSION_SECRET_KEY", "your-secret-key-change-this-in-production")
 
+
+# Upstream HTTP (shared keep-alive pool, see utils/http_client.py); pool size is raised to EXEC_HOST_LIMIT below
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", str(FLASK_THREADS)))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+# Downloads stay in memory up to this size, then spill to a temp file
+HTTP_SPOOL_MB = int(os.getenv("HTTP_SPOOL_MB", "8"))
+
+# Warehouse cookie cache (see utils/cookie_cache.py)
+COOKIE_CACHE_TTL = float(os.getenv("COOKIE_CACHE_TTL", "300"))
+# Upstream retcodes meaning "cookie expired / not logged in"
+COOKIE_AUTH_RETCODES = {int(x) for x in os.getenv("COOKIE_AUTH_RETCODES", "401,403").split(",") if x.strip()}
+
+# LH tool: concurrent loading-list paging
+LH_PAGE_WORKERS = int(os.getenv("LH_PAGE_WORKERS", "4"))
+LH_PAGE_RETRIES = int(os.getenv("LH_PAGE_RETRIES", "3"))
+LH_DETAIL_WORKERS = int(os.getenv("LH_DETAIL_WORKERS", "8"))
+LH_TO_DETAIL_TTL = float(os.getenv("LH_TO_DETAIL_TTL", "1800"))
+LH_BATCH_WORKERS = int(os.getenv("LH_BATCH_WORKERS", "6"))
+LH_PARCEL_COUNT_TTL = float(os.getenv("LH_PARCEL_COUNT_TTL", "30"))
+LH_RUN_SHEET_TTL = float(os.getenv("LH_RUN_SHEET_TTL", "600"))
+
+# Run-sheet PDF disk cache (LRU, bounded by size)
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(BASE_DIR, "cache", "run_sheets"))
+PDF_CACHE_MAX_MB = int(os.getenv("PDF_CACHE_MAX_MB", "200"))
+
+# LH bulk ZIP export: trips prepared in parallel (each trip also pages/expands concurrently)
+LH_EXPORT_WORKERS = int(os.getenv("LH_EXPORT_WORKERS", "3"))
+
+# LH trip-list response cache (seconds); past days are effectively immutable
+LH_REPORT_TTL = float(os.getenv("LH_REPORT_TTL", "20"))
+LH_REPORT_STALE = float(os.getenv("LH_REPORT_STALE", "120"))
+LH_REPORT_PAST_TTL = float(os.getenv("LH_REPORT_PAST_TTL", "21600"))
+
+# LH incremental trip sync (utils/lh_sync.py): seconds
+LH_SYNC_MIN_INTERVAL = float(os.getenv("LH_SYNC_MIN_INTERVAL", "10"))
+LH_SYNC_FULL_INTERVAL = float(os.getenv("LH_SYNC_FULL_INTERVAL", "300"))
+LH_SYNC_OVERLAP = float(os.getenv("LH_SYNC_OVERLAP", "120"))
+LH_SYNC_MAX_TABLES = int(os.getenv("LH_SYNC_MAX_TABLES", "16"))
+
+# SDD result cache (seconds): per time_mode while the window is open,
+# SDD_CACHE_TTL_CLOSED once time_to is more than SDD_CLOSED_GRACE in the past
+SDD_CACHE_TTL_STATUS = float(os.getenv("SDD_CACHE_TTL_STATUS", "60"))
+SDD_CACHE_TTL_CREATED = float(os.getenv("SDD_CACHE_TTL_CREATED", "180"))
+SDD_CACHE_TTL_CLOSED = float(os.getenv("SDD_CACHE_TTL_CLOSED", "1800"))
+SDD_CLOSED_GRACE = float(os.getenv("SDD_CLOSED_GRACE", "600"))
+
+# SDD OOS status breakdown: orders per search_wave_filter_order call, parallel calls
+SDD_OOS_BATCH = int(os.getenv("SDD_OOS_BATCH", "100"))
+SDD_OOS_WORKERS = int(os.getenv("SDD_OOS_WORKERS", "6"))
+
+# SDD background jobs: concurrent runs, seconds a finished job (and its result) is kept
+SDD_JOB_WORKERS = int(os.getenv("SDD_JOB_WORKERS", "4"))
+SDD_JOB_TTL = float(os.getenv("SDD_JOB_TTL", "900"))
+
+# SDD time-window sharding: default shard width in hours (0 = off, request can pass shard_hours),
+# max shards per run (concurrent exports per warehouse: EXEC_WH_LIMIT)
+SDD_SHARD_HOURS = float(os.getenv("SDD_SHARD_HOURS", "0"))
+SDD_MAX_SHARDS = int(os.getenv("SDD_MAX_SHARDS", "12"))
+
+# Shared executors (utils/executors.py): pool sizes and per-key concurrency limits
+EXEC_IO_WORKERS = int(os.getenv("EXEC_IO_WORKERS", "32"))
+EXEC_CPU_WORKERS = int(os.getenv("EXEC_CPU_WORKERS", str(max(2, os.cpu_count() or 2))))
+EXEC_WH_LIMIT = int(os.getenv("EXEC_WH_LIMIT", "3"))
+EXEC_HOST_LIMIT = int(os.getenv("EXEC_HOST_LIMIT", "16"))
+# Pool của mỗi host phải giữ được EXEC_HOST_LIMIT request song song, nếu nhỏ hơn
+# urllib3 (pool_block=False) mở connection thừa rồi đóng bỏ -> mất keep-alive
+if os.getenv("HTTP_POOL_SIZE") and HTTP_POOL_SIZE < EXEC_HOST_LIMIT:
+    print(f"[config] ⚠️ HTTP_POOL_SIZE={HTTP_POOL_SIZE} < EXEC_HOST_LIMIT={EXEC_HOST_LIMIT}, using {EXEC_HOST_LIMIT}")
+HTTP_POOL_SIZE = max(HTTP_POOL_SIZE, EXEC_HOST_LIMIT)
+
+# SeaTalk outbox (utils/seatalk.py): undelivered messages on disk, retry backoff in seconds
+SEATALK_OUTBOX_DIR = os.getenv("SEATALK_OUTBOX_DIR", os.path.join(BASE_DIR, "cache", "seatalk_outbox"))
+SEATALK_MAX_ATTEMPTS = int(os.getenv("SEATALK_MAX_ATTEMPTS", "8"))
+SEATALK_RETRY_BASE = float(os.getenv("SEATALK_RETRY_BASE", "5"))
+SEATALK_RETRY_MAX = float(os.getenv("SEATALK_RETRY_MAX", "600"))
+
+# Handover report artifacts (content-addressed, served by /api/report/artifacts/<digest>.xlsx)
+REPORT_ARTIFACT_DIR = os.getenv("REPORT_ARTIFACT_DIR", os.path.join(BASE_DIR, "cache", "reports"))
+REPORT_ARTIFACT_MAX_MB = int(os.getenv("REPORT_ARTIFACT_MAX_MB", "500"))
+REPORT_ARTIFACT_MAX_DAYS = float(os.getenv("REPORT_ARTIFACT_MAX_DAYS", "30"))
+
+# RTDB chunked reads (utils/firebase.py iter_children): children per request
+RTDB_CHUNK_SIZE = int(os.getenv("RTDB_CHUNK_SIZE", "2000"))
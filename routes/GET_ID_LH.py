@@ -1,10 +1,11 @@
-import requests, json
+import json
 import os, sys
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 from utility import build_api_headers, firebase_read_cookie_rtdb, firebase_url, get_daily_timestamps, convert_timestamp_to_day_time_gmt7
+from utils import http_client
 
 WH = "SPX"
 from_time, to_time = get_daily_timestamps()
@@ -24,7 +25,7 @@ def extract_trip_data(trip):
         "loading_time": convert_timestamp_to_day_time_gmt7(station.get("loading_time")) if station.get("loading_time") else None,
     }
 
-response = requests.get(URL, headers=headers)
+response = http_client.get(URL, headers=headers)
 try:
     if response.status_code == 200:
         data = response.json()
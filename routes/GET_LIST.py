@@ -1,6 +1,5 @@
 import requests
 import csv
-import math
 import os
 import sys
 from datetime import datetime, timezone, timedelta
@@ -14,6 +13,10 @@ PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
 UTILITY_ROOT = os.path.dirname(PROJECT_ROOT)
 if UTILITY_ROOT not in sys.path:
     sys.path.insert(0, UTILITY_ROOT)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from utils import http_client, lh_trips
 
 try:
     from utility import build_api_headers, firebase_read_cookie_rtdb, firebase_url
@@ -60,7 +63,7 @@ def get_trip_id_from_trip_number(trip_number):
 
         url = f"https://spx.shopee.vn/api/admin/transportation/trip/history/list?loading_time={from_time},{to_time}&pageno=1&count=300&mtime={from_time},{to_time}&middle_station=3983"
 
-        response = requests.get(url, headers=headers)
+        response = http_client.get(url, headers=headers)
         response.raise_for_status()
         data = response.json()
 
@@ -94,7 +97,7 @@ def get_trip_data(trip_id, trip_number=None):
     print(f"Đang lấy thông tin trip_id: {trip_id}...")
 
     try:
-        trip_response = requests.get(trip_history_url, params=trip_params, headers=headers)
+        trip_response = http_client.get(trip_history_url, params=trip_params, headers=headers)
         trip_response.raise_for_status()
         trip_data = trip_response.json()
 
@@ -137,187 +140,32 @@ def get_trip_data(trip_id, trip_number=None):
 
 
     # Bước 2: Lấy danh sách loading với sequence_number đã lấy được
-    base_url = "https://spx.shopee.vn/api/admin/transportation/trip/history/loading/list"
-
-    # Lấy trang đầu tiên để biết tổng số trang
-    params = {
-        "trip_id": trip_id,
-        "pageno": 1,
-        "count": 300,
-        "loaded_sequence_number": sequence_number,
-        "type": "outbound"
-    }
+    base_url = lh_trips.URL_LOADING_HISTORY
 
     print(f"Đang lấy dữ liệu loading list...")
 
     try:
-        response = requests.get(base_url, params=params, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-
-        if data.get("retcode") != 0:
-            print(f"Lỗi API: {data.get('message')}")
-            return
+        # Lấy trang đầu tiên để biết tổng số trang
+        first = lh_trips.fetch_loading_page(base_url, headers, trip_id, sequence_number, 1, count=300)
 
         # Lấy thông tin pagination
-        total = data["data"]["total"]
-        count = data["data"]["count"]
-        total_parcel = data["data"]["total_parcel"]
+        total = first["total"]
+        total_parcel = first["total_parcel"]
 
         # Tính số trang
-        total_pages = math.ceil(total / count)
+        total_pages = lh_trips.total_pages(first)
         print(f"Tổng số TO: {total}, Tổng số parcel: {total_parcel}, Số trang: {total_pages}")
 
-        # Thu thập tất cả dữ liệu
-        all_data = []
-
-        # Thêm dữ liệu từ trang đầu tiên
-        for item in data["data"]["list"]:
-            to_number = item.get("to_number", "")
-            pack_type_name = item.get("pack_type_name", "")
-            to_parcel_quantity = item.get("to_parcel_quantity", 0)
-            scan_number = item.get("scan_number", "")
-            operator = item.get("operator", "")
-            to_weight = round(item.get("to_weight", 0) / 1000, 3)
-            ctime = item.get("ctime", 0)
-
-            # Nếu to_parcel_quantity > 1, gọi API để lấy fleet_order_id và ghi từng dòng
-            if to_parcel_quantity > 1:
-                try:
-                    detail_url = "https://spx.shopee.vn/api/in-station/general_to/detail/search"
-                    detail_params = {
-                        "to_number": to_number,
-                        "pageno": 1,
-                        "count": 300
-                    }
-                    detail_resp = requests.get(detail_url, params=detail_params, headers=headers)
-                    detail_resp.raise_for_status()
-                    detail_json = detail_resp.json()
-                    if detail_json.get("retcode") == 0:
-                        lst = detail_json.get("data", {}).get("list", [])
-                        fleet_ids = [row.get("fleet_order_id", "") for row in lst if row.get("fleet_order_id")]
-                        # Ghi mỗi fleet_order_id thành 1 dòng riêng
-                        if fleet_ids:
-                            for fleet_id in fleet_ids:
-                                all_data.append({
-                                    "to_number": to_number,
-                                    "pack_type_name": pack_type_name,
-                                    "scan_number": fleet_id,
-                                    "operator": operator,
-                                    "to_weight": to_weight,
-                                    "ctime": ctime
-                                })
-                        else:
-                            # Không có fleet_id, ghi dòng gốc
-                            all_data.append({
-                                "to_number": to_number,
-                                "pack_type_name": pack_type_name,
-                                "scan_number": scan_number,
-                                "operator": operator,
-                                "to_weight": to_weight,
-                                "ctime": ctime
-                            })
-                except Exception as e:
-                    # Giữ nguyên dòng gốc nếu có lỗi
-                    print(f"Lỗi khi lấy chi tiết TO {to_number}: {e}")
-                    all_data.append({
-                        "to_number": to_number,
-                        "pack_type_name": pack_type_name,
-                        "scan_number": scan_number,
-                        "operator": operator,
-                        "to_weight": to_weight,
-                        "ctime": ctime
-                    })
-            else:
-                # to_parcel_quantity <= 1, pack_type_name = "Single"
-                all_data.append({
-                    "to_number": to_number,
-                    "pack_type_name": "Single",
-                    "scan_number": scan_number,
-                    "operator": operator,
-                    "to_weight": to_weight,
-                    "ctime": ctime
-                })
-
-        # Lấy dữ liệu từ các trang còn lại
-        for page in range(2, total_pages + 1):
-            print(f"Đang lấy trang {page}/{total_pages}...")
-            params["pageno"] = page
-
-            response = requests.get(base_url, params=params, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-
-            if data.get("retcode") != 0:
-                print(f"Lỗi API tại trang {page}: {data.get('message')}")
-                continue
-
-            for item in data["data"]["list"]:
-                to_number = item.get("to_number", "")
-                pack_type_name = item.get("pack_type_name", "")
-                to_parcel_quantity = item.get("to_parcel_quantity", 0)
-                scan_number = item.get("scan_number", "")
-                operator = item.get("operator", "")
-                to_weight = round(item.get("to_weight", 0) / 1000, 2)
-                ctime = item.get("ctime", 0)
-
-                # Nếu to_parcel_quantity > 1, gọi API để lấy fleet_order_id và ghi từng dòng
-                if to_parcel_quantity > 1:
-                    try:
-                        detail_url = "https://spx.shopee.vn/api/in-station/general_to/detail/search"
-                        detail_params = {
-                            "to_number": to_number,
-                            "pageno": 1,
-                            "count": 300
-                        }
-                        detail_resp = requests.get(detail_url, params=detail_params, headers=headers)
-                        detail_resp.raise_for_status()
-                        detail_json = detail_resp.json()
-                        if detail_json.get("retcode") == 0:
-                            lst = detail_json.get("data", {}).get("list", [])
-                            fleet_ids = [row.get("fleet_order_id", "") for row in lst if row.get("fleet_order_id")]
-                            # Ghi mỗi fleet_order_id thành 1 dòng riêng
-                            if fleet_ids:
-                                for fleet_id in fleet_ids:
-                                    all_data.append({
-                                        "to_number": to_number,
-                                        "pack_type_name": pack_type_name,
-                                        "scan_number": fleet_id,
-                                        "operator": operator,
-                                        "to_weight": to_weight,
-                                        "ctime": ctime
-                                    })
-                            else:
-                                # Không có fleet_id, ghi dòng gốc
-                                all_data.append({
-                                    "to_number": to_number,
-                                    "pack_type_name": pack_type_name,
-                                    "scan_number": scan_number,
-                                    "operator": operator,
-                                    "to_weight": to_weight,
-                                    "ctime": ctime
-                                })
-                    except Exception as e:
-                        # Giữ nguyên dòng gốc nếu có lỗi
-                        print(f"Lỗi khi lấy chi tiết TO {to_number}: {e}")
-                        all_data.append({
-                            "to_number": to_number,
-                            "pack_type_name": pack_type_name,
-                            "scan_number": scan_number,
-                            "operator": operator,
-                            "to_weight": to_weight,
-                            "ctime": ctime
-                        })
-                else:
-                    # to_parcel_quantity <= 1, pack_type_name = "Single"
-                    all_data.append({
-                        "to_number": to_number,
-                        "pack_type_name": "Single",
-                        "scan_number": scan_number,
-                        "operator": operator,
-                        "to_weight": to_weight,
-                        "ctime": ctime
-                    })
+        # Thu thập tất cả TO (các trang còn lại lấy song song, giữ đúng thứ tự trang)
+        items = list(first["list"])
+        for page, page_data in enumerate(
+            lh_trips.iter_remaining_pages(base_url, headers, trip_id, sequence_number, total_pages, count=300), start=2
+        ):
+            print(f"Đã lấy trang {page}/{total_pages}")
+            items.extend(page_data.get("list") or [])
+
+        # TO nhiều parcel -> lấy fleet_order_id song song, mỗi fleet_order_id 1 dòng
+        all_data = lh_trips.expand_items(items, headers)
 
         # Sắp xếp dữ liệu theo: ctime -> pack_type_name
         all_data.sort(key=lambda x: (x["ctime"], x["pack_type_name"]))
@@ -340,8 +188,7 @@ def get_trip_data(trip_id, trip_number=None):
 
         # Xuất ra file CSV
         with open(filename, 'w', newline='', encoding='utf-8-sig') as csvfile:
-            fieldnames = ['to_number', 'pack_type_name', 'scan_number', 'operator', 'to_weight', 'ctime']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            writer = csv.DictWriter(csvfile, fieldnames=lh_trips.CSV_FIELDS)
 
             writer.writeheader()
             writer.writerows(all_data)
@@ -349,6 +196,8 @@ def get_trip_data(trip_id, trip_number=None):
         print(f"✓ Đã xuất {len(all_data)} dòng dữ liệu ra file: {filename}")
         return filename
 
+    except lh_trips.UpstreamError as e:
+        print(f"Lỗi API: {e}")
     except requests.exceptions.RequestException as e:
         print(f"Lỗi kết nối API: {e}")
     except Exception as e:
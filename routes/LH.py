@@ -1,4 +1,3 @@
-import requests
 import os
 import sys
 import subprocess
@@ -9,6 +8,7 @@ if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
 from utility import build_api_headers, firebase_read_cookie_rtdb, firebase_url, get_daily_timestamps, convert_timestamp_to_day_time_gmt7
+from utils import http_client
 
 WH = "SPX"
 cookie = firebase_read_cookie_rtdb(WH, firebase_url)
@@ -25,7 +25,7 @@ def get_all_trips():
     url = f"https://spx.shopee.vn/api/admin/transportation/trip/history/list?loading_time={from_time},{to_time}&pageno=1&count=300&mtime={from_time},{to_time}&middle_station=3983"
 
     try:
-        response = requests.get(url, headers=headers)
+        response = http_client.get(url, headers=headers)
         response.raise_for_status()
         data = response.json()
 
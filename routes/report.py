@@ -1,17 +1,27 @@
+import hashlib
 import os
 import sys
+import tempfile
+import zipfile
 import requests
-import math
-import csv
-import io
 from datetime import datetime, timezone, timedelta
-from flask import Blueprint, request, jsonify, url_for, send_file
+from flask import Blueprint, request, jsonify, url_for, send_file, Response, current_app
 
-from utils.firebase import rtdb
+from utils.firebase import rtdb, iter_children, count_children
 from utils.timeutils import today_short
-from utils.report import build_report_message, create_excel_report
-from utils.seatalk import seatalk_text, seatalk_file
-from config import BASE_DIR
+from utils.report import CHANNELS, format_report_message, handover_book, collect_handover
+from utils.handover_live import HandoverLive
+from utils import seatalk
+from utils.seatalk import XLSX_MIME
+from utils import executors, http_client
+from utils.cookie_cache import CookieCache
+from utils import lh_trips
+from utils import lh_sync
+from utils.file_cache import DiskLRUCache, ArtifactStore
+from utils.cache import SWRCache
+from config import (PDF_CACHE_DIR, PDF_CACHE_MAX_MB, LH_EXPORT_WORKERS,
+                    LH_REPORT_TTL, LH_REPORT_STALE, LH_REPORT_PAST_TTL,
+                    REPORT_ARTIFACT_DIR, REPORT_ARTIFACT_MAX_MB, REPORT_ARTIFACT_MAX_DAYS)
 
 # Import utility functions from parent directory for LH functionality
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -21,7 +31,7 @@ if UTILITY_ROOT not in sys.path:
     sys.path.insert(0, UTILITY_ROOT)
 
 try:
-    from utility import build_api_headers, firebase_read_cookie_rtdb, firebase_url, get_daily_timestamps, convert_timestamp_to_day_time_gmt7
+    from utility import build_api_headers, firebase_read_cookie_rtdb, firebase_url, get_daily_timestamps
     UTILITY_AVAILABLE = True
 except ImportError:
     UTILITY_AVAILABLE = False
@@ -42,12 +52,6 @@ except ImportError:
         end_of_day = now.replace(hour=23, minute=59, second=59, microsecond=999999)
         return int(start_of_day.timestamp()), int(end_of_day.timestamp())
 
-    def convert_timestamp_to_day_time_gmt7(timestamp):
-        if not timestamp:
-            return ""
-        dt = datetime.fromtimestamp(timestamp, tz=timezone(timedelta(hours=7)))
-        return dt.strftime("%Y-%m-%d %H:%M:%S")
-
     def firebase_read_cookie_rtdb(wh, url):
         return ""
 
@@ -55,45 +59,67 @@ except ImportError:
 
 bp = Blueprint("report", __name__)
 
-@bp.post("/run")
-def api_report_run():
-    """Generate Excel report and send via SeaTalk (text + file)."""
-    req = request.get_json(force=True) or {}
-    date_str = req.get("date") or today_short()
+# Cookie SPX cache trong process (TTL + tự bỏ khi upstream báo 401/403)
+_cookies = CookieCache(lambda wh: firebase_read_cookie_rtdb(wh, firebase_url) if UTILITY_AVAILABLE else "")
 
-    # Fetch snapshot from RTDB
-    snap = rtdb.reference(f"/{date_str}/DATA_SCAN").get() or {}
+# Run-sheet PDF đã tải (trip đã seal không đổi run sheet)
+_pdf_cache = DiskLRUCache(PDF_CACHE_DIR, PDF_CACHE_MAX_MB * 1024 * 1024)
 
-    # Build message and filename
-    msg, filename, per_ch_non_cancel, total_cancel, total_non_cancel = build_report_message(date_str, snap)
+# File Excel handover theo fingerprint nội dung: chạy lại cùng dữ liệu -> dùng lại file cũ
+_artifacts = ArtifactStore(REPORT_ARTIFACT_DIR, REPORT_ARTIFACT_MAX_MB * 1024 * 1024,
+                           max_age=REPORT_ARTIFACT_MAX_DAYS * 86400)
 
-    # Create Excel bytes and save a copy to static/reports for browser download
-    excel_bytes = create_excel_report(snap, filename)
-    reports_dir = os.path.join(BASE_DIR, "static", "reports")
-    os.makedirs(reports_dir, exist_ok=True)
-    filepath = os.path.join(reports_dir, filename)
-    try:
-        with open(filepath, "wb") as f:
-            f.write(excel_bytes)
-    except Exception:
-        # If saving fails, we still attempt to send via SeaTalk
-        pass
+# JSON đã serialize của LH_trips / LH_report theo (view, kind, date)
+_report_cache = SWRCache(LH_REPORT_STALE, maxsize=128)
 
-    public_url = url_for("static", filename=f"reports/{filename}", _external=True)
+# DATA_SCAN / Data-cancel của hôm nay giữ trong RAM qua RTDB listener
+_live = HandoverLive(rtdb.reference)
 
-    # Send to SeaTalk: text + file
+@bp.post("/run")
+def api_report_run():
+    """Generate Excel report and queue it for SeaTalk (text + file); delivery runs in the background."""
+    req = request.get_json(force=True) or {}
+    date_str = req.get("date") or today_short()
+
+    day = _live.get(date_str)
+    if day is not None:
+        # Hôm nay: counters + thứ tự scan đã có sẵn từ listener, không tải lại cả ngày
+        snap = day.snapshot()
+        msg, filename, per_ch_non_cancel, total_cancel, total_non_cancel = format_report_message(
+            date_str, snap["non_cancel"], snap["cancelled"])
+        book = handover_book(snap["items"])
+    else:
+        # Ngày khác / listener chưa sync: đọc DATA_SCAN theo chunk, chỉ giữ field cần cho report
+        per_ch_non_cancel, total_cancel, items = collect_handover(
+            {ch: iter_children(f"/{date_str}/DATA_SCAN/{ch}") for ch in CHANNELS})
+
+        # Build message and filename
+        msg, filename, per_ch_non_cancel, total_cancel, total_non_cancel = format_report_message(
+            date_str, per_ch_non_cancel, total_cancel)
+        book = handover_book(items)
+
+    # Excel written once into the artifact store; identical data reuses the stored file.
+    # Giữ handle mở tới khi outbox copy xong: path có thể bị evict bất cứ lúc nào
+    digest = book.fingerprint()
+    artifact = _artifacts.open_or_put(digest, book.save, suffix=".xlsx")
+
+    public_url = url_for("report.api_report_artifact", digest=digest, name=filename, _external=True)
+
+    # Queue to SeaTalk outbox: text + file (gửi nền, retry, còn lại sau restart)
     st_text_res = None
     st_file_res = None
     st_err = None
     try:
-        st_text_res = seatalk_text(msg)
+        st_text_res = {"ok": True, "queued": True, "id": seatalk.queue_text(msg)}
     except Exception as e:
         st_err = f"seatalk_text: {e}"
     try:
         caption = f"Báo cáo Handover ngày {date_str} – tổng {total_non_cancel} đơn\n{public_url}"
-        st_file_res = seatalk_file(excel_bytes, filename, caption=caption)
+        st_file_res = {"ok": True, "queued": True, "id": seatalk.queue_file(artifact, filename, caption=caption)}
     except Exception as e:
         st_err = (st_err + "; " if st_err else "") + f"seatalk_file: {e}"
+    finally:
+        artifact.close()
 
     return jsonify({
         "ok": True,
@@ -113,222 +139,308 @@ def api_report_run():
     })
 
 
-@bp.get("/LH_report")
-def api_lh_report():
-    """
-    Get all LH (Last Hub) trips from SPX API
-    Based on LH.py functionality
+@bp.get("/handover_counters")
+def api_handover_counters():
+    """Handover counters of a day (today from the live listener, other days from RTDB)"""
+    date_str = request.args.get("date") or today_short()
+    day = _live.get(date_str)
+    if day is not None:
+        snap = day.snapshot(items=False)
+        per_ch_non_cancel, total_cancel, cancel_nodes = snap["non_cancel"], snap["cancelled"], snap["cancel_counts"]
+        source = "live"
+    else:
+        per_ch_non_cancel, total_cancel, _ = collect_handover(
+            {ch: iter_children(f"/{date_str}/DATA_SCAN/{ch}") for ch in CHANNELS}, keep_rows=False)
+        # Data-cancel chỉ cần số lượng -> shallow read (chỉ key)
+        cancel_nodes = {ch: count_children(f"/{date_str}/Data-cancel/{ch}") for ch in CHANNELS}
+        source = "rtdb"
+    return jsonify({
+        "ok": True,
+        "date": date_str,
+        "source": source,
+        "per_channel_non_cancel": per_ch_non_cancel,
+        "total_cancel": total_cancel,
+        "total_non_cancel": sum(per_ch_non_cancel.values()),
+        "cancel_nodes": cancel_nodes,
+    })
 
-    Query params:
-        date: Optional date in YYYY-MM-DD format (default: today)
 
-    Returns:
-        JSON with list of trips including:
-        - id, trip_number, operator
-        - seal_time, loading_time
-        - load_quantity, vehicle_number, vehicle_type_name
+@bp.get("/artifacts/<digest>.xlsx")
+def api_report_artifact(digest):
+    """Serve a stored report (ETag = content digest, Range / If-None-Match via send_file)"""
+    try:
+        f = _artifacts.open(digest, ".xlsx")
+    except ValueError:
+        f = None
+    if f is None:
+        return jsonify({"ok": False, "error": "Report not found or expired"}), 404
+    name = os.path.basename(request.args.get("name") or "") or f"{digest}.xlsx"
+    resp = _send_cached(f, XLSX_MIME, name, etag=digest)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+@bp.get("/seatalk/<msg_id>")
+def api_seatalk_status(msg_id):
+    """Delivery state of a queued SeaTalk message: pending / sent / failed (404 unknown)"""
+    st = seatalk.outbox.status(msg_id)
+    if st["state"] == "unknown":
+        return jsonify({"ok": False, "id": msg_id, **st, "error": "Unknown message id"}), 404
+    return jsonify({"ok": True, "id": msg_id, **st})
+
+
+def _send_cached(f, mimetype: str, download_name: str, etag: str = None) -> Response:
+    """send_file for a handle from DiskLRUCache.open() (Content-Length, Range, If-None-Match).
+
+    Serving the open handle instead of the path means a concurrent evict()
+    cannot delete the file between the lookup and the read.
     """
+    st = os.fstat(f.fileno())
+    resp = send_file(f, mimetype=mimetype, as_attachment=True, download_name=download_name,
+                     etag=etag or False, last_modified=st.st_mtime, max_age=0)
+    resp.content_length = st.st_size
+    try:
+        return resp.make_conditional(request, accept_ranges=True, complete_length=st.st_size)
+    except Exception:
+        f.close()
+        raise
+
+
+def _day_range(date_param: str):
+    """(from_time, to_time) of a YYYY-MM-DD day in GMT+7; today if empty. Raises ValueError."""
+    if not date_param:
+        return get_daily_timestamps()
+    target_date = datetime.strptime(date_param, "%Y-%m-%d")
+    gmt7 = timezone(timedelta(hours=7))
+    start_of_day = target_date.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=gmt7)
+    end_of_day = target_date.replace(hour=23, minute=59, second=59, microsecond=999999, tzinfo=gmt7)
+    return int(start_of_day.timestamp()), int(end_of_day.timestamp())
+
+
+def _lh_error(e: Exception):
+    """Map an LH engine exception to (json body, status)"""
+    if isinstance(e, lh_trips.UpstreamError):
+        _cookies.check("SPX", {"retcode": e.retcode})
+        return {"ok": False, "error": str(e), "retcode": e.retcode}, 400
+    if isinstance(e, requests.exceptions.Timeout):
+        return {"ok": False, "error": "API request timeout"}, 504
+    if isinstance(e, requests.exceptions.RequestException):
+        return {"ok": False, "error": f"API request failed: {str(e)}"}, 500
+    return {"ok": False, "error": f"Unexpected error: {str(e)}"}, 500
+
+
+def _lh_date():
+    """Normalized ?date= (YYYY-MM-DD, today in GMT+7 if empty); returns (date_str, None) or (None, (body, status))"""
+    date_param = request.args.get('date', '')
+    if not date_param:
+        return datetime.now(timezone(timedelta(hours=7))).strftime("%Y-%m-%d"), None
+    try:
+        return datetime.strptime(date_param, "%Y-%m-%d").strftime("%Y-%m-%d"), None
+    except ValueError:
+        return None, ({"ok": False, "error": "Invalid date format. Use YYYY-MM-DD"}, 400)
+
+
+def _lh_list_trips(kinds, date_str: str):
+    """Run the trip-listing engine for one day; returns (context, None) or (None, (body, status))"""
     WH = "SPX"
 
-    # Get date parameter (default to today)
-    date_param = request.args.get('date', '')
+    try:
+        from_time, to_time = _day_range(date_str)
+    except ValueError:
+        return None, ({"ok": False, "error": "Invalid date format. Use YYYY-MM-DD"}, 400)
+    except Exception as e:
+        return None, ({"ok": False, "error": f"Failed to get timestamps: {str(e)}"}, 500)
 
-    # Get cookie from Firebase RTDB
     try:
-        cookie = firebase_read_cookie_rtdb(WH, firebase_url) if UTILITY_AVAILABLE else ""
+        cookie = _cookies.get(WH)
     except Exception as e:
-        return jsonify({
-            "ok": False,
-            "error": f"Failed to get cookie: {str(e)}"
-        }), 500
+        return None, ({"ok": False, "error": f"Failed to get cookie: {str(e)}"}, 500)
 
     headers = build_api_headers(cookie)
+    results = lh_sync.list_trips(headers, from_time, to_time, kinds)
+    return {"from_time": from_time, "to_time": to_time, "results": results}, None
 
-    # Get daily timestamps
-    try:
-        if date_param:
-            # Parse date string (YYYY-MM-DD) and convert to timestamps
-            target_date = datetime.strptime(date_param, "%Y-%m-%d")
-            gmt7 = timezone(timedelta(hours=7))
-            start_of_day = target_date.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=gmt7)
-            end_of_day = target_date.replace(hour=23, minute=59, second=59, microsecond=999999, tzinfo=gmt7)
-            from_time = int(start_of_day.timestamp())
-            to_time = int(end_of_day.timestamp())
-        else:
-            from_time, to_time = get_daily_timestamps()
-    except ValueError:
-        return jsonify({
-            "ok": False,
-            "error": "Invalid date format. Use YYYY-MM-DD"
-        }), 400
-    except Exception as e:
-        return jsonify({
-            "ok": False,
-            "error": f"Failed to get timestamps: {str(e)}"
-        }), 500
 
-    # Build API URL
-    url = f"https://spx.shopee.vn/api/admin/transportation/trip/history/list?loading_time={from_time},{to_time}&pageno=1&count=100&mtime={from_time},{to_time}&query_type=2&middle_station=3983"
+def _lh_section(res):
+    if isinstance(res, Exception):
+        return _lh_error(res)
+    return {"ok": True, "total_trips": len(res), "trips": res}, 200
 
-    # Call API
-    try:
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-
-        if data.get("retcode") == 0 and data.get("data"):
-            trips = []
-            for trip in data["data"]["list"]:
-                # Ưu tiên lấy station 2259 trước
-                station = next((s for s in trip.get("trip_station", []) if s.get("station") == 2259), {})
-
-                trips.append({
-                    "id": trip["id"],
-                    "trip_number": trip["trip_number"],
-                    "driver_name": trip.get("driver_name", ""),
-                    "seal_time": convert_timestamp_to_day_time_gmt7(station.get("seal_time")) if station.get("seal_time") else "",
-                    "loading_time": convert_timestamp_to_day_time_gmt7(station.get("loading_time")) if station.get("loading_time") else "",
-                    "sequence_number": station.get("sequence_number", 1),
-                    "load_quantity": station.get("load_quantity", 0),
-                    "to_parcel_quantity": 0,  # Will be fetched by frontend using Promise.all
-                    "vehicle_number": trip.get("vehicle_number", ""),
-                    "vehicle_type_name": trip.get("vehicle_type_name", ""),
-                })
-
-            return jsonify({
-                "ok": True,
-                "total_trips": len(trips),
-                "trips": trips,
-                "from_time": from_time,
-                "to_time": to_time
-            })
-        else:
-            return jsonify({
-                "ok": False,
-                "error": data.get("message", "Unknown error from API"),
-                "retcode": data.get("retcode")
-            }), 400
 
-    except requests.exceptions.Timeout:
-        return jsonify({
-            "ok": False,
-            "error": "API request timeout"
-        }), 504
-    except requests.exceptions.RequestException as e:
-        return jsonify({
-            "ok": False,
-            "error": f"API request failed: {str(e)}"
-        }), 500
-    except Exception as e:
-        return jsonify({
-            "ok": False,
-            "error": f"Unexpected error: {str(e)}"
-        }), 500
+def _cached_json(key, date_str: str, build, cacheable=None):
+    """
+    Serve build() -> (body, status) through _report_cache.
 
+    Only 200 answers (that also pass cacheable(body), if given) are cached: LH_REPORT_TTL for today, LH_REPORT_PAST_TTL for
+    past days (history trips no longer change). Each cached body carries a strong
+    ETag, so a browser revalidating with If-None-Match gets a 304.
+    """
+    app = current_app._get_current_object()
+    today = datetime.now(timezone(timedelta(hours=7))).strftime("%Y-%m-%d")
+    ttl = LH_REPORT_PAST_TTL if date_str < today else LH_REPORT_TTL
+
+    def _load():
+        # Có thể chạy ở thread nền (revalidate) -> tự mở app context
+        with app.app_context():
+            body, status = build()
+            data = (app.json.dumps(body) + "\n").encode("utf-8")
+        etag = hashlib.sha1(data).hexdigest()
+        keep = status == 200 and (cacheable is None or cacheable(body))
+        return (data, status, etag), (ttl if keep else 0)
+
+    (data, status, etag), state = _report_cache.get_or_load(key, _load)
+
+    if status == 200 and request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(data, status=status, mimetype="application/json")
+    if status == 200:
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "private, no-cache"
+    resp.headers["X-Cache"] = state.upper()
+    return resp
+
+
+def _lh_trips_body(kind: str, kinds, date_str: str):
+    ctx, err = _lh_list_trips(kinds, date_str)
+    if err:
+        return err
+
+    payload = {"ok": True, "kind": kind, "from_time": ctx["from_time"], "to_time": ctx["to_time"]}
+    for k in kinds:
+        payload[k] = _lh_section(ctx["results"][k])[0]
+    payload["ok"] = any(payload[k]["ok"] for k in kinds)
+    return payload, 200
+
+
+@bp.get("/LH_trips")
+def api_lh_trips():
+    """
+    All LH trips of a day, every upstream page, one normalized shape.
 
-@bp.get("/LH_report_handover")
-def api_lh_report_handover():
+    Query params:
+        date: Optional date in YYYY-MM-DD format (default: today)
+        kind: outbound | handover | both (default: both)
 
-    WH = "SPX"
+    Returns:
+        JSON {ok, kind, from_time, to_time, <kind>: {ok, total_trips, trips}}
+        for each requested kind; a failing kind carries its own error.
+        Served from a short-TTL cache with ETag/304 (see _cached_json).
+    """
+    kind = request.args.get('kind', 'both').lower()
+    if kind == "both":
+        kinds = lh_trips.TRIP_KINDS
+    elif kind in lh_trips.TRIP_KINDS:
+        kinds = (kind,)
+    else:
+        return jsonify({"ok": False, "error": "Invalid kind. Use outbound, handover or both"}), 400
 
-    # Get date parameter (default to today)
-    date_param = request.args.get('date', '')
+    date_str, err = _lh_date()
+    if err:
+        return jsonify(err[0]), err[1]
 
-    # Get cookie from Firebase RTDB
-    try:
-        cookie = firebase_read_cookie_rtdb(WH, firebase_url) if UTILITY_AVAILABLE else ""
-    except Exception as e:
-        return jsonify({
-            "ok": False,
-            "error": f"Failed to get cookie: {str(e)}"
-        }), 500
+    # Một kind lỗi -> vẫn trả 200 nhưng không cache
+    return _cached_json(("trips", kind, date_str), date_str, lambda: _lh_trips_body(kind, kinds, date_str),
+                        cacheable=lambda body: all(body[k]["ok"] for k in kinds))
 
-    headers = build_api_headers(cookie)
 
-    # Get daily timestamps
+@bp.get("/LH_trips_sync")
+def api_lh_trips_sync():
+    """
+    Incremental trip list: what changed since a version cursor.
+
+    Query params:
+        date:  Optional date in YYYY-MM-DD format (default: today)
+        kind:  outbound | handover | both (default: both)
+        since: Cursor from a previous answer's "version" (omit for a full list)
+
+    Returns:
+        JSON {ok, kind, version, from_time, to_time, <kind>: {ok, full, trips, removed}}.
+        full=True means trips is the whole day (unknown / expired cursor);
+        otherwise trips are upserts and removed are trip ids to drop.
+    """
+    kind = request.args.get('kind', 'both').lower()
+    if kind == "both":
+        kinds = lh_trips.TRIP_KINDS
+    elif kind in lh_trips.TRIP_KINDS:
+        kinds = (kind,)
+    else:
+        return jsonify({"ok": False, "error": "Invalid kind. Use outbound, handover or both"}), 400
+
+    date_str, err = _lh_date()
+    if err:
+        return jsonify(err[0]), err[1]
+
     try:
-        if date_param:
-            # Parse date string (YYYY-MM-DD) and convert to timestamps
-            target_date = datetime.strptime(date_param, "%Y-%m-%d")
-            gmt7 = timezone(timedelta(hours=7))
-            start_of_day = target_date.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=gmt7)
-            end_of_day = target_date.replace(hour=23, minute=59, second=59, microsecond=999999, tzinfo=gmt7)
-            from_time = int(start_of_day.timestamp())
-            to_time = int(end_of_day.timestamp())
-        else:
-            from_time, to_time = get_daily_timestamps()
-    except ValueError:
-        return jsonify({
-            "ok": False,
-            "error": "Invalid date format. Use YYYY-MM-DD"
-        }), 400
+        from_time, to_time = _day_range(date_str)
+        cookie = _cookies.get("SPX")
     except Exception as e:
-        return jsonify({
-            "ok": False,
-            "error": f"Failed to get timestamps: {str(e)}"
-        }), 500
+        return jsonify({"ok": False, "error": f"Failed to get cookie: {str(e)}"}), 500
 
+    since = request.args.get('since', '')
+    results = lh_sync.sync_trips(build_api_headers(cookie), from_time, to_time, kinds, since=since)
+
+    payload = {"ok": False, "kind": kind, "from_time": from_time, "to_time": to_time}
+    versions = []
+    for k in kinds:
+        res = results[k]
+        if isinstance(res, Exception):
+            payload[k] = _lh_error(res)[0]
+            continue
+        versions.append(res["version"])
+        payload[k] = {"ok": True, "full": res["full"], "total_trips": len(res["trips"]),
+                      "trips": res["trips"], "removed": res["removed"]}
+    payload["ok"] = bool(versions)
+    if len(versions) < len(kinds):
+        # Kind lỗi -> giữ cursor cũ (hoặc rỗng = lần sau lấy full) để không mất thay đổi của kind đó
+        payload["version"] = since if lh_sync.parse_cursor(since, kinds, from_time, to_time) is not None else ""
+    else:
+        # min: thay đổi của kind đã đọc trước có thể mang version nhỏ hơn version của kind đọc sau
+        payload["version"] = lh_sync.make_cursor(min(versions, default=0), kinds, from_time, to_time)
+    return jsonify(payload)
+
+
+def _lh_report_body(kind: str, date_str: str):
+    ctx, err = _lh_list_trips((kind,), date_str)
+    if err:
+        return err
+
+    body, status = _lh_section(ctx["results"][kind])
+    if status == 200:
+        body.update(from_time=ctx["from_time"], to_time=ctx["to_time"])
+    return body, status
+
+
+def _lh_report_view(kind: str):
+    """Legacy single-kind trip list response (cached, ETag/304)"""
+    date_str, err = _lh_date()
+    if err:
+        return jsonify(err[0]), err[1]
+
+    return _cached_json(("report", kind, date_str), date_str, lambda: _lh_report_body(kind, date_str))
 
-    url = f"https://spx.shopee.vn/api/admin/transportation/trip/list?loading_time={from_time},{to_time}&pageno=1&count=100&mtime={from_time},{to_time}&query_type=2&middle_station=3983"
 
-    # Call API
-    try:
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-
-        if data.get("retcode") == 0 and data.get("data"):
-            trips = []
-            for trip in data["data"]["list"]:
-                # Ưu tiên lấy station 2259 trước
-                station = next((s for s in trip.get("trip_station", []) if s.get("station") == 2259), {})
-
-                # Nếu không có station 2259, lấy station đầu tiên
-                if not station and trip.get("trip_station"):
-                    station = trip["trip_station"][0] if isinstance(trip["trip_station"], list) else {}
-
-                trips.append({
-                    "id": trip["id"],
-                    "trip_number": trip["trip_number"],
-                    "driver_name": trip.get("driver_name", ""),
-                    "seal_time": convert_timestamp_to_day_time_gmt7(station.get("seal_time")) if station.get("seal_time") else "",
-                    "loading_time": convert_timestamp_to_day_time_gmt7(station.get("loading_time")) if station.get("loading_time") else "",
-                    "sequence_number": station.get("sequence_number", 1),
-                    "load_quantity": station.get("load_quantity", 0),
-                    "to_parcel_quantity": 0,  # Will be fetched by frontend using Promise.all
-                    "vehicle_number": trip.get("vehicle_number", ""),
-                    "vehicle_type_name": trip.get("vehicle_type_name", ""),
-                })
-
-            return jsonify({
-                "ok": True,
-                "total_trips": len(trips),
-                "trips": trips,
-                "from_time": from_time,
-                "to_time": to_time
-            })
-        else:
-            return jsonify({
-                "ok": False,
-                "error": data.get("message", "Unknown error from API"),
-                "retcode": data.get("retcode")
-            }), 400
+@bp.get("/LH_report")
+def api_lh_report():
+    """
+    Get all LH (Last Hub) outbound trips from SPX API (trip history list)
 
-    except requests.exceptions.Timeout:
-        return jsonify({
-            "ok": False,
-            "error": "API request timeout"
-        }), 504
-    except requests.exceptions.RequestException as e:
-        return jsonify({
-            "ok": False,
-            "error": f"API request failed: {str(e)}"
-        }), 500
-    except Exception as e:
-        return jsonify({
-            "ok": False,
-            "error": f"Unexpected error: {str(e)}"
-        }), 500
+    Query params:
+        date: Optional date in YYYY-MM-DD format (default: today)
+
+    Returns:
+        JSON with list of trips including:
+        - id, trip_number, driver_name
+        - seal_time, loading_time, sequence_number
+        - load_quantity, vehicle_number, vehicle_type_name
+    """
+    return _lh_report_view("outbound")
+
+
+@bp.get("/LH_report_handover")
+def api_lh_report_handover():
+    """Same as LH_report for trips currently in handover (trip list)"""
+    return _lh_report_view("handover")
 
 
 @bp.get("/LH_get_parcel_count/<trip_id>")
@@ -343,7 +455,7 @@ def api_lh_get_parcel_count(trip_id):
 
     # Get cookie from Firebase RTDB
     try:
-        cookie = firebase_read_cookie_rtdb(WH, firebase_url) if UTILITY_AVAILABLE else ""
+        cookie = _cookies.get(WH)
     except Exception as e:
         return jsonify({
             "ok": False,
@@ -352,29 +464,9 @@ def api_lh_get_parcel_count(trip_id):
 
     headers = build_api_headers(cookie)
 
-    # Choose API based on kind: handover uses current loading, outbound uses history
-    base_url = "https://spx.shopee.vn/api/admin/transportation/trip/loading/list" if kind == "handover" else "https://spx.shopee.vn/api/admin/transportation/trip/history/loading/list"
-
     try:
-        params = {
-            "trip_id": trip_id,
-            "pageno": 1,
-            "count": 50,  # Only need first page to get total_parcel
-            "loaded_sequence_number": sequence_number,
-            "type": "outbound"
-        }
-
-        response = requests.get(base_url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-
-        if data.get("retcode") != 0:
-            return jsonify({
-                "ok": False,
-                "error": data.get("message", "Unknown error from API")
-            }), 400
-
-        total_parcel = data["data"].get("total_parcel", 0)
+        # Only need first page to get total_parcel (cached briefly, shared with the batch endpoint)
+        total_parcel = lh_trips.fetch_parcel_count(headers, trip_id, sequence_number, kind)
 
         return jsonify({
             "ok": True,
@@ -382,6 +474,12 @@ def api_lh_get_parcel_count(trip_id):
             "total_parcel": total_parcel
         })
 
+    except lh_trips.UpstreamError as e:
+        _cookies.check(WH, {"retcode": e.retcode})
+        return jsonify({
+            "ok": False,
+            "error": str(e)
+        }), 400
     except requests.exceptions.Timeout:
         return jsonify({
             "ok": False,
@@ -399,6 +497,126 @@ def api_lh_get_parcel_count(trip_id):
         }), 500
 
 
+@bp.post("/LH_get_parcel_counts")
+def api_lh_get_parcel_counts():
+    """
+    Batch version of LH_get_parcel_count.
+
+    Body: {"items": [{"trip_id": 123, "seq": 1, "kind": "outbound"}, ...]}
+          (items may also be [trip_id, seq, kind] lists)
+
+    Returns counts in the same order as items; a failed trip has ok=False
+    and does not fail the whole batch.
+    """
+    WH = "SPX"
+
+    req = request.get_json(silent=True) or {}
+    raw_items = req.get("items") if isinstance(req, dict) else req
+    if not isinstance(raw_items, list):
+        return jsonify({"ok": False, "error": "items must be a list"}), 400
+    if len(raw_items) > 1000:
+        return jsonify({"ok": False, "error": "Too many items (max 1000)"}), 400
+
+    items = []
+    for it in raw_items:
+        if isinstance(it, dict):
+            trip_id, seq, kind = it.get("trip_id"), it.get("seq", 1), it.get("kind", "outbound")
+        elif isinstance(it, (list, tuple)) and it:
+            trip_id, seq, kind = (list(it) + [1, "outbound"])[:3]
+        else:
+            return jsonify({"ok": False, "error": f"Invalid item: {it}"}), 400
+        kind = str(kind or "outbound").lower()
+        if trip_id in (None, "") or kind not in ("outbound", "handover"):
+            return jsonify({"ok": False, "error": f"Invalid item: {it}"}), 400
+        try:
+            seq = int(seq or 1)
+        except (TypeError, ValueError):
+            return jsonify({"ok": False, "error": f"Invalid seq: {it}"}), 400
+        items.append((trip_id, seq, kind))
+
+    try:
+        cookie = _cookies.get(WH)
+    except Exception as e:
+        return jsonify({"ok": False, "error": f"Failed to get cookie: {str(e)}"}), 500
+
+    headers = build_api_headers(cookie)
+    results = lh_trips.fetch_parcel_counts(headers, items)
+
+    return jsonify({
+        "ok": True,
+        "total": len(results),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "results": results
+    })
+
+
+def _attachment(resp: Response, filename: str) -> Response:
+    resp.headers.set("Content-Disposition", "attachment", filename=filename)
+    return resp
+
+
+def _csv_filename(trip_number, first: dict, to_qty: int = None, parcel_qty: int = None) -> str:
+    filename_to = to_qty if to_qty is not None else first.get("total", 0)
+    filename_parcel = parcel_qty if parcel_qty is not None else first.get("total_parcel", 0)
+    # Short name to align with Excel tab: <trip>_<TO>_<PARCEL>.csv
+    return f"{trip_number}_{filename_to}_{filename_parcel}.csv"
+
+
+def _collect_trip_rows(base_url, headers, trip_id, seq, first: dict, pages: int) -> list:
+    """Every CSV row of one trip, TOs expanded, sorted by ctime -> pack_type_name"""
+    # Collect all items: page 1, then pages 2..N fetched concurrently (kept in page order)
+    items = list(first.get("list") or [])
+    for page_data in lh_trips.iter_remaining_pages(base_url, headers, trip_id, seq, pages):
+        items.extend(page_data.get("list") or [])
+
+    # Expand multi-parcel TOs (concurrent, cached per to_number)
+    all_data = lh_trips.expand_items(items, headers)
+
+    # Sort data by: ctime -> pack_type_name
+    all_data.sort(key=lambda x: (x["ctime"], x["pack_type_name"]))
+    return all_data
+
+
+def _run_sheet_pdf(headers, trip_id, station_id: int):
+    """
+    Locate a trip's run-sheet PDF.
+
+    Returns None if the trip has no sheet, else (filename, cached, chunks, expected):
+    cached is an open handle of the disk-cache file on a hit (caller closes it);
+    otherwise chunks streams the upstream PDF through the cache and must be
+    iterated to the end (or closed).
+    """
+    sheet = lh_trips.find_run_sheet(headers, trip_id, station_id)
+    if not sheet:
+        return None
+
+    download_url = lh_trips.sheet_download_url(sheet.get("sheet_url", ""))
+
+    # Extract filename from URL or use default
+    filename = download_url.split('/')[-1] if '/' in download_url else f"trip_{trip_id}.pdf"
+    if not filename.endswith('.pdf'):
+        filename = f"{filename}.pdf"
+
+    cache_key = f"{trip_id}|{station_id}|{sheet.get('sheet_url')}"
+    cached = _pdf_cache.open(cache_key, suffix=".pdf")
+    if cached:
+        return filename, cached, None, None
+
+    pdf_resp = http_client.get(download_url, headers=headers, timeout=30, stream=True)
+    pdf_resp.raise_for_status()
+
+    length = pdf_resp.headers.get("Content-Length")
+    expected = int(length) if length and length.isdigit() and not pdf_resp.headers.get("Content-Encoding") else None
+
+    def _chunks():
+        try:
+            yield from _pdf_cache.tee(cache_key, pdf_resp.iter_content(64 * 1024), suffix=".pdf", expected_size=expected)
+        finally:
+            pdf_resp.close()
+
+    return filename, None, _chunks(), expected
+
+
 @bp.get("/LH_get_list/<trip_id>/<trip_number>")
 def api_lh_get_list(trip_id, trip_number):
     WH = "SPX"
@@ -411,7 +629,7 @@ def api_lh_get_list(trip_id, trip_number):
 
     # Get cookie from Firebase RTDB
     try:
-        cookie = firebase_read_cookie_rtdb(WH, firebase_url) if UTILITY_AVAILABLE else ""
+        cookie = _cookies.get(WH)
     except Exception as e:
         return jsonify({
             "ok": False,
@@ -420,221 +638,45 @@ def api_lh_get_list(trip_id, trip_number):
 
     headers = build_api_headers(cookie)
 
-    # Select API: handover uses current loading list; outbound uses history loading list
-    base_url = "https://spx.shopee.vn/api/admin/transportation/trip/loading/list" if kind == "handover" else "https://spx.shopee.vn/api/admin/transportation/trip/history/loading/list"
+    base_url = lh_trips.loading_list_url(kind)
 
     try:
         # First request to get total count
-        params = {
-            "trip_id": trip_id,
-            "pageno": 1,
-            "count": 50,
-            "loaded_sequence_number": sequence_number,
-            "type": "outbound"
-        }
+        first = lh_trips.fetch_loading_page(base_url, headers, trip_id, sequence_number, 1)
+
+        total_pages = lh_trips.total_pages(first)
 
-        response = requests.get(base_url, params=params, headers=headers, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-
-        if data.get("retcode") != 0:
-            return jsonify({
-                "ok": False,
-                "error": data.get("message", "Unknown error from API")
-            }), 400
-
-        # Get pagination info
-        total = data["data"]["total"]
-        count = data["data"]["count"]
-        total_parcel = data["data"].get("total_parcel", 0)
-        total_pages = math.ceil(total / count)
-
-        # Collect all data
-        all_data = []
-
-        # Add data from first page
-        for item in data["data"]["list"]:
-            to_number = item.get("to_number", "")
-            pack_type_name = item.get("pack_type_name", "")
-            to_parcel_quantity = item.get("to_parcel_quantity", 0)
-            scan_number = item.get("scan_number", "")
-            operator = item.get("operator", "")
-            to_weight = round(item.get("to_weight", 0) / 1000, 3)
-            ctime = item.get("ctime", 0)
-
-            # Nếu to_parcel_quantity > 1, gọi API để lấy fleet_order_id và ghi từng dòng
-            if to_parcel_quantity > 1:
+        # Prefer FE-supplied counts (what user sees) for filename; fall back to API totals
+        filename = _csv_filename(trip_number, first, request.args.get('to_qty', type=int),
+                                 request.args.get('parcel_qty', type=int))
+
+        if request.args.get('stream', type=int):
+            # Streaming mode: rows go out page by page as each page (and its TO details) arrives.
+            # Rows are sorted within a page only; memory stays at about one page.
+            def _generate():
+                yield lh_trips.csv_header(bom=True)
                 try:
-                    detail_url = "https://spx.shopee.vn/api/in-station/general_to/detail/search"
-                    detail_params = {
-                        "to_number": to_number,
-                        "pageno": 1,
-                        "count": 300
-                    }
-                    detail_resp = requests.get(detail_url, params=detail_params, headers=headers, timeout=30)
-                    detail_resp.raise_for_status()
-                    detail_json = detail_resp.json()
-                    if detail_json.get("retcode") == 0:
-                        lst = detail_json.get("data", {}).get("list", [])
-                        fleet_ids = [row.get("fleet_order_id", "") for row in lst if row.get("fleet_order_id")]
-                        # Ghi mỗi fleet_order_id thành 1 dòng riêng
-                        if fleet_ids:
-                            for fleet_id in fleet_ids:
-                                all_data.append({
-                                    "to_number": to_number,
-                                    "pack_type_name": pack_type_name,
-                                    "scan_number": fleet_id,
-                                    "operator": operator,
-                                    "to_weight": to_weight,
-                                    "ctime": ctime
-                                })
-                        else:
-                            # Không có fleet_id, ghi dòng gốc
-                            all_data.append({
-                                "to_number": to_number,
-                                "pack_type_name": pack_type_name,
-                                "scan_number": scan_number,
-                                "operator": operator,
-                                "to_weight": to_weight,
-                                "ctime": ctime
-                            })
-                except Exception:
-                    # Giữ nguyên dòng gốc nếu có lỗi
-                    all_data.append({
-                        "to_number": to_number,
-                        "pack_type_name": pack_type_name,
-                        "scan_number": scan_number,
-                        "operator": operator,
-                        "to_weight": to_weight,
-                        "ctime": ctime
-                    })
-            else:
-                # to_parcel_quantity <= 1, pack_type_name = "Single"
-                all_data.append({
-                    "to_number": to_number,
-                    "pack_type_name": "Single",
-                    "scan_number": scan_number,
-                    "operator": operator,
-                    "to_weight": to_weight,
-                    "ctime": ctime
-                })
-
-        # Fetch remaining pages
-        for page in range(2, total_pages + 1):
-            params["pageno"] = page
-            response = requests.get(base_url, params=params, headers=headers, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-
-            if data.get("retcode") != 0:
-                continue
-
-            for item in data["data"]["list"]:
-                to_number = item.get("to_number", "")
-                pack_type_name = item.get("pack_type_name", "")
-                to_parcel_quantity = item.get("to_parcel_quantity", 0)
-                scan_number = item.get("scan_number", "")
-                operator = item.get("operator", "")
-                to_weight = round(item.get("to_weight", 0) / 1000, 2)
-                ctime = item.get("ctime", 0)
-
-                # Nếu to_parcel_quantity > 1, gọi API để lấy fleet_order_id và ghi từng dòng
-                if to_parcel_quantity > 1:
-                    try:
-                        detail_url = "https://spx.shopee.vn/api/in-station/general_to/detail/search"
-                        detail_params = {
-                            "to_number": to_number,
-                            "pageno": 1,
-                            "count": 300
-                        }
-                        detail_resp = requests.get(detail_url, params=detail_params, headers=headers, timeout=30)
-                        detail_resp.raise_for_status()
-                        detail_json = detail_resp.json()
-                        if detail_json.get("retcode") == 0:
-                            lst = detail_json.get("data", {}).get("list", [])
-                            fleet_ids = [row.get("fleet_order_id", "") for row in lst if row.get("fleet_order_id")]
-                            # Ghi mỗi fleet_order_id thành 1 dòng riêng
-                            if fleet_ids:
-                                for fleet_id in fleet_ids:
-                                    all_data.append({
-                                        "to_number": to_number,
-                                        "pack_type_name": pack_type_name,
-                                        "scan_number": fleet_id,
-                                        "operator": operator,
-                                        "to_weight": to_weight,
-                                        "ctime": ctime
-                                    })
-                            else:
-                                # Không có fleet_id, ghi dòng gốc
-                                all_data.append({
-                                    "to_number": to_number,
-                                    "pack_type_name": pack_type_name,
-                                    "scan_number": scan_number,
-                                    "operator": operator,
-                                    "to_weight": to_weight,
-                                    "ctime": ctime
-                                })
-                    except Exception:
-                        # Giữ nguyên dòng gốc nếu có lỗi
-                        all_data.append({
-                            "to_number": to_number,
-                            "pack_type_name": pack_type_name,
-                            "scan_number": scan_number,
-                            "operator": operator,
-                            "to_weight": to_weight,
-                            "ctime": ctime
-                        })
-                else:
-                    # to_parcel_quantity <= 1, pack_type_name = "Single"
-                    all_data.append({
-                        "to_number": to_number,
-                        "pack_type_name": "Single",
-                        "scan_number": scan_number,
-                        "operator": operator,
-                        "to_weight": to_weight,
-                        "ctime": ctime
-                    })
-
-        # Sort data by: ctime -> pack_type_name
-        all_data.sort(key=lambda x: (x["ctime"], x["pack_type_name"]))
-
-        # Convert ctime to GMT+7
-        gmt7 = timezone(timedelta(hours=7))
-        for item in all_data:
-            if item["ctime"] > 0:
-                dt = datetime.fromtimestamp(item["ctime"], tz=timezone.utc)
-                dt_gmt7 = dt.astimezone(gmt7)
-                item["ctime"] = dt_gmt7.strftime("%Y-%m-%d %H:%M:%S")
-            else:
-                item["ctime"] = ""
+                    for rows in lh_trips.iter_trip_rows(base_url, headers, trip_id, sequence_number, first, total_pages):
+                        rows.sort(key=lambda x: (x["ctime"], x["pack_type_name"]))
+                        yield lh_trips.csv_rows(rows)
+                except Exception as e:
+                    # Headers already sent: abort the transfer so the client sees a failed download
+                    print(f"[LH_get_list] stream aborted for trip {trip_id}: {type(e).__name__}: {e}")
+                    raise
 
-        # Create CSV in memory
-        output = io.StringIO()
-        fieldnames = ['to_number', 'pack_type_name', 'scan_number', 'operator', 'to_weight', 'ctime']
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(all_data)
+            return _attachment(Response(_generate(), mimetype='text/csv'), filename)
 
-        # Convert to bytes for download
-        csv_bytes = io.BytesIO()
-        csv_bytes.write(output.getvalue().encode('utf-8-sig'))
-        csv_bytes.seek(0)
+        all_data = _collect_trip_rows(base_url, headers, trip_id, sequence_number, first, total_pages)
 
-        # Prefer FE-supplied counts (what user sees) for filename; fall back to API totals
-        fe_to_qty = request.args.get('to_qty', type=int)
-        fe_parcel_qty = request.args.get('parcel_qty', type=int)
-        filename_to = fe_to_qty if fe_to_qty is not None else total
-        filename_parcel = fe_parcel_qty if fe_parcel_qty is not None else total_parcel
-        # Short name to align with Excel tab: <trip>_<TO>_<PARCEL>.csv
-        filename = f"{trip_number}_{filename_to}_{filename_parcel}.csv"
-
-        return send_file(
-            csv_bytes,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
-        )
+        csv_bytes = lh_trips.csv_header(bom=True) + lh_trips.csv_rows(all_data)
+        return _attachment(Response(csv_bytes, mimetype='text/csv'), filename)
 
+    except lh_trips.UpstreamError as e:
+        _cookies.check(WH, {"retcode": e.retcode})
+        return jsonify({
+            "ok": False,
+            "error": str(e)
+        }), 400
     except requests.exceptions.Timeout:
         return jsonify({
             "ok": False,
@@ -661,44 +703,31 @@ def api_lh_run_sheet(trip_id):
 
     # Get cookie from Firebase RTDB
     try:
-        cookie = firebase_read_cookie_rtdb(WH, firebase_url) if UTILITY_AVAILABLE else ""
+        cookie = _cookies.get(WH)
     except Exception as e:
         return jsonify({"ok": False, "error": f"Failed to get cookie: {str(e)}"}), 500
 
     headers = build_api_headers(cookie)
 
-    url = "https://spx.shopee.vn/api/admin/transportation/run_sheet/list"
-
     try:
-        resp = requests.get(url, params={"trip_id": trip_id}, headers=headers, timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
-
-        if data.get("retcode") != 0:
-            return jsonify({"ok": False, "error": data.get("message", "API error"), "retcode": data.get("retcode")}), 400
-
-        sheets = data.get("data", {}).get("list", []) or []
-
-        # Prefer matching station_id with sheet_url present
-        sheet = next((s for s in sheets if s.get("station_id") == station_id and s.get("sheet_url")), None)
+        sheet = lh_trips.find_run_sheet(headers, trip_id, station_id)
         if not sheet:
-            sheet = next((s for s in sheets if s.get("sheet_url")), None)
-
-        if not sheet or not sheet.get("sheet_url"):
             return jsonify({"ok": False, "error": "No sheet_url found"}), 404
 
         sheet_url = sheet.get("sheet_url", "")
-        download_url = f"https://spx.shopee.vn{sheet_url}" if sheet_url.startswith('/') else sheet_url
 
         return jsonify({
             "ok": True,
-            "download_url": download_url,
+            "download_url": lh_trips.sheet_download_url(sheet_url),
             "sheet_url": sheet_url,
             "station_id": sheet.get("station_id"),
             "station_name": sheet.get("station_name"),
             "sequence_number": sheet.get("sequence_number")
         })
 
+    except lh_trips.UpstreamError as e:
+        _cookies.check(WH, {"retcode": e.retcode})
+        return jsonify({"ok": False, "error": str(e), "retcode": e.retcode}), 400
     except requests.exceptions.Timeout:
         return jsonify({"ok": False, "error": "API request timeout"}), 504
     except requests.exceptions.RequestException as e:
@@ -709,66 +738,221 @@ def api_lh_run_sheet(trip_id):
 
 @bp.get("/LH_download_pdf/<trip_id>")
 def api_lh_download_pdf(trip_id):
-    """Proxy PDF download to avoid CORS issues. Fetches sheet URL then streams PDF."""
+    """
+    Proxy PDF download to avoid CORS issues.
+
+    Served from the on-disk cache when this trip/station/sheet_url was
+    downloaded before; otherwise upstream chunks are streamed straight to
+    the client and written to the cache at the same time.
+    """
     WH = "SPX"
 
     station_id = request.args.get('station_id', 2259, type=int)
 
     # Get cookie from Firebase RTDB
     try:
-        cookie = firebase_read_cookie_rtdb(WH, firebase_url) if UTILITY_AVAILABLE else ""
+        cookie = _cookies.get(WH)
     except Exception as e:
         return jsonify({"ok": False, "error": f"Failed to get cookie: {str(e)}"}), 500
 
     headers = build_api_headers(cookie)
 
-    url = "https://spx.shopee.vn/api/admin/transportation/run_sheet/list"
-
     try:
-        # First, get the sheet URL
-        resp = requests.get(url, params={"trip_id": trip_id}, headers=headers, timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
-
-        if data.get("retcode") != 0:
-            return jsonify({"ok": False, "error": data.get("message", "API error")}), 400
-
-        sheets = data.get("data", {}).get("list", []) or []
-
-        # Prefer matching station_id with sheet_url present
-        sheet = next((s for s in sheets if s.get("station_id") == station_id and s.get("sheet_url")), None)
-        if not sheet:
-            sheet = next((s for s in sheets if s.get("sheet_url")), None)
-
-        if not sheet or not sheet.get("sheet_url"):
+        # Sheet URL lookup is cached; the PDF itself comes from disk or streams from upstream
+        found = _run_sheet_pdf(headers, trip_id, station_id)
+        if not found:
             return jsonify({"ok": False, "error": "No sheet_url found"}), 404
 
-        sheet_url = sheet.get("sheet_url", "")
-        download_url = f"https://spx.shopee.vn{sheet_url}" if sheet_url.startswith('/') else sheet_url
-
-        # Now fetch the PDF and stream it
-        pdf_resp = requests.get(download_url, headers=headers, timeout=30, stream=True)
-        pdf_resp.raise_for_status()
-
-        # Extract filename from URL or use default
-        filename = download_url.split('/')[-1] if '/' in download_url else f"trip_{trip_id}.pdf"
-        if not filename.endswith('.pdf'):
-            filename = f"{filename}.pdf"
-
-        # Stream the PDF back to client
-        pdf_bytes = io.BytesIO(pdf_resp.content)
-        pdf_bytes.seek(0)
-
-        return send_file(
-            pdf_bytes,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=filename
-        )
+        filename, cached, chunks, expected = found
+        if cached:
+            return _send_cached(cached, 'application/pdf', filename)
+
+        resp = _attachment(Response(chunks, mimetype='application/pdf'), filename)
+        if expected is not None:
+            resp.headers["Content-Length"] = str(expected)
+        return resp
 
+    except lh_trips.UpstreamError as e:
+        _cookies.check(WH, {"retcode": e.retcode})
+        return jsonify({"ok": False, "error": str(e)}), 400
     except requests.exceptions.Timeout:
         return jsonify({"ok": False, "error": "API request timeout"}), 504
     except requests.exceptions.RequestException as e:
         return jsonify({"ok": False, "error": f"API request failed: {str(e)}"}), 500
     except Exception as e:
         return jsonify({"ok": False, "error": f"Unexpected error: {str(e)}"}), 500
+
+
+class _ZipSink:
+    """Write-only, unseekable target for zipfile; the generator drains it after every write"""
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def write(self, data):
+        self._buf += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+
+def _export_trip(headers, trip: dict, station_id: int, with_pdf: bool):
+    """
+    Build one trip's CSV (and run-sheet PDF) for the bulk ZIP.
+
+    Returns (entries, errors): entries are (arcname, fileobj, compress_type)
+    with fileobj positioned at 0; errors are human-readable lines.
+    """
+    trip_id, trip_number = trip["trip_id"], trip["trip_number"]
+    entries, errors = [], []
+
+    try:
+        base_url = lh_trips.loading_list_url(trip["kind"])
+        first = lh_trips.fetch_loading_page(base_url, headers, trip_id, trip["seq"], 1)
+        rows = _collect_trip_rows(base_url, headers, trip_id, trip["seq"], first, lh_trips.total_pages(first))
+
+        spool = tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024)
+        spool.write(lh_trips.csv_header(bom=True))
+        spool.write(lh_trips.csv_rows(rows))
+        spool.seek(0)
+        filename = _csv_filename(trip_number, first, trip.get("to_qty"), trip.get("parcel_qty"))
+        entries.append((filename, spool, zipfile.ZIP_DEFLATED))
+    except lh_trips.UpstreamError as e:
+        _cookies.check("SPX", {"retcode": e.retcode})
+        errors.append(f"{trip_number} CSV: {e}")
+    except Exception as e:
+        errors.append(f"{trip_number} CSV: {type(e).__name__}: {e}")
+
+    if with_pdf:
+        try:
+            found = _run_sheet_pdf(headers, trip_id, station_id)
+            if not found:
+                errors.append(f"{trip_number} PDF: No sheet_url found")
+            else:
+                filename, cached, chunks, _ = found
+                if cached:
+                    src = cached
+                else:
+                    src = tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024)
+                    for chunk in chunks:
+                        src.write(chunk)
+                    src.seek(0)
+                # PDF đã nén sẵn -> lưu thẳng (STORED)
+                entries.append((filename, src, zipfile.ZIP_STORED))
+        except lh_trips.UpstreamError as e:
+            _cookies.check("SPX", {"retcode": e.retcode})
+            errors.append(f"{trip_number} PDF: {e}")
+        except Exception as e:
+            errors.append(f"{trip_number} PDF: {type(e).__name__}: {e}")
+
+    return entries, errors
+
+
+@bp.post("/LH_bulk_export")
+def api_lh_bulk_export():
+    """
+    Export many trips (CSV + run-sheet PDF each) as one streamed ZIP.
+
+    Body: {"trips": [{"trip_id": 123, "trip_number": "LT..", "seq": 1, "kind": "outbound",
+                      "to_qty": 10, "parcel_qty": 12}, ...],
+           "station_id": 2259, "pdf": true, "name": "LH_export"}
+
+    Trips are prepared concurrently (LH_EXPORT_WORKERS) and each one is written
+    to the archive as soon as it is ready, so the download starts with the first
+    finished trip. A failed trip does not abort the export; it is listed in
+    _errors.txt at the end of the archive.
+    """
+    WH = "SPX"
+
+    req = request.get_json(silent=True) or {}
+    raw_trips = req.get("trips") if isinstance(req, dict) else req
+    if not isinstance(raw_trips, list) or not raw_trips:
+        return jsonify({"ok": False, "error": "trips must be a non-empty list"}), 400
+    if len(raw_trips) > 500:
+        return jsonify({"ok": False, "error": "Too many trips (max 500)"}), 400
+
+    trips = []
+    for t in raw_trips:
+        if not isinstance(t, dict) or t.get("trip_id") in (None, ""):
+            return jsonify({"ok": False, "error": f"Invalid trip: {t}"}), 400
+        kind = str(t.get("kind") or "outbound").lower()
+        if kind not in ("outbound", "handover"):
+            return jsonify({"ok": False, "error": f"Invalid kind: {t}"}), 400
+        try:
+            seq = int(t.get("seq") or 1)
+            to_qty = int(t["to_qty"]) if t.get("to_qty") is not None else None
+            parcel_qty = int(t["parcel_qty"]) if t.get("parcel_qty") is not None else None
+        except (TypeError, ValueError):
+            return jsonify({"ok": False, "error": f"Invalid trip: {t}"}), 400
+        trips.append({
+            "trip_id": t["trip_id"],
+            "trip_number": str(t.get("trip_number") or t["trip_id"]).replace("/", "_"),
+            "seq": seq,
+            "kind": kind,
+            "to_qty": to_qty,
+            "parcel_qty": parcel_qty,
+        })
+
+    station_id = req.get("station_id", 2259) if isinstance(req, dict) else 2259
+    with_pdf = bool(req.get("pdf", True)) if isinstance(req, dict) else True
+    name = (req.get("name") if isinstance(req, dict) else None) or f"LH_export_{today_short()}"
+
+    try:
+        cookie = _cookies.get(WH)
+    except Exception as e:
+        return jsonify({"ok": False, "error": f"Failed to get cookie: {str(e)}"}), 500
+
+    headers = build_api_headers(cookie)
+
+    def _close_entries(result):
+        for _, src, _ in result[0]:
+            src.close()
+
+    def _generate():
+        done = executors.pool("io").map_unordered(
+            lambda t: _export_trip(headers, t, station_id, with_pdf), trips,
+            limit=LH_EXPORT_WORKERS, discard=_close_entries,
+        )
+        sink = _ZipSink()
+        used, errors = set(), []
+        current = None
+        try:
+            with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+                for current in done:
+                    entries, errs = current
+                    errors.extend(errs)
+                    for arcname, src, compress in entries:
+                        with src:
+                            # Trùng tên (cùng trip_number / sheet) -> thêm hậu tố
+                            base, ext = os.path.splitext(arcname)
+                            n = 2
+                            while arcname in used:
+                                arcname = f"{base} ({n}){ext}"
+                                n += 1
+                            used.add(arcname)
+
+                            info = zipfile.ZipInfo(arcname, date_time=datetime.now().timetuple()[:6])
+                            info.compress_type = compress
+                            info.external_attr = 0o644 << 16
+                            with zf.open(info, "w") as dst:
+                                for chunk in iter(lambda: src.read(64 * 1024), b""):
+                                    dst.write(chunk)
+                                    yield sink.drain()
+                        yield sink.drain()
+
+                if errors:
+                    zf.writestr("_errors.txt", "\n".join(errors) + "\n")
+            yield sink.drain()
+        finally:
+            # Client ngắt giữa chừng -> bỏ các trip chưa chạy, đóng file tạm của trip đã xong
+            done.close()
+            if current is not None:
+                _close_entries(current)
+
+    return _attachment(Response(_generate(), mimetype="application/zip"), f"{name}.zip")
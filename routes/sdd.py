@@ -8,16 +8,23 @@ import os
 import sys
 import json
 import base64
-import io
-import pandas as pd
-import unicodedata
-import requests
+import math
 from datetime import datetime, timedelta, timezone
-from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from concurrent.futures import as_completed, TimeoutError as FuturesTimeoutError
 from typing import List, Tuple, Dict
 import time
 from flask import Blueprint, request, jsonify, Response, abort
-from werkzeug.exceptions import ClientDisconnected
+
+from utils import executors, http_client
+from utils.cookie_cache import CookieCache
+from utils.export_tasks import ExportTaskTracker
+from utils.cache import TTLCache
+from utils.regions import RegionClassifier
+from utils.excel import iter_xlsx_columns
+from utils.jobs import JobStore
+from config import (SDD_CACHE_TTL_STATUS, SDD_CACHE_TTL_CREATED, SDD_CACHE_TTL_CLOSED, SDD_CLOSED_GRACE,
+                    SDD_OOS_BATCH, SDD_OOS_WORKERS, SDD_JOB_WORKERS, SDD_JOB_TTL,
+                    SDD_SHARD_HOURS, SDD_MAX_SHARDS, EXEC_WH_LIMIT)
 
 # Import utility functions
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -42,6 +49,15 @@ except ImportError:
 
 bp = Blueprint("sdd", __name__)
 
+# Cookie WMS theo warehouse, cache trong process (TTL + tự bỏ khi upstream báo 401/403)
+_cookies = CookieCache(lambda wh: firebase_read_cookie_rtdb(wh, firebase_url))
+
+# Kết quả SDD theo (wh, time_from, time_to, time_mode, lanes); request trùng dùng chung 1 export
+_runs = TTLCache(SDD_CACHE_TTL_STATUS, maxsize=256)
+
+# SDD chạy nền: POST /sdd/jobs trả job id ngay, không giữ thread của waitress
+_jobs = JobStore(SDD_JOB_WORKERS, SDD_JOB_TTL, name="sdd-job")
+
 # Configuration
 WHS = ["VNDB", "VNDL"]
 GROUP_ID = "NTU1MDE4MzQwMDU4"
@@ -54,16 +70,36 @@ API_FILTER_ORDER = "https://wms.ssc.shopee.vn/api/v2/apps/process/outbound/sales
 EXPORT_MODULE = 2
 TASK_TYPE = 701
 
-POLL_STEP = 3      # seconds
+POLL_STEP = 3      # seconds, poll interval until progress is known
+POLL_MIN = 1       # seconds, adaptive poll bounds (see utils/export_tasks.py)
+POLL_MAX = 10      # seconds
+POLL_PAGES = 5     # max task-list pages per poll
 MAX_WAIT = 120     # seconds
 DL_TIMEOUT = 60    # seconds
+RUN_MARGIN = 120   # seconds, per run on top of the exports (create task, parse, OOS breakdown)
 
 TZ = timezone(timedelta(hours=7))  # Asia/Ho_Chi_Minh
 
+# Region -> regex trên tên tỉnh đã chuẩn hoá (không dấu, lowercase); thêm tỉnh chỉ cần thêm dòng
+SDD_REGIONS = {
+    "DN": r"\bda\s*nang\b|\bdanang\b",
+    "HUE": r"\bhue\b|\bthua\s*thien\s*hue\b",
+    "QNAM": r"\bquang\s*nam\b",
+}
+_regions = RegionClassifier(SDD_REGIONS)
+
 # Helper functions (copied from A_COT0.py)
-def _status_breakdown(headers: dict, order_no_list: List[str]) -> Dict[str, int]:
-    """Get status breakdown: 1 -> Normal, 2 -> OOS_Picking, 3 -> OOS_WHS"""
-    def _fetch_total(oos_type: int, batch: List[str]) -> int:
+def _status_breakdown(headers: dict, order_no_list: List[str], batch_size: int = None,
+                      workers: int = None) -> Dict[str, int]:
+    """Get status breakdown: 1 -> Normal, 2 -> OOS_Picking, 3 -> OOS_WHS
+
+    All (type, batch) totals run as one concurrent stage; each total is retried
+    on its own. Not cached: whole runs are cached by _run_for_wh_cached.
+    """
+    batch_size = batch_size or SDD_OOS_BATCH
+    workers = workers or SDD_OOS_WORKERS
+
+    def _fetch_total(oos_type: int, batch: List[str], retries: int = 3, backoff: float = 1.5) -> int:
         pl = {
             "order_no_list": batch,
             "order_filter_type": 0,
@@ -72,96 +108,67 @@ def _status_breakdown(headers: dict, order_no_list: List[str]) -> Dict[str, int]
             "count": 1,
             "is_get_total": 1,
         }
-        r = requests.post(API_FILTER_ORDER, json=pl, headers=headers, timeout=30)
-        r.raise_for_status()
-        rj = r.json() or {}
+        for i in range(1, retries + 1):
+            try:
+                r = http_client.post(API_FILTER_ORDER, json=pl, headers=headers, timeout=30)
+                r.raise_for_status()
+                rj = r.json() or {}
+                break
+            except Exception:
+                if i == retries:
+                    raise
+                time.sleep(backoff ** (i - 1))
         total = ((rj.get("data") or {}).get("total")) or 0
         try:
             return int(total)
         except Exception:
             return 0
 
-    def _sum(oos_type: int) -> int:
-        if not order_no_list:
-            return 0
-        total = 0
-        for i in range(0, len(order_no_list), 100):
-            total += _fetch_total(oos_type, order_no_list[i:i+100])
-        return total
-
-    return {"normal": _sum(1), "oos_picking": _sum(2), "oos_whs": _sum(3)}
-
-def _norm_text(s: pd.Series) -> pd.Series:
-    s = s.astype(str).str.strip()
-    return s.replace({"nan": "", "None": "", "NaT": ""}, regex=False)
-
-def _norm_vn_name(s: pd.Series) -> pd.Series:
-    s = s.astype(str).fillna("").str.strip().str.lower()
-    s = s.apply(lambda v: "".join(
-        c for c in unicodedata.normalize("NFD", v)
-        if unicodedata.category(c) != "Mn"
-    ))
-    s = s.str.replace("đ", "d")
-    s = s.str.replace(r"[-_/]", " ", regex=True)
-    s = s.str.replace(r"\b(tp|thanh pho|city|province|tinh|quan|huyen)\b", " ", regex=True)
-    s = s.str.replace(r"\s+", " ", regex=True).str.strip()
-    return s
-
-def _is_dn(series: pd.Series) -> pd.Series:
-    k = _norm_vn_name(series)
-    return k.str.contains(r"\bda\s*nang\b|\bdanang\b", regex=True, na=False)
-
-def _is_hue(series: pd.Series) -> pd.Series:
-    k = _norm_vn_name(series)
-    return k.str.contains(r"\bhue\b|\bthua\s*thien\s*hue\b", regex=True, na=False)
-
-def _is_qnam(series: pd.Series) -> pd.Series:
-    k = _norm_vn_name(series)
-    return k.str.contains(r"\bquang\s*nam\b", regex=True, na=False)
-
-def _download_with_retry(url: str, headers: dict, timeout: int = DL_TIMEOUT, retries: int = 3, backoff: float = 1.5) -> bytes:
-    last_err = None
-    for i in range(1, retries + 1):
-        try:
-            resp = requests.get(url, headers=headers, timeout=timeout)
-            resp.raise_for_status()
-            return resp.content
-        except Exception as e:
-            last_err = e
-            if i < retries:
-                time.sleep(backoff ** (i - 1))
-    raise last_err or Exception(f"Failed to download after {retries} retries")
+    def _total(job) -> int:
+        oos_type, batch = job
+        return _fetch_total(oos_type, batch)
 
-def _search_tasks_pages(headers: dict, pages: int = 5, count: int = 100) -> list:
-    """Fetch multiple pages of export tasks"""
-    all_tasks = []
+    orders = list(dict.fromkeys(order_no_list))
+    batches = [orders[i:i + batch_size] for i in range(0, len(orders), batch_size)]
+    jobs = [(oos_type, batch) for oos_type in (1, 2, 3) for batch in batches]
+    sums = {1: 0, 2: 0, 3: 0}
+    for (oos_type, _), total in zip(jobs, executors.pool("io").map(_total, jobs, limit=workers)):
+        sums[oos_type] += total
+
+    return {"normal": sums[1], "oos_picking": sums[2], "oos_whs": sums[3]}
+
+def _cell_text(v) -> str:
+    if v is None:
+        return ""
+    s = str(v).strip()
+    return "" if s in ("nan", "None", "NaT") else s
+
+def _search_tasks_page(headers: dict, pageno: int, count: int = 100) -> list:
+    """Fetch one page of export tasks (newest first)"""
     base = API_SEARCH_TASK if "pageno=" not in API_SEARCH_TASK else API_SEARCH_TASK.split("?")[0] + "?is_myself=1"
-    for p in range(1, pages + 1):
-        url = f"{base}&pageno={p}&count={count}"
-        try:
-            r = requests.get(url, headers=headers, timeout=15)
-            r.raise_for_status()
-            rj = r.json() or {}
-            if rj.get("retcode", 0) != 0:
-                raise RuntimeError(f"search_export_task retcode={rj.get('retcode')}")
-            tasks = (rj.get("data") or {}).get("list") or []
-            if not tasks:
-                break
-            all_tasks.extend(tasks)
-        except Exception as e:
-            print(f"⚠️ Poll page {p} error: {e}")
-            time.sleep(1)
-    return all_tasks
+    r = http_client.get(f"{base}&pageno={pageno}&count={count}", headers=headers, timeout=15)
+    r.raise_for_status()
+    rj = r.json() or {}
+    if rj.get("retcode", 0) != 0:
+        raise RuntimeError(f"search_export_task retcode={rj.get('retcode')}")
+    return (rj.get("data") or {}).get("list") or []
+
+# Một poller dùng chung cho mọi task đang chờ của cùng warehouse
+_tasks = ExportTaskTracker(_search_tasks_page, max_pages=POLL_PAGES, page_size=100,
+                           min_delay=POLL_MIN, max_delay=POLL_MAX, default_delay=POLL_STEP)
 
-def _create_and_fetch_excel(headers: dict, time_from: int, time_to: int, wh: str, date_ref: int = 0, status_list: list = None) -> pd.DataFrame:
-    """Create export task and fetch Excel data
+def _create_and_fetch_excel(headers: dict, time_from: int, time_to: int, wh: str, date_ref: int = 0, status_list: list = None,
+                            progress=None):
+    """Create export task and download the Excel file into a spooled temp file (caller closes it)
 
     Args:
         date_ref: 0 = filter by update_time (for status=Created orders)
                   1 = filter by created_time (for orders created in COT)
         status_list: List of status codes to filter. Default [0] = Created only.
                      Use [0,1,2,3,4,5,6,7,8,9,10] for all statuses when filtering by created_time.
+        progress: Optional progress(stage, **info) callback
     """
+    progress = progress or (lambda stage, **info: None)
     if status_list is None:
         status_list = [0]  # Default: only Created status
 
@@ -189,20 +196,16 @@ def _create_and_fetch_excel(headers: dict, time_from: int, time_to: int, wh: str
         "extra_data": json.dumps(extra_data, separators=(",", ":")),
     }
 
-    r = requests.post(API_CREATE_TASK, json=payload, headers=headers, timeout=30)
+    r = http_client.post(API_CREATE_TASK, json=payload, headers=headers, timeout=30)
     r.raise_for_status()
     resp = r.json()
     if resp.get("retcode") != 0:
+        _cookies.check(wh, resp)
         raise RuntimeError(f"Create task failed: {resp}")
 
     task_id = (resp.get("data") or {}).get("task_id") or resp.get("task_id")
     print(f"[{wh}] 🆕 Created task_id={task_id}")
 
-    time.sleep(2)
-
-    deadline = time.time() + MAX_WAIT
-    last_perc, download_link = -1, None
-
     def _normalize_ctime_to_s(ctime_val) -> int:
         try:
             c = int(ctime_val)
@@ -210,118 +213,117 @@ def _create_and_fetch_excel(headers: dict, time_from: int, time_to: int, wh: str
         except:
             return 0
 
-    while time.time() < deadline and not download_link:
-        try:
-            tasks = _search_tasks_pages(headers, pages=5, count=100)
-        except Exception as e:
-            print(f"[{wh}] ⚠️ Poll error: {e}")
-            time.sleep(POLL_STEP)
-            continue
-
-        found = None
-        if task_id:
-            for t in tasks:
-                if str(t.get("task_id")) == str(task_id):
-                    found = t
-                    break
-
-        if not found:
-            window_s = 120
-            candidates = []
-            for t in tasks:
-                if t.get("export_module") == EXPORT_MODULE and t.get("task_type") == TASK_TYPE:
-                    ctime_s = _normalize_ctime_to_s(t.get("ctime", 0))
-                    if abs(ctime_s - created_ts_s) <= window_s or abs((t.get("ctime", 0) or 0) - created_ts_ms) <= window_s * 1000:
-                        candidates.append((ctime_s, t))
-            if candidates:
-                candidates.sort(key=lambda x: x[0], reverse=True)
-                found = candidates[0][1]
-
-        if found:
-            perc = int(found.get("processed_percentage") or 0)
-            if perc != last_perc:
-                print(f"[{wh}] ⏳ Task {found.get('task_id')} processing: {perc}%")
-                last_perc = perc
-            dl = found.get("download_link")
-            if perc >= 100 and dl:
-                # CRITICAL: Wait for file to be fully written after 100%
-                print(f"[{wh}] ✅ Task complete, waiting for file stabilization...")
-                time.sleep(3)  # Give server time to finalize the file
-                download_link = dl
-                break
+    def _match_recent(t: dict) -> bool:
+        # Không có task_id -> nhận task cùng loại được tạo trong ±120s
+        window_s = 120
+        if t.get("export_module") != EXPORT_MODULE or t.get("task_type") != TASK_TYPE:
+            return False
+        ctime_s = _normalize_ctime_to_s(t.get("ctime", 0))
+        return abs(ctime_s - created_ts_s) <= window_s or abs((t.get("ctime", 0) or 0) - created_ts_ms) <= window_s * 1000
 
-        time.sleep(POLL_STEP)
+    progress("export", task_id=task_id, percentage=0)
+    entry = _tasks.track(wh, headers, task_id=task_id, match=_match_recent)
+    found = _tasks.wait(wh, entry, timeout=MAX_WAIT,
+                        on_progress=lambda perc: progress("export", task_id=task_id, percentage=perc))
+    download_link = found.get("download_link")
 
-    if not download_link:
-        raise TimeoutError("Report not ready within timeout")
+    # CRITICAL: Wait for file to be fully written after 100%
+    print(f"[{wh}] ✅ Task {found.get('task_id')} complete, waiting for file stabilization...")
+    time.sleep(3)  # Give server time to finalize the file
 
     print(f"[{wh}] 📥 Downloading Excel file...")
-    file_bytes = _download_with_retry(download_link, headers=headers, timeout=DL_TIMEOUT, retries=3)
+    progress("download", percentage=100)
+    return http_client.download(download_link, headers=headers, timeout=DL_TIMEOUT, retries=3)
 
-    print(f"[{wh}] 📊 Reading Excel data...")
-    return pd.read_excel(io.BytesIO(file_bytes), dtype=str, engine="openpyxl")
-
-def _filter_and_process_orders(df: pd.DataFrame, wh: str, lane_filter: str = "L-VN11") -> List[dict]:
-    """Filter orders and return detailed order list"""
-    need_cols = ["Buyer State", "Lane Code", "WMS Order No"]
-    missing = [c for c in need_cols if c not in df.columns]
-    if missing:
-        available = list(df.columns)[:10]  # Show first 10 columns for debugging
-        raise KeyError(f"Missing required columns: {missing}. Available columns: {available}")
-
-    buyer_state = _norm_text(df["Buyer State"])
-    lane_code = _norm_text(df["Lane Code"]).str.upper()
-    wms_no = _norm_text(df["WMS Order No"])
-
-    # Region filters
-    mask_dn = _is_dn(buyer_state)
-    mask_hue = _is_hue(buyer_state)
-    mask_qnam = _is_qnam(buyer_state)
-    mask_state = mask_dn | mask_hue | mask_qnam
+def _read_orders(fileobj, wh: str, lane_filter: str = "L-VN11") -> List[dict]:
+    """Stream the export and keep only orders in SDD_REGIONS on the allowed lanes.
 
+    Only Buyer State / Lane Code / WMS Order No are read (openpyxl read-only,
+    row by row); dicts are built just for matching rows.
+    """
     # Lane filter - default to L-VN11 if not provided
     if not lane_filter:
         lane_filter = "L-VN11"
+    allowed_lanes = {s.strip().upper() for s in lane_filter.split(",")}
 
-    allowed_lanes = [s.strip().upper() for s in lane_filter.split(",")]
-    mask_lane = lane_code.isin(allowed_lanes)
-
-    # Apply filters
-    filtered_mask = mask_state & mask_lane & wms_no.ne("")
-    filtered_df = df[filtered_mask]
-
-    # Create order list with normalized WMS order numbers and details
-    # Use the previously computed `wms_no` Series (normalized) so uniqueness
-    # later is reliable and not affected by whitespace or formatting differences.
     orders = []
-    for idx, row in filtered_df.iterrows():
-        # Prefer the normalized value from wms_no Series; fallback to raw cell
-        norm_wms = wms_no.loc[idx] if idx in wms_no.index else str(row.get("WMS Order No", "")).strip()
+    rows = iter_xlsx_columns(fileobj, ["Buyer State", "Lane Code", "WMS Order No"])
+    for state, lane, wms in rows:
+        wms_no = _cell_text(wms)
+        if not wms_no or _cell_text(lane).upper() not in allowed_lanes:
+            continue
+        # Region filter: mỗi giá trị Buyer State khác nhau chỉ chuẩn hoá/so regex 1 lần
+        if not _regions.classify(_cell_text(state)):
+            continue
         orders.append({
-            "wms_order_no": norm_wms,
-            "buyer_state": str(row.get("Buyer State", "")).strip(),
-            "lane_code": str(row.get("Lane Code", "")).strip(),
+            "wms_order_no": wms_no,
+            "buyer_state": str(state if state is not None else "").strip(),
+            "lane_code": str(lane if lane is not None else "").strip(),
             "warehouse": wh,
             "status": "Normal",
             # keep raw value for debugging if needed
-            "raw_wms_order_no": row.get("WMS Order No", "")
+            "raw_wms_order_no": str(wms)
         })
 
     return orders
 
-def _run_for_wh(wh: str, time_from: int, time_to: int, lane_filter: str = "L-VN11", time_mode: str = "status") -> Tuple[str, List[dict], str, dict]:
+def _shard_windows(time_from: int, time_to: int, shard_seconds: float) -> List[Tuple[int, int]]:
+    """Split [time_from, time_to] into consecutive sub-windows of at most shard_seconds.
+
+    Neighbouring shards share their boundary second; the order dedupe drops
+    anything exported twice. At most SDD_MAX_SHARDS shards (they widen instead).
+    """
+    time_from, time_to = int(time_from), int(time_to)
+    span = time_to - time_from
+    if not shard_seconds or shard_seconds <= 0 or span <= shard_seconds:
+        return [(time_from, time_to)]
+    n = min(math.ceil(span / shard_seconds), SDD_MAX_SHARDS)
+    edges = [time_from + span * i // n for i in range(n)] + [time_to]
+    return list(zip(edges[:-1], edges[1:]))
+
+def _fetch_orders_sharded(headers: dict, wh: str, windows: List[Tuple[int, int]], date_ref: int,
+                          status_list: list, lane_filter: str, progress) -> List[dict]:
+    """Export every shard concurrently (capped per warehouse), parse each, concatenate in window order"""
+    n = len(windows)
+    percs = [0] * n
+    print(f"[{wh}] 🧩 Splitting window into {n} shards")
+
+    def _shard_progress(i):
+        def _p(stage, **info):
+            if stage == "export":
+                percs[i] = info.get("percentage") or 0
+                progress("export", percentage=sum(percs) // n, shards=n)
+        return _p
+
+    def _one(i):
+        tf, tt = windows[i]
+        with executors.limit(f"wh:{wh}"):
+            fileobj = _create_and_fetch_excel(headers, tf, tt, wh, date_ref=date_ref,
+                                              status_list=status_list, progress=_shard_progress(i))
+        with fileobj:
+            return executors.pool("cpu").submit(_read_orders, fileobj, wh, lane_filter).result()
+
+    parts = executors.map("io", _one, range(n), limit=EXEC_WH_LIMIT)
+    progress("parse", shards=n)
+    return [o for part in parts for o in part]
+
+def _run_for_wh(wh: str, time_from: int, time_to: int, lane_filter: str = "L-VN11", time_mode: str = "status",
+                progress=None, shard_seconds: float = 0) -> Tuple[str, List[dict], str, dict]:
     """Process data for a single warehouse
 
     Args:
         time_mode: 'status' = filter orders with status=Created (default)
                    'created' = filter orders by created_time in the time range
+        progress: Optional progress(stage, **info) callback for this warehouse
+        shard_seconds: Split windows wider than this into concurrent sub-exports (0 = off)
     """
+    progress = progress or (lambda stage, **info: None)
     try:
         if not UTILITY_AVAILABLE:
             # For testing without utility module
             return wh, [], "utility module not available", {}
 
-        cookie = firebase_read_cookie_rtdb(wh, firebase_url)
+        cookie = _cookies.get(wh)
         headers = build_api_headers(cookie)
 
         # Determine date_ref and status_list based on time_mode
@@ -334,8 +336,17 @@ def _run_for_wh(wh: str, time_from: int, time_to: int, lane_filter: str = "L-VN1
             date_ref = 0
             status_list = [0]  # Only Created status
 
-        df = _create_and_fetch_excel(headers, time_from, time_to, wh, date_ref=date_ref, status_list=status_list)
-        orders = _filter_and_process_orders(df, wh, lane_filter)
+        windows = _shard_windows(time_from, time_to, shard_seconds)
+        if len(windows) > 1:
+            orders = _fetch_orders_sharded(headers, wh, windows, date_ref, status_list, lane_filter, progress)
+        else:
+            with executors.limit(f"wh:{wh}"):
+                fileobj = _create_and_fetch_excel(headers, time_from, time_to, wh, date_ref=date_ref,
+                                                  status_list=status_list, progress=progress)
+            print(f"[{wh}] 📊 Reading Excel data...")
+            progress("parse")
+            with fileobj:
+                orders = executors.pool("cpu").submit(_read_orders, fileobj, wh, lane_filter).result()
 
         # Deduplicate orders by normalized WMS Order No while preserving order.
         # This ensures FE won't see duplicates and total counts are correct.
@@ -359,6 +370,7 @@ def _run_for_wh(wh: str, time_from: int, time_to: int, lane_filter: str = "L-VN1
         # Get status breakdown
         status = {}
         try:
+            progress("breakdown", orders=len(orders))
             status = _status_breakdown(headers, unique_wms_list)
             print(f"[{wh}] → Normal: {status['normal']} | OOS_Picking: {status['oos_picking']} | OOS_WHS: {status['oos_whs']}")
         except Exception as se:
@@ -370,125 +382,299 @@ def _run_for_wh(wh: str, time_from: int, time_to: int, lane_filter: str = "L-VN1
         print(f"❌ {wh} error: {err}")
         return wh, [], err, {}
 
-# API Routes
-@bp.route("/sdd", methods=["POST"])
-def api_sdd_fetch():
-    """Fetch SDD data for both warehouses"""
-    import uuid
-    req_id = str(uuid.uuid4())[:8]
+def _run_timeout(time_from: int, time_to: int, shard_seconds: float) -> float:
+    """Seconds _run_sdd waits for the warehouses.
+
+    Shards of one warehouse export EXEC_WH_LIMIT at a time, each wave taking up
+    to MAX_WAIT + DL_TIMEOUT; one unsharded window gives the old 300s.
+    """
+    n = len(_shard_windows(time_from, time_to, shard_seconds))
+    return math.ceil(n / max(EXEC_WH_LIMIT, 1)) * (MAX_WAIT + DL_TIMEOUT) + RUN_MARGIN
+
+class _RunFailed(Exception):
+    """Carries a failed (or incomplete) _run_for_wh result through the cache without caching it"""
+
+    def __init__(self, result):
+        super().__init__(result[2])
+        self.result = result
+
+def _run_ttl(time_to: int, time_mode: str) -> float:
+    """Cache TTL of one SDD run: long once the window has closed, else per time_mode"""
+    if time_to <= time.time() - SDD_CLOSED_GRACE:
+        return SDD_CACHE_TTL_CLOSED
+    return SDD_CACHE_TTL_CREATED if time_mode == "created" else SDD_CACHE_TTL_STATUS
+
+def _run_for_wh_cached(wh: str, time_from: int, time_to: int, lane_filter: str = "L-VN11",
+                       time_mode: str = "status", refresh: bool = False,
+                       progress=None, shard_seconds: float = 0) -> Tuple[str, List[dict], str, dict]:
+    """_run_for_wh shared by identical concurrent requests and cached on success.
+
+    progress only sees the stages of a run this call started itself; a call that
+    joins an in-flight run or hits the cache jumps straight to its result.
+    """
+    lanes = ",".join(sorted({s.strip().upper() for s in (lane_filter or "L-VN11").split(",") if s.strip()}))
+    key = (wh, int(time_from), int(time_to), time_mode, lanes)
+    if refresh:
+        _runs.pop(key)
+    elif _runs.get(key) is not None:
+        print(f"[{wh}] ♻️ SDD result from cache ({time_mode}, {lanes})")
+
+    def _load():
+        result = _run_for_wh(wh, time_from, time_to, lane_filter, time_mode, progress, shard_seconds)
+        if result[2] or not result[3]:
+            # Lỗi, hoặc status breakdown lỗi (status rỗng) -> vẫn trả kết quả nhưng không cache
+            raise _RunFailed(result)
+        return result
+
     try:
-        req = request.get_json(force=True) or {}
-        time_from = req.get("time_from")
-        time_to = req.get("time_to")
-        lane_filter = req.get("lane_filter", "L-VN11").strip()
-        time_mode = req.get("time_mode", "status").strip()  # 'status' or 'created'
-        if not lane_filter:
-            lane_filter = "L-VN11"
-        if time_mode not in ["status", "created"]:
-            time_mode = "status"
-
-        if not time_from or not time_to:
-            return jsonify({"error": "time_from and time_to are required"}), 400
-
-        # Log time range and mode
-        dfrom = datetime.fromtimestamp(time_from, TZ).strftime("%Y-%m-%d %H:%M:%S")
-        dto = datetime.fromtimestamp(time_to, TZ).strftime("%Y-%m-%d %H:%M:%S")
-        mode_desc = "created_time filter" if time_mode == "created" else "status=Created filter"
-        print(f"[{req_id}] ⏱️ SDD Range: {dfrom} → {dto} (GMT+7) | Mode: {mode_desc}")
-
-        results = {}
-        errors = {}
-        statuses = {}
-
-        # Use timeout to prevent long-running tasks from holding resources
-        # if FE disconnects. Default 300s (5 min) for full export + processing.
-        timeout_sec = 300
-        start_time = time.time()
-
-        with ThreadPoolExecutor(max_workers=len(WHS)) as exe:
-            futs = {exe.submit(_run_for_wh, wh, time_from, time_to, lane_filter, time_mode): wh for wh in WHS}
+        return _runs.get_or_load(key, _load, ttl=_run_ttl(time_to, time_mode))
+    except _RunFailed as e:
+        return e.result
+
+def _parse_sdd_request(req: dict):
+    """Validated SDD params from a request body; returns (params, None) or (None, (body, status))"""
+    time_from = req.get("time_from")
+    time_to = req.get("time_to")
+    lane_filter = (req.get("lane_filter") or "L-VN11").strip()
+    time_mode = (req.get("time_mode") or "status").strip()  # 'status' or 'created'
+    if not lane_filter:
+        lane_filter = "L-VN11"
+    if time_mode not in ["status", "created"]:
+        time_mode = "status"
+
+    if not time_from or not time_to:
+        return None, ({"error": "time_from and time_to are required"}, 400)
+
+    # Cắt cửa sổ rộng thành nhiều export nhỏ chạy song song (0 = tắt)
+    try:
+        shard_hours = float(req.get("shard_hours", SDD_SHARD_HOURS) or 0)
+    except (TypeError, ValueError):
+        return None, ({"error": "shard_hours must be a number"}, 400)
+
+    return {
+        "time_from": time_from,
+        "time_to": time_to,
+        "lane_filter": lane_filter,
+        "time_mode": time_mode,
+        "refresh": bool(req.get("refresh")),  # bỏ qua cache kết quả
+        "shard_seconds": shard_hours * 3600,
+    }, None
+
+def _run_sdd(params: dict, req_id: str, job=None) -> dict:
+    """Fetch SDD data for every warehouse in WHS and build the API response.
+
+    job (utils.jobs.Job) receives per-warehouse progress: queued -> export (percentage)
+    -> download -> parse -> breakdown -> done | error.
+    """
+    time_from, time_to = params["time_from"], params["time_to"]
+    lane_filter, time_mode, refresh = params["lane_filter"], params["time_mode"], params["refresh"]
+    shard_seconds = params.get("shard_seconds", 0)
+
+    # Log time range and mode
+    dfrom = datetime.fromtimestamp(time_from, TZ).strftime("%Y-%m-%d %H:%M:%S")
+    dto = datetime.fromtimestamp(time_to, TZ).strftime("%Y-%m-%d %H:%M:%S")
+    mode_desc = "created_time filter" if time_mode == "created" else "status=Created filter"
+    print(f"[{req_id}] ⏱️ SDD Range: {dfrom} → {dto} (GMT+7) | Mode: {mode_desc}")
+
+    results = {}
+    errors = {}
+    statuses = {}
+
+    # Use timeout to prevent long-running tasks from holding resources
+    # if FE disconnects; scales with the number of export shards (300s unsharded).
+    timeout_sec = _run_timeout(time_from, time_to, shard_seconds)
+    start_time = time.time()
+
+    timed_out = set()
+
+    def _progress_for(wh):
+        if job is None:
+            return None
+
+        def _progress(stage, **info):
+            # Warehouse đã báo timeout -> bỏ qua progress muộn của run còn chạy nền
+            if wh not in timed_out:
+                job.update(wh, stage=stage, **info)
+        return _progress
+
+    if job is not None:
+        for wh in WHS:
+            job.update(wh, stage="queued")
+
+    io_pool = executors.pool("io")
+    futs = {io_pool.submit(_run_for_wh_cached, wh, time_from, time_to, lane_filter, time_mode, refresh,
+                          _progress_for(wh), shard_seconds): wh for wh in WHS}
+    try:
+        for fut in as_completed(futs, timeout=timeout_sec):
+            wh = futs[fut]
             try:
-                for fut in as_completed(futs, timeout=timeout_sec):
-                    wh = futs[fut]
-                    try:
-                        w, orders, err, stat = fut.result(timeout=5)
-                        results[w] = orders
-                        if err:
-                            errors[w] = err
-                        statuses[w] = stat
-                        print(f"[{req_id}] ✓ {w}: {len(orders)} orders collected")
-                    except FuturesTimeoutError:
-                        print(f"[{req_id}] ⚠️ {wh} task timeout (5s)")
-                        results[wh] = []
-                        errors[wh] = "Task timeout"
-                    except Exception as e:
-                        print(f"[{req_id}] ❌ {wh} unexpected error: {e}")
-                        results[wh] = []
-                        errors[wh] = f"UnexpectedError: {e}"
+                w, orders, err, stat = fut.result(timeout=5)
+                results[w] = orders
+                if err:
+                    errors[w] = err
+                statuses[w] = stat
+                if job is not None:
+                    job.update(w, stage="error" if err else "done", orders=len(orders), error=err or None)
+                print(f"[{req_id}] ✓ {w}: {len(orders)} orders collected")
             except FuturesTimeoutError:
-                print(f"[{req_id}] ⚠️ Executor timeout (300s), returning partial results")
-            except ClientDisconnected:
-                print(f"[{req_id}] ⚠️ Client disconnected mid-fetch, aborting")
-                return jsonify({"error": "Client disconnected", "partial": results, "request_id": req_id}), 499
+                print(f"[{req_id}] ⚠️ {wh} task timeout (5s)")
+                results[wh] = []
+                errors[wh] = "Task timeout"
             except Exception as e:
-                print(f"[{req_id}] ❌ Executor error: {e}")
-                return jsonify({"error": f"Execution error: {e}", "request_id": req_id}), 500
-
-        vndb_orders = results.get("VNDB", [])
-        vndl_orders = results.get("VNDL", [])
-
-        # Safety: dedupe again at API layer per-warehouse to avoid any FE duplicates
-        # in case upstream logic or FE mixing reintroduces duplicates.
-        def _dedupe_orders(orders_list: List[dict]) -> List[dict]:
-            seen_local = set()
-            out = []
-            for o in orders_list:
-                k = str(o.get("wms_order_no", "")).strip()
-                if not k or k in seen_local:
-                    continue
-                seen_local.add(k)
-                out.append(o)
-            return out
-
-        before_vndb, before_vndl = len(vndb_orders), len(vndl_orders)
-        vndb_orders = _dedupe_orders(vndb_orders)
-        vndl_orders = _dedupe_orders(vndl_orders)
-        after_vndb, after_vndl = len(vndb_orders), len(vndl_orders)
-        if before_vndb != after_vndb or before_vndl != after_vndl:
-            print(f"[{req_id}] [SDD] Dedupe applied at API layer: VNDB {before_vndb}->{after_vndb}, VNDL {before_vndl}->{after_vndl}")
-        # Keep legacy total as sum per-warehouse (backward compatible)
-        total_orders = len(vndb_orders) + len(vndl_orders)
-
-        # Also compute a global unique total across both warehouses by wms_order_no
-        # to avoid double counting if the same order appears in both datasets.
-        seen_all = set()
-        for o in (vndb_orders + vndl_orders):
+                print(f"[{req_id}] ❌ {wh} unexpected error: {e}")
+                results[wh] = []
+                errors[wh] = f"UnexpectedError: {e}"
+            if wh in errors and job is not None:
+                job.update(wh, stage="error", error=errors[wh])
+    except FuturesTimeoutError:
+        print(f"[{req_id}] ⚠️ Executor timeout ({timeout_sec:.0f}s), returning partial results")
+        for fut, wh in futs.items():
+            if wh in results:
+                continue
+            fut.cancel()
+            timed_out.add(wh)
+            results[wh] = []
+            errors[wh] = f"Timeout after {timeout_sec:.0f}s"
+            if job is not None:
+                job.update(wh, stage="error", error=errors[wh])
+    except Exception as e:
+        print(f"[{req_id}] ❌ Executor error: {e}")
+        raise RuntimeError(f"Execution error: {e}")
+
+    vndb_orders = results.get("VNDB", [])
+    vndl_orders = results.get("VNDL", [])
+
+    # Safety: dedupe again at API layer per-warehouse to avoid any FE duplicates
+    # in case upstream logic or FE mixing reintroduces duplicates.
+    def _dedupe_orders(orders_list: List[dict]) -> List[dict]:
+        seen_local = set()
+        out = []
+        for o in orders_list:
             k = str(o.get("wms_order_no", "")).strip()
-            if k:
-                seen_all.add(k)
-        total_unique_orders = len(seen_all)
-
-        response = {
-            "success": True,
-            "vndb_orders": vndb_orders,
-            "vndl_orders": vndl_orders,
-            "total_orders": total_orders,
-            "total_unique_orders": total_unique_orders,
-            "stats": {
-                "vndb": statuses.get("VNDB", {}),
-                "vndl": statuses.get("VNDL", {})
-            },
-            "errors": errors,
-            "time_range": {
-                "from": dfrom,
-                "to": dto
-            }
+            if not k or k in seen_local:
+                continue
+            seen_local.add(k)
+            out.append(o)
+        return out
+
+    before_vndb, before_vndl = len(vndb_orders), len(vndl_orders)
+    vndb_orders = _dedupe_orders(vndb_orders)
+    vndl_orders = _dedupe_orders(vndl_orders)
+    after_vndb, after_vndl = len(vndb_orders), len(vndl_orders)
+    if before_vndb != after_vndb or before_vndl != after_vndl:
+        print(f"[{req_id}] [SDD] Dedupe applied at API layer: VNDB {before_vndb}->{after_vndb}, VNDL {before_vndl}->{after_vndl}")
+    # Keep legacy total as sum per-warehouse (backward compatible)
+    total_orders = len(vndb_orders) + len(vndl_orders)
+
+    # Also compute a global unique total across both warehouses by wms_order_no
+    # to avoid double counting if the same order appears in both datasets.
+    seen_all = set()
+    for o in (vndb_orders + vndl_orders):
+        k = str(o.get("wms_order_no", "")).strip()
+        if k:
+            seen_all.add(k)
+    total_unique_orders = len(seen_all)
+
+    response = {
+        "success": True,
+        "vndb_orders": vndb_orders,
+        "vndl_orders": vndl_orders,
+        "total_orders": total_orders,
+        "total_unique_orders": total_unique_orders,
+        "stats": {
+            "vndb": statuses.get("VNDB", {}),
+            "vndl": statuses.get("VNDL", {})
+        },
+        "errors": errors,
+        "time_range": {
+            "from": dfrom,
+            "to": dto
         }
+    }
 
-        elapsed = time.time() - start_time
-        print(f"[{req_id}] ✓ Complete in {elapsed:.2f}s, returning {total_orders} orders ({total_unique_orders} unique)")
-        return jsonify(response)
+    elapsed = time.time() - start_time
+    print(f"[{req_id}] ✓ Complete in {elapsed:.2f}s, returning {total_orders} orders ({total_unique_orders} unique)")
+    return response
 
-    except Exception as e:
-        print(f"[{req_id}] ❌ SDD API error: {e}")
-        return jsonify({"error": str(e)}), 500
+# API Routes
+@bp.route("/sdd", methods=["POST"])
+def api_sdd_fetch():
+    """Fetch SDD data for both warehouses (blocking wrapper around an SDD job)"""
+    req = request.get_json(force=True) or {}
+    params, err = _parse_sdd_request(req)
+    if err:
+        return jsonify(err[0]), err[1]
+
+    job = _jobs.submit("sdd", lambda j: _run_sdd(params, j.id[:8], j))
+    job.wait()
+    if job.status == "error":
+        print(f"[{job.id[:8]}] ❌ SDD API error: {job.error}")
+        return jsonify({"error": job.error}), 500
+    return jsonify(job.result)
+
+@bp.route("/sdd/jobs", methods=["POST"])
+def api_sdd_job_submit():
+    """Start an SDD run in the background; returns its job id right away"""
+    req = request.get_json(force=True) or {}
+    params, err = _parse_sdd_request(req)
+    if err:
+        return jsonify(err[0]), err[1]
+
+    job = _jobs.submit("sdd", lambda j: _run_sdd(params, j.id[:8], j))
+    base = f"{request.script_root}{request.path}/{job.id}"
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": base,
+        "events_url": f"{base}/events",
+        "result_url": f"{base}/result",
+    }), 202
+
+def _job_missing():
+    return jsonify({"error": "Job not found or expired"}), 404
+
+@bp.route("/sdd/jobs/<job_id>", methods=["GET"])
+def api_sdd_job_status(job_id):
+    """Job status and per-warehouse progress (poll this)"""
+    job = _jobs.get(job_id)
+    if job is None:
+        return _job_missing()
+    return jsonify(job.to_dict())
+
+@bp.route("/sdd/jobs/<job_id>/result", methods=["GET"])
+def api_sdd_job_result(job_id):
+    """Final SDD response once the job is done (202 while running); kept SDD_JOB_TTL seconds"""
+    job = _jobs.get(job_id)
+    if job is None:
+        return _job_missing()
+    if not job.finished:
+        return jsonify(job.to_dict()), 202
+    if job.status == "error":
+        return jsonify({"error": job.error, "job_id": job.id}), 500
+    return jsonify(job.result)
+
+@bp.route("/sdd/jobs/<job_id>/events", methods=["GET"])
+def api_sdd_job_events(job_id):
+    """Server-sent events: a `progress` event on every change, then `done`.
+
+    Note: the stream keeps a server thread for its duration; polling the
+    status URL is cheaper when many clients watch.
+    """
+    job = _jobs.get(job_id)
+    if job is None:
+        return _job_missing()
+
+    def _generate():
+        version = -1
+        while True:
+            version = job.wait_change(version, timeout=15)
+            state = job.to_dict()
+            if job.finished:
+                yield f"event: done\ndata: {json.dumps(state, ensure_ascii=False)}\n\n"
+                return
+            yield f"event: progress\ndata: {json.dumps(state, ensure_ascii=False)}\n\n"
+
+    resp = Response(_generate(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
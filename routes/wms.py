@@ -2,12 +2,15 @@
 # -*- coding: utf-8 -*-
 from flask import Blueprint, request, jsonify, current_app, session
 from werkzeug.exceptions import ClientDisconnected
-import requests, json, urllib.request, uuid, traceback
+import requests, json, uuid, traceback
 from urllib.parse import urlparse
 import re, html as htmllib
 import os, sys, time
 from functools import wraps
 
+from utils import executors, http_client
+from utils.cookie_cache import CookieCache
+
 # ==== import utility (dùng header chuẩn đã chạy OK ở script cũ) ====
 def build_api_headers(cookie: str | None = None):
     """Tạo headers chuẩn cho API requests"""
@@ -55,13 +58,19 @@ def _errlog(msg, **kw):
 def _ok(data):     return jsonify({"retcode": 0, "data": data})
 def _err(code,msg):return jsonify({"retcode": code, "message": msg}), 400
 
+def _read_cookie_rtdb(warehouse: str) -> str:
+    url = f"https://cookie-vnw-default-rtdb.firebaseio.com/{warehouse}/value/cookie.json"
+    r = http_client.get(url, timeout=10)
+    r.raise_for_status()
+    return r.json()
+
+_cookies = CookieCache(_read_cookie_rtdb)
+
 def get_cookie_from_rtdb(warehouse: str) -> str:
     """
-    Lấy cookie WMS từ RTDB public.
+    Lấy cookie WMS từ RTDB public (cache theo warehouse, xem utils/cookie_cache.py).
     """
-    url = f"https://cookie-vnw-default-rtdb.firebaseio.com/{warehouse}/value/cookie.json"
-    with urllib.request.urlopen(url, timeout=10) as f:
-        return json.loads(f.read().decode())
+    return _cookies.get(warehouse)
 
 def _to_vendor_code(raw: str) -> str:
     s = (raw or "").strip()
@@ -134,7 +143,7 @@ def probe_login():
     url = f"https://wms.ssc.shopee.vn/api/v2/apps/dashboard/labor/dsstaff/search_staff_tracking?from_time={day0}&to_time={day1}&pageno=1&count=1"
 
     try:
-        r = requests.get(url, headers=headers, timeout=20)
+        r = http_client.get(url, headers=headers, timeout=20)
         preview = (r.text or "")[:200]
     except Exception as ex:
         return jsonify({"retcode": 502, "message": f"probe upstream error: {ex}"}), 502
@@ -150,9 +159,22 @@ def probe_login():
 def ping():
     return _ok({"pong": True})
 
+@bp.get("/_http_stats")
+def http_stats():
+    """Upstream connection pool hit/miss stats"""
+    return _ok(http_client.stats())
+
+
+@bp.get("/_exec_stats")
+def exec_stats():
+    """Shared executor queue depth and per-warehouse / per-host slot usage"""
+    return _ok(executors.stats())
+
 @bp.get("/_cookie_check")
 def cookie_check():
     wh = (request.args.get("wh") or "VNDB").strip()
+    if request.args.get("fresh"):
+        _cookies.invalidate(wh)
     try:
         cookie = get_cookie_from_rtdb(wh)
         ok = bool(cookie and len(cookie) > 10)
@@ -175,7 +197,7 @@ def info_staff_get(vendor_code):
     _log("INFO start", url=url, vendor_code=vendor_code)
 
     try:
-        r = requests.get(url, headers=headers, timeout=20)
+        r = http_client.get(url, headers=headers, timeout=20)
     except Exception as ex:
         _errlog("INFO upstream exception", error=str(ex))
         return jsonify({"retcode": 500, "message": f"vanhanh error: {ex}"}), 502
@@ -311,7 +333,7 @@ def record_attendance():
             payload = _payload(cand)
             _log("ATTN upstream POST", url=URL_SCAN, payload=payload, try_idx=idx, timeout=25)
             try:
-                r = requests.post(URL_SCAN, json=payload, headers=req_headers, timeout=25)
+                r = http_client.post(URL_SCAN, json=payload, headers=req_headers, timeout=25)
             except requests.Timeout:
                 _errlog("ATTN upstream timeout (25s)", candidate=idx, total_candidates=len(candidates))
                 last_preview = "Upstream timeout (25s)"
@@ -331,6 +353,8 @@ def record_attendance():
                     j = r.json()
                 except Exception:
                     j = {"raw": r.text[:600]}
+                if _cookies.check(wh, j):
+                    _warn("ATTN auth retcode, cookie invalidated", warehouse=wh, retcode=j.get("retcode"))
                 elapsed = time.time() - start_time
                 _log("ATTN success", elapsed_ms=int(elapsed*1000), request_id=req_id, candidate=cand)
                 return _ok(j)
@@ -392,7 +416,7 @@ def record_activity():
 
         _log("ACT upstream POST", url=URL_TASK, payload=payload, timeout=25)
         try:
-            r = requests.post(URL_TASK, json=payload, headers=req_headers, timeout=25)
+            r = http_client.post(URL_TASK, json=payload, headers=req_headers, timeout=25)
         except requests.Timeout:
             _errlog("ACT upstream timeout (25s)")
             return jsonify({"retcode": 504, "message": "Upstream timeout (25s)", "request_id": req_id}), 504
@@ -410,6 +434,8 @@ def record_activity():
             j = r.json()
         except Exception:
             j = {"raw": r.text[:600]}
+        if _cookies.check(wh, j):
+            _warn("ACT auth retcode, cookie invalidated", warehouse=wh, retcode=j.get("retcode"))
 
         data_obj = j.get("data") or {}
         staff_name = (
@@ -465,7 +491,7 @@ def verify_scan():
                 headers = {"User-Agent": "Mozilla/5.0", "Accept": "text/html,application/json"}
                 url = _vanhanh_info_url(vc)
                 try:
-                    r = requests.get(url, headers=headers, timeout=10)
+                    r = http_client.get(url, headers=headers, timeout=10)
                 except Exception as ex:
                     _errlog("VERIFY upstream error", error=str(ex))
                     return jsonify({"retcode": 502, "message": f"vanhanh error: {ex}"}), 502
@@ -0,0 +1,12 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Không có service account khi chạy test: bỏ qua init Firebase lúc import
+# (test nào cần RTDB tự thay db.reference bằng fake)
+import utils.firebase_config as _firebase_config  # noqa: E402
+
+_firebase_config.ensure_firebase = lambda: None
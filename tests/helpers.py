@@ -0,0 +1,60 @@
+import io
+import json as _json
+
+from flask import Flask
+from openpyxl import Workbook
+
+
+class FakeResponse:
+    """Minimal stand-in for requests.Response returned by a faked http_client call"""
+
+    def __init__(self, status_code=200, json=None, content=b"", headers=None):
+        self.status_code = status_code
+        self._json = json
+        self.content = _json.dumps(json).encode() if json is not None else content
+        self.headers = headers or {}
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", "replace")
+
+    def json(self):
+        if self._json is None:
+            raise ValueError("no json")
+        return self._json
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def make_app(bp, prefix: str = ""):
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.register_blueprint(bp, url_prefix=prefix or None)
+    return app
+
+
+def xlsx(rows) -> io.BytesIO:
+    """In-memory .xlsx whose first sheet holds rows"""
+    wb = Workbook()
+    ws = wb.active
+    for r in rows:
+        ws.append(r)
+    buf = io.BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+    return buf
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from utils.cache import TTLCache
+
+
+def test_ttl_expiry():
+    cache = TTLCache(ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=-1)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+
+
+def test_maxsize_evicts_soonest_expiring():
+    cache = TTLCache(ttl=60, maxsize=2)
+    cache.set("short", 1, ttl=5)
+    cache.set("long", 2)
+    cache.set("new", 3)
+    assert cache.get("short") is None
+    assert cache.get("long") == 2 and cache.get("new") == 3
+
+
+def test_get_or_load_single_flight():
+    cache = TTLCache(ttl=60)
+    calls = []
+    gate = threading.Event()
+
+    def loader():
+        calls.append(1)
+        gate.wait(2)
+        return "v"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("k", loader))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    gate.set()
+    for t in threads:
+        t.join()
+
+    assert results == ["v"] * 5
+    assert len(calls) == 1
+
+
+def test_get_or_load_error_not_cached():
+    cache = TTLCache(ttl=60)
+
+    def boom():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("k", boom)
+    assert cache.get_or_load("k", lambda: 7) == 7
+
+
+def test_swr_serves_stale_while_one_refresh_runs():
+    from utils.cache import SWRCache
+
+    cache = SWRCache(stale_ttl=60)
+    values = iter(["v1", "v2"])
+    gate = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        if len(calls) > 1:
+            gate.wait(2)
+        return next(values), 0.05
+
+    assert cache.get_or_load("k", loader) == ("v1", "miss")
+    assert cache.get_or_load("k", loader) == ("v1", "hit")
+    time.sleep(0.06)
+    assert cache.get_or_load("k", loader) == ("v1", "stale")
+    assert cache.get_or_load("k", loader) == ("v1", "stale")
+    gate.set()
+    for _ in range(100):
+        if cache.get_or_load("k", loader)[1] == "hit":
+            break
+        time.sleep(0.01)
+
+    assert cache.get_or_load("k", loader) == ("v2", "hit")
+    assert len(calls) == 2
+
+
+def test_swr_zero_ttl_is_not_cached():
+    from utils.cache import SWRCache
+
+    cache = SWRCache(stale_ttl=60)
+    assert cache.get_or_load("k", lambda: ("err", 0)) == ("err", "miss")
+    assert cache.get_or_load("k", lambda: ("ok", 30)) == ("ok", "miss")
+    assert cache.get_or_load("k", lambda: ("other", 30)) == ("ok", "hit")
@@ -0,0 +1,44 @@
+from utils.cookie_cache import CookieCache, is_auth_failure
+
+
+def _counting_cache():
+    loads = []
+
+    def loader(wh):
+        loads.append(wh)
+        return f"cookie-{wh}-{len(loads)}"
+
+    return CookieCache(loader, ttl=60), loads
+
+
+def test_cookie_cached_per_warehouse():
+    cache, loads = _counting_cache()
+    assert cache.get("VNDB") == "cookie-VNDB-1"
+    assert cache.get("VNDB") == "cookie-VNDB-1"
+    assert cache.get("VNDL") == "cookie-VNDL-2"
+    assert loads == ["VNDB", "VNDL"]
+
+
+def test_check_invalidates_on_auth_retcode():
+    cache, loads = _counting_cache()
+    cache.get("VNDB")
+    assert not cache.check("VNDB", {"retcode": 0, "data": {}})
+    assert cache.get("VNDB") == "cookie-VNDB-1"
+
+    assert cache.check("VNDB", {"retcode": 401, "message": "login expired"})
+    assert cache.get("VNDB") == "cookie-VNDB-2"
+    assert loads == ["VNDB", "VNDB"]
+
+
+def test_check_invalidates_on_http_status():
+    cache, _ = _counting_cache()
+    cache.get("VNDB")
+    assert cache.check("VNDB", status=403)
+    assert cache.get("VNDB") == "cookie-VNDB-2"
+
+
+def test_is_auth_failure():
+    assert is_auth_failure(401)
+    assert is_auth_failure(200, "403")
+    assert not is_auth_failure(200, 0)
+    assert not is_auth_failure(200, "abc")
@@ -0,0 +1,50 @@
+import io
+
+import pytest
+from openpyxl import load_workbook
+
+from utils.excel import TableWorkbook, iter_xlsx_columns
+from tests.helpers import xlsx as _xlsx
+
+
+def test_iter_xlsx_columns_projects_named_columns():
+    f = _xlsx([
+        ["Report title"],
+        ["Lane Code", "Other", "WMS Order No", "Buyer State"],
+        ["L-VN11", "x", "SO1", "Đà Nẵng"],
+        ["L-VN12", "y", "SO2"],
+    ])
+    rows = list(iter_xlsx_columns(f, ["Buyer State", "WMS Order No"]))
+    assert rows == [("Đà Nẵng", "SO1"), (None, "SO2")]
+
+
+def test_iter_xlsx_columns_missing_column():
+    with pytest.raises(KeyError, match="Buyer State"):
+        list(iter_xlsx_columns(_xlsx([["Lane Code", "WMS Order No"], ["L", "SO1"]]), ["Buyer State"]))
+
+
+def _book(rows):
+    book = TableWorkbook()
+    sheet = book.add_sheet("LH", ["Order", "Time"])
+    for r in rows:
+        sheet.append(r)
+    return book
+
+
+def test_table_workbook_writes_styled_sheet():
+    wb = load_workbook(io.BytesIO(_book([("SO1", "10:00"), ("SO-LONG-ORDER-NUMBER-12345", None)]).to_bytes()))
+    ws = wb["LH"]
+    assert [tuple(r) for r in ws.iter_rows(values_only=True)] == [
+        ("Order", "Time"), ("SO1", "10:00"), ("SO-LONG-ORDER-NUMBER-12345", None)]
+    assert ws["A1"].style == "table_header" and ws["B3"].style == "table_body"
+    assert ws.freeze_panes == "A2"
+    assert ws.auto_filter.ref == "A1:B3"
+    assert ws.column_dimensions["A"].width == len("SO-LONG-ORDER-NUMBER-12345") + 2
+    assert ws.column_dimensions["B"].width == 10
+
+
+def test_table_workbook_fingerprint_follows_content():
+    a = _book([("SO1", "10:00")])
+    assert a.fingerprint() == _book([("SO1", "10:00")]).fingerprint()
+    assert a.fingerprint() != _book([("SO1", "10:01")]).fingerprint()
+    assert a.fingerprint() != _book([("SO1", "10:00"), ("SO2", "10:00")]).fingerprint()
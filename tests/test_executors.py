@@ -0,0 +1,69 @@
+import threading
+import time
+
+import config
+from utils import executors
+from utils.executors import NamedPool
+
+
+def test_http_pool_holds_every_host_slot():
+    assert config.HTTP_POOL_SIZE >= config.EXEC_HOST_LIMIT
+
+
+def test_map_keeps_item_order():
+    p = NamedPool("t-order", 4)
+    out = list(p.map(lambda i: (time.sleep(0.01 * (5 - i)), i)[1], range(5)))
+    assert out == [0, 1, 2, 3, 4]
+
+
+def test_map_from_pool_worker_runs_inline():
+    # Pool 1 worker: worker đang chạy outer() nên các item bên trong phải chạy inline
+    p = NamedPool("t-nested", 1)
+
+    def outer():
+        return list(p.map(lambda i: i * 2, range(3)))
+
+    assert p.submit(outer).result(timeout=2) == [0, 2, 4]
+    assert p.stats()["inline"] == 3
+    assert p.stats()["queued"] == 0
+
+
+def test_map_unordered_discards_unconsumed_results():
+    p = NamedPool("t-discard", 2)
+    gate = threading.Event()
+    discarded = []
+
+    def fn(i):
+        if i:
+            gate.wait(2)
+        return i
+
+    gen = p.map_unordered(fn, range(4), limit=2, discard=discarded.append)
+    assert next(gen) == 0
+    gen.close()
+    gate.set()
+    deadline = time.time() + 2
+    while len(discarded) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    # 1, 2 đã chạy nhưng không ai lấy kết quả -> discard; 3 chưa bao giờ submit
+    assert sorted(discarded) == [1, 2]
+    assert p.stats()["queued"] == 0
+
+
+def test_limit_caps_concurrency(monkeypatch):
+    monkeypatch.setitem(executors.LIMITS, "t", 2)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work(_):
+        with executors.limit("t:key"):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+
+    list(NamedPool("t-limit", 6).map(work, range(6)))
+    assert peak[0] == 2
+    assert executors.stats()["limits"]["t:key"]["peak"] == 2
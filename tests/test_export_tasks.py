@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from utils.export_tasks import ExportTaskTracker
+
+
+class FakeTaskList:
+    """Report-center task list whose tasks advance `step`% per poll"""
+
+    def __init__(self, tasks, step=50):
+        self.perc = dict(tasks)
+        self.step = step
+        self.pages = []
+        self.lock = threading.Lock()
+
+    def __call__(self, headers, pageno, count):
+        with self.lock:
+            self.pages.append(pageno)
+            if pageno == 1:
+                for tid in self.perc:
+                    self.perc[tid] = min(self.perc[tid] + self.step, 100)
+            rows = [{"task_id": tid, "processed_percentage": p,
+                     "download_link": f"/dl/{tid}" if p >= 100 else ""} for tid, p in self.perc.items()]
+        return rows[(pageno - 1) * count:pageno * count]
+
+
+def _tracker(fetch, **kw):
+    return ExportTaskTracker(fetch, min_delay=0.01, max_delay=0.05, default_delay=0.01, **kw)
+
+
+def test_one_poller_serves_every_waiter_of_a_warehouse():
+    tasks = FakeTaskList({"t1": 0, "t2": 0})
+    tracker = _tracker(tasks)
+    e1 = tracker.track("VNDB", {}, task_id="t1", first_delay=0)
+    e2 = tracker.track("VNDB", {}, task_id="t2", first_delay=0)
+    progress = []
+
+    assert tracker.wait("VNDB", e1, timeout=2, on_progress=progress.append)["download_link"] == "/dl/t1"
+    assert tracker.wait("VNDB", e2, timeout=2)["download_link"] == "/dl/t2"
+    assert progress and progress[-1] == 100
+    # Cả 2 task nằm ở trang 1 -> mỗi lần poll chỉ đọc 1 trang
+    assert set(tasks.pages) == {1}
+    assert len(tasks.pages) <= 3
+
+
+def test_match_without_task_id_and_paging():
+    tasks = FakeTaskList({f"t{i}": 0 for i in range(5)}, step=100)
+    tracker = _tracker(tasks, page_size=2)
+    entry = tracker.track("VNDL", {}, match=lambda t: t["task_id"] == "t4", first_delay=0)
+
+    assert tracker.wait("VNDL", entry, timeout=2)["task_id"] == "t4"
+    assert tasks.pages[:3] == [1, 2, 3]
+
+
+def test_wait_times_out_and_untracks():
+    tracker = _tracker(FakeTaskList({"t1": 0}, step=0))
+    entry = tracker.track("VNDB", {}, task_id="t1", first_delay=0)
+    with pytest.raises(TimeoutError):
+        tracker.wait("VNDB", entry, timeout=0.1)
+    assert entry not in tracker._wh("VNDB").entries
+
+
+def test_repeated_poll_errors_fail_waiters():
+    calls = []
+
+    def fetch(headers, pageno, count):
+        calls.append(pageno)
+        raise RuntimeError("HTTP 401")
+
+    tracker = _tracker(fetch, max_errors=3)
+    entry = tracker.track("VNDB", {}, task_id="t1", first_delay=0)
+    with pytest.raises(RuntimeError, match="poll failed 3 times: HTTP 401"):
+        tracker.wait("VNDB", entry, timeout=5)
+    assert len(calls) >= 3
+
+
+def test_task_never_listed_fails_fast():
+    tracker = _tracker(FakeTaskList({"t1": 0}), unseen_timeout=0.05)
+    entry = tracker.track("VNDB", {}, task_id="missing", first_delay=0)
+    with pytest.raises(LookupError, match="missing"):
+        tracker.wait("VNDB", entry, timeout=5)
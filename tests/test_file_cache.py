@@ -0,0 +1,85 @@
+import os
+import time
+
+import pytest
+
+from utils.file_cache import DiskLRUCache, ArtifactStore
+
+
+def _fill(cache, key, data: bytes, suffix=""):
+    return cache.put(key, lambda f: f.write(data), suffix=suffix)
+
+
+def test_tee_commits_only_complete_downloads(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=1 << 20)
+    assert b"".join(cache.tee("a", [b"12", b"34"], expected_size=4)) == b"1234"
+    assert b"".join(cache.tee("b", [b"12"], expected_size=4)) == b"12"
+
+    with cache.open("a") as f:
+        assert f.read() == b"1234"
+    assert cache.open("b") is None
+    assert not [n for n in os.listdir(tmp_path) if n.endswith(".part")]
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=25)
+    for i, key in enumerate(("a", "b")):
+        path = _fill(cache, key, b"x" * 10)
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+    cache.get("a")              # a thành mới dùng nhất
+    _fill(cache, "c", b"x" * 10)
+
+    assert cache.get("a") and cache.get("c")
+    assert cache.get("b") is None
+
+
+def test_open_handle_survives_eviction(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=1 << 20)
+    _fill(cache, "pdf", b"%PDF-1.4 data")
+    f = cache.open("pdf")
+    try:
+        cache.max_bytes = 0
+        cache.evict()
+        if os.name != "nt":
+            assert cache.get("pdf") is None
+        assert f.read() == b"%PDF-1.4 data"
+    finally:
+        f.close()
+
+
+def test_max_age(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=1 << 20, max_age=60)
+    path = _fill(cache, "old", b"1")
+    os.utime(path, (time.time() - 120, time.time() - 120))
+    cache.evict()
+    assert cache.open("old") is None
+
+
+def test_artifact_store_uses_digest_as_name(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=1 << 20)
+    digest = "ab" * 32
+    assert _fill(store, digest, b"xlsx", suffix=".xlsx") == os.path.join(str(tmp_path), digest + ".xlsx")
+    assert store.get(digest, ".xlsx")
+    for bad in ("", "../../etc/passwd", "ABCDEF0123456789", "abc"):
+        with pytest.raises(ValueError):
+            store.open(bad, ".xlsx")
+
+
+def test_open_or_put_writes_once_and_survives_eviction(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=1 << 20)
+    digest = "cd" * 32
+    writes = []
+
+    def write(f):
+        writes.append(1)
+        f.write(b"xlsx")
+
+    with store.open_or_put(digest, write, suffix=".xlsx") as f:
+        store.max_bytes = 0
+        store.evict()
+        assert f.read() == b"xlsx"
+    store.max_bytes = 1 << 20
+    _fill(store, digest, b"xlsx", suffix=".xlsx")
+    with store.open_or_put(digest, write, suffix=".xlsx") as f:
+        assert f.read() == b"xlsx"
+    assert writes == [1]
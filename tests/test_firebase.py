@@ -0,0 +1,61 @@
+import pytest
+
+from utils import firebase
+
+
+class _Query:
+    """order_by_key / start_at / limit_to_first over a dict, like RTDB"""
+
+    def __init__(self, data, calls):
+        self.data, self.calls = data, calls
+        self.start, self.limit = None, None
+
+    def order_by_key(self):
+        return self
+
+    def start_at(self, key):
+        self.start = key
+        return self
+
+    def limit_to_first(self, n):
+        self.limit = n
+        return self
+
+    def get(self, shallow=False):
+        if shallow:
+            return {k: True for k in self.data} or None
+        keys = [k for k in sorted(self.data) if self.start is None or k >= self.start][:self.limit]
+        self.calls.append((self.start, self.limit))
+        return {k: self.data[k] for k in keys}
+
+
+@pytest.fixture
+def rtdb(monkeypatch):
+    store, calls = {}, []
+    monkeypatch.setattr(firebase.db, "reference", lambda path: _Query(store.get(path, {}), calls))
+    return store, calls
+
+
+def test_iter_children_pages_by_key(rtdb):
+    store, calls = rtdb
+    store["/d/SPX"] = {f"k{i:02d}": {"ts": i} for i in range(7)}
+
+    out = list(firebase.iter_children("/d/SPX", chunk_size=3))
+    assert [k for k, _ in out] == [f"k{i:02d}" for i in range(7)]
+    assert out[6] == ("k06", {"ts": 6})
+    assert calls == [(None, 3), ("k02", 4), ("k05", 4)]
+
+
+def test_iter_children_exact_multiple_and_empty(rtdb):
+    store, calls = rtdb
+    store["/d/GHN"] = {"a": 1, "b": 2}
+    assert list(firebase.iter_children("/d/GHN", chunk_size=2)) == [("a", 1), ("b", 2)]
+    assert calls == [(None, 2), ("b", 3)]
+    assert list(firebase.iter_children("/d/none", chunk_size=2)) == []
+
+
+def test_count_children(rtdb):
+    store, _ = rtdb
+    store["/d/Data-cancel/SPX"] = {"a": {}, "b": {}}
+    assert firebase.count_children("/d/Data-cancel/SPX") == 2
+    assert firebase.count_children("/d/Data-cancel/GHN") == 0
@@ -0,0 +1,122 @@
+from types import SimpleNamespace
+
+from utils import handover_live
+from utils.report import collect_handover
+from utils.handover_live import HandoverDay, HandoverLive, ScanTree
+
+
+def _ev(event_type, path, data):
+    return SimpleNamespace(event_type=event_type, path=path, data=data)
+
+
+def _ids(tree, ch):
+    return [oid for oid, _ in tree.sorted_items(ch)]
+
+
+def test_scan_tree_put_patch_and_field_writes():
+    t = ScanTree()
+    t.apply("put", "/", {"SPX": {"a": {"ts": 1}, "b": {"ts": 3}}, "GHN": {"c": {"ts": 2}}})
+    assert t.synced
+    assert t.non_cancel == {"SPX": 2, "GHN": 1} and t.cancelled == {}
+    assert _ids(t, "SPX") == ["b", "a"]
+
+    t.apply("put", "/SPX/d", {"ts": 5})
+    t.apply("put", "/SPX/a/is_cancelled", "Yes")
+    t.apply("patch", "/GHN", {"c": None, "e/ts": 4})
+    assert t.non_cancel == {"SPX": 2, "GHN": 1} and t.cancelled == {"SPX": 1}
+    assert _ids(t, "SPX") == ["d", "b", "a"]
+    assert t.channels["GHN"] == {"e": {"ts": 4}}
+
+    # put "/" lần nữa thay cả cây: kênh không còn -> xoá hết
+    t.apply("put", "/", {"SPX": {"b": {"ts": 3}}})
+    assert t.non_cancel == {"SPX": 1, "GHN": 0} and t.cancelled == {"SPX": 0}
+    assert _ids(t, "SPX") == ["b"] and _ids(t, "GHN") == []
+
+
+def test_day_snapshot_and_listener_cancel():
+    day = HandoverDay("17/10")
+    on_scan, on_cancel = day.listener(day.scan, "DATA_SCAN"), day.listener(day.cancel, "Data-cancel")
+    on_scan(_ev("put", "/", {"SPX": {"a": {"ts": 1}, "b": {"ts": 2, "is_cancelled": "Yes"}}}))
+    assert not day.ready
+    on_cancel(_ev("put", "/", {"GHN": {"x": {"ts": 1}}}))
+    assert day.ready
+
+    snap = day.snapshot()
+    assert snap["non_cancel"] == {"SPX": 1, "GHN": 0}
+    assert snap["cancelled"] == 1
+    assert snap["cancel_counts"] == {"SPX": 0, "GHN": 1}
+    assert [oid for oid, _ in snap["items"]["SPX"]] == ["b", "a"]
+    assert day.snapshot(items=False)["items"] is None
+
+    on_scan(_ev("auth_revoked", "/", None))
+    assert not day.ready
+
+
+class _Ref:
+    def __init__(self, log):
+        self.log = log
+
+    def listen(self, cb):
+        self.log.append(cb)
+        return SimpleNamespace(close=lambda: self.log.append("close"))
+
+
+def test_live_resubscribes_when_not_ready_after_grace(monkeypatch):
+    log = []
+    now = [1000.0]
+    monkeypatch.setattr(handover_live, "today_short", lambda: "17/10")
+    monkeypatch.setattr(handover_live.time, "time", lambda: now[0])
+    live = HandoverLive(lambda path: _Ref(log), resync_after=120)
+
+    live._check()
+    first = live._day
+    assert len(log) == 2
+
+    # Chưa sync nhưng còn trong grace -> giữ nguyên
+    now[0] += 60
+    live._check()
+    assert live._day is first
+
+    # Quá grace mà vẫn chưa ready -> đóng listener cũ, subscribe lại
+    now[0] += 61
+    live._check()
+    assert live._day is not first
+    assert log[2:4] == ["close", "close"] and len(log) == 6
+
+    # Đã ready -> không đụng tới dù lâu
+    for cb, data in zip(log[4:], ({"SPX": {}}, {})):
+        cb(_ev("put", "/", data))
+    now[0] += 3600
+    day = live._day
+    live._check()
+    assert live._day is day and day.ready
+
+    # Listener bị cancel -> re-subscribe ở lần check sau
+    log[4](_ev("cancel", "/", None))
+    live._check()
+    assert live._day is not day
+
+
+def test_live_switches_on_new_day(monkeypatch):
+    log = []
+    today = ["17/10"]
+    monkeypatch.setattr(handover_live, "today_short", lambda: today[0])
+    live = HandoverLive(lambda path: _Ref(log))
+    live._check()
+    today[0] = "18/10"
+    live._check()
+    assert live._day.date_str == "18/10"
+
+
+def test_live_and_rtdb_paths_count_the_same():
+    data = {"SPX": {"a": {"ts": 2}, "b": {"ts": 1, "is_cancelled": "Yes"}},
+            "GHN": {"c": {"ts": 3}},
+            "J&T": {"x": {"ts": 4, "is_cancelled": "Yes"}, "y": {"ts": 5}}}   # kênh ngoài CHANNELS
+    day = HandoverDay("17/10")
+    day.scan.apply("put", "/", data)
+    snap = day.snapshot()
+
+    per_ch, cancelled, rows = collect_handover({ch: items.items() for ch, items in data.items()})
+    assert (snap["non_cancel"], snap["cancelled"]) == (per_ch, cancelled) == ({"SPX": 1, "GHN": 1}, 1)
+    assert {ch: [oid for oid, _ in items] for ch, items in snap["items"].items()} == \
+        {ch: [oid for oid, _ in items] for ch, items in rows.items()}
@@ -0,0 +1,69 @@
+import pytest
+
+from utils import http_client
+from tests.helpers import FakeResponse
+
+BODY = bytes(range(256)) * 40
+
+
+class _Cut(FakeResponse):
+    """Response whose body stream breaks after `cut` bytes"""
+
+    def __init__(self, cut, **kw):
+        super().__init__(**kw)
+        self.cut = cut
+
+    def iter_content(self, chunk_size=1):
+        yield self.content[:self.cut]
+        raise ConnectionError("connection reset")
+
+
+def _serve(monkeypatch, responses):
+    sent = []
+
+    def fake(method, url, headers=None, timeout=None, **kw):
+        sent.append(dict(headers or {}))
+        return responses.pop(0)
+
+    monkeypatch.setattr(http_client, "request", fake)
+    monkeypatch.setattr(http_client.time, "sleep", lambda s: None)
+    return sent
+
+
+def test_retry_resumes_with_range(monkeypatch):
+    sent = _serve(monkeypatch, [
+        _Cut(1000, content=BODY, headers={"Content-Length": str(len(BODY)), "Accept-Ranges": "bytes"}),
+        FakeResponse(206, content=BODY[1000:],
+                     headers={"Content-Range": f"bytes 1000-{len(BODY) - 1}/{len(BODY)}"}),
+    ])
+    with http_client.download("https://x/f.xlsx", retries=3) as f:
+        assert f.read() == BODY
+    assert "Range" not in sent[0]
+    assert sent[1]["Range"] == "bytes=1000-"
+
+
+def test_range_ignored_restarts_from_zero(monkeypatch):
+    sent = _serve(monkeypatch, [
+        _Cut(1000, content=BODY, headers={"Content-Length": str(len(BODY)), "Accept-Ranges": "bytes"}),
+        FakeResponse(200, content=BODY, headers={"Content-Length": str(len(BODY))}),
+    ])
+    with http_client.download("https://x/f.xlsx") as f:
+        assert f.read() == BODY
+    assert sent[1]["Range"] == "bytes=1000-"
+
+
+def test_encoded_body_is_not_resumed(monkeypatch):
+    sent = _serve(monkeypatch, [
+        _Cut(1000, content=BODY, headers={"Content-Encoding": "gzip", "Accept-Ranges": "bytes"}),
+        FakeResponse(200, content=BODY, headers={"Content-Encoding": "gzip"}),
+    ])
+    with http_client.download("https://x/f.xlsx") as f:
+        assert f.read() == BODY
+    assert "Range" not in sent[1]
+
+
+def test_short_body_fails_after_retries(monkeypatch):
+    short = lambda: FakeResponse(200, content=BODY[:10], headers={"Content-Length": str(len(BODY))})
+    _serve(monkeypatch, [short(), short()])
+    with pytest.raises(IOError, match="Incomplete download"):
+        http_client.download("https://x/f.xlsx", retries=2)
@@ -0,0 +1,42 @@
+import threading
+import time
+
+from utils.jobs import JobStore
+
+
+def test_job_runs_in_background_with_progress():
+    store = JobStore(workers=1, ttl=60)
+    gate = threading.Event()
+
+    def work(job):
+        job.update("VNDB", stage="export", percentage=10)
+        gate.wait(2)
+        job.update("VNDB", stage="done", orders=3)
+        return {"orders": 3}
+
+    job = store.submit("sdd", work)
+    version = job.wait_change(0, timeout=2)
+    assert job.status == "running" and version > 0
+    assert not job.wait(timeout=0.05)
+
+    gate.set()
+    assert job.wait(timeout=2)
+    state = job.to_dict()
+    assert state["status"] == "done"
+    assert state["progress"] == {"VNDB": {"stage": "done", "percentage": 10, "orders": 3}}
+    assert job.result == {"orders": 3}
+    assert store.get(job.id) is job
+
+
+def test_job_error_and_expiry():
+    store = JobStore(workers=1, ttl=0.05)
+
+    def boom(job):
+        raise RuntimeError("cookie expired")
+
+    job = store.submit("sdd", boom)
+    assert job.wait(timeout=2)
+    assert job.status == "error" and job.error == "RuntimeError: cookie expired"
+
+    time.sleep(0.1)
+    assert store.get(job.id) is None
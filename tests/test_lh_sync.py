@@ -0,0 +1,118 @@
+import time
+
+import pytest
+
+from utils import lh_sync, lh_trips
+
+# Cửa sổ "hôm nay" (ngày đã qua thì sync incremental không gọi upstream)
+NOW = int(time.time())
+TODAY = (NOW - 3600, NOW + 3600)
+OTHER_DAY = (NOW - 90000, NOW - 3601)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fake trip list: state["trips"] is the whole day, mtime_from requests get state["modified"]"""
+    state = {"trips": [], "modified": [], "calls": []}
+
+    def fake_fetch_trips(kind, headers, from_time, to_time, mtime_from=None):
+        state["calls"].append((kind, mtime_from is not None))
+        return list(state["modified"] if mtime_from else state["trips"])
+
+    monkeypatch.setattr(lh_trips, "fetch_trips", fake_fetch_trips)
+    monkeypatch.setattr(lh_sync, "LH_SYNC_MIN_INTERVAL", 0)
+    lh_sync._tables.clear()
+    return state
+
+
+def _t(i, qty=0):
+    return {"id": i, "trip_number": f"LT{i}", "load_quantity": qty}
+
+
+def _sync(since=None, kinds=("outbound",), day=TODAY):
+    res = lh_sync.sync_trips({}, day[0], day[1], kinds, since=since)
+    version = min(r["version"] for r in res.values())
+    return res, lh_sync.make_cursor(version, kinds, *day)
+
+
+def test_incremental_delta_after_full(upstream):
+    upstream["trips"] = [_t(1), _t(2)]
+    res, cursor = _sync()
+    assert res["outbound"]["full"] and [t["id"] for t in res["outbound"]["trips"]] == [1, 2]
+
+    upstream["modified"] = [_t(2, qty=5), _t(3)]
+    res, cursor2 = _sync(cursor)
+    section = res["outbound"]
+    assert not section["full"]
+    assert sorted(t["id"] for t in section["trips"]) == [2, 3]
+    assert upstream["calls"] == [("outbound", False), ("outbound", True)]
+
+    # Không có gì đổi -> delta rỗng, cursor giữ nguyên
+    upstream["modified"] = []
+    res, cursor3 = _sync(cursor2)
+    assert res["outbound"]["trips"] == [] and cursor3 == cursor2
+
+
+def test_full_sync_reports_removed_trips(upstream):
+    upstream["trips"] = [_t(1), _t(2)]
+    _, cursor = _sync()
+    upstream["trips"] = [_t(2)]
+    lh_sync.get_table("outbound", *TODAY).sync({}, force_full=True)
+
+    res, _ = _sync(cursor)
+    assert res["outbound"]["removed"] == [1]
+
+
+@pytest.mark.parametrize("kinds, day", [
+    (("handover",), TODAY),             # cursor của kind khác
+    (("outbound",), OTHER_DAY),         # cursor của ngày khác
+    (("outbound", "handover"), TODAY),
+])
+def test_cursor_from_another_table_forces_full_resync(upstream, kinds, day):
+    upstream["trips"] = [_t(1)]
+    _, cursor = _sync()
+    assert lh_sync.parse_cursor(cursor, ("outbound",), *TODAY) is not None
+    assert lh_sync.parse_cursor(cursor, kinds, *day) is None
+
+    res, _ = _sync(cursor, kinds=kinds, day=day)
+    assert all(section["full"] for section in res.values())
+
+
+def test_cursor_from_previous_process_is_rejected():
+    assert lh_sync.parse_cursor("deadbeef.outbound.100.200.3", ("outbound",), 100, 200) is None
+    assert lh_sync.parse_cursor("", ("outbound",), 100, 200) is None
+
+
+def test_cursor_keeps_change_merged_into_other_kind_mid_request(upstream, monkeypatch):
+    import threading
+
+    kinds = ("outbound", "handover")
+    upstream["trips"] = [_t(1)]
+    _, cursor = _sync(kinds=kinds)
+
+    handover_read = threading.Event()
+    real_delta = lh_sync.TripTable.delta
+
+    def delta(self, since):
+        out = real_delta(self, since)
+        if self.kind == "handover":
+            handover_read.set()
+        return out
+
+    def fetch(kind, headers, from_time, to_time, mtime_from=None):
+        if kind == "outbound":
+            # Request khác merge vào bảng handover sau khi request này đã đọc handover
+            assert handover_read.wait(5)
+            lh_sync.get_table("handover", *TODAY)._merge([_t(9)], full=False)
+            return [_t(5)]
+        return []
+
+    monkeypatch.setattr(lh_sync.TripTable, "delta", delta)
+    monkeypatch.setattr(lh_trips, "fetch_trips", fetch)
+    res, cursor = _sync(cursor, kinds=kinds)
+    assert [t["id"] for t in res["outbound"]["trips"]] == [5]
+    assert 9 not in [t["id"] for t in res["handover"]["trips"]]
+
+    # Cursor = min -> lần sau vẫn nhận trip 9 (có thể nhận lại vài trip cũ, upsert nên vô hại)
+    res, _ = _sync(cursor, kinds=kinds)
+    assert 9 in [t["id"] for t in res["handover"]["trips"]]
@@ -0,0 +1,157 @@
+import threading
+
+import pytest
+
+from utils import http_client, lh_trips
+from tests.helpers import FakeResponse
+
+
+@pytest.fixture(autouse=True)
+def _fresh(monkeypatch):
+    monkeypatch.setattr(lh_trips.time, "sleep", lambda s: None)
+    for cache in (lh_trips._to_detail_cache, lh_trips._parcel_count_cache, lh_trips._run_sheet_cache):
+        cache.clear()
+
+
+def _ok(data):
+    return FakeResponse(json={"retcode": 0, "data": data})
+
+
+def test_remaining_pages_in_order_with_per_page_retry(monkeypatch):
+    calls = []
+    lock = threading.Lock()
+
+    def fake_get(url, params=None, **kwargs):
+        page = params["pageno"]
+        with lock:
+            calls.append(page)
+            first_try = calls.count(page) == 1
+        if page == 3 and first_try:
+            return FakeResponse(json={"retcode": 1, "message": "busy"})
+        return _ok({"list": [{"to_number": f"TO{page}"}]})
+
+    monkeypatch.setattr(http_client, "get", fake_get)
+    pages = list(lh_trips.iter_remaining_pages(lh_trips.URL_LOADING_CURRENT, {}, 1, 1, pages=5))
+
+    assert [p["list"][0]["to_number"] for p in pages] == ["TO2", "TO3", "TO4", "TO5"]
+    assert calls.count(3) == 2
+    assert 1 not in calls
+
+
+def test_remaining_pages_raise_when_page_keeps_failing(monkeypatch):
+    def fake_get(url, params=None, **kwargs):
+        if params["pageno"] == 2:
+            return FakeResponse(json={"retcode": 7, "message": "no permission"})
+        return _ok({"list": []})
+
+    monkeypatch.setattr(http_client, "get", fake_get)
+    with pytest.raises(lh_trips.UpstreamError):
+        list(lh_trips.iter_remaining_pages(lh_trips.URL_LOADING_CURRENT, {}, 1, 1, pages=3))
+
+
+def test_single_page_fetches_nothing(monkeypatch):
+    monkeypatch.setattr(http_client, "get", lambda *a, **k: pytest.fail("unexpected call"))
+    assert list(lh_trips.iter_remaining_pages(lh_trips.URL_LOADING_CURRENT, {}, 1, 1, pages=1)) == []
+
+
+def test_expand_items_fetches_each_multi_parcel_to_once(monkeypatch):
+    detail_calls = []
+
+    def fake_get(url, params=None, **kwargs):
+        assert url == lh_trips.URL_TO_DETAIL
+        detail_calls.append(params["to_number"])
+        if params["to_number"] == "BAD":
+            return FakeResponse(status_code=500)
+        n = int(params["to_number"][-1])
+        return _ok({"list": [{"fleet_order_id": f"{params['to_number']}-F{i}"} for i in range(n)]})
+
+    monkeypatch.setattr(http_client, "get", fake_get)
+    items = [
+        {"to_number": "S1", "to_parcel_quantity": 1, "scan_number": "SC1", "to_weight": 1500},
+        {"to_number": "M2", "to_parcel_quantity": 2, "pack_type_name": "Bag", "scan_number": "SC2"},
+        {"to_number": "BAD", "to_parcel_quantity": 3, "pack_type_name": "Bag", "scan_number": "SC3"},
+        {"to_number": "M2", "to_parcel_quantity": 2, "pack_type_name": "Bag", "scan_number": "SC4"},
+    ]
+    rows = lh_trips.expand_items(items, {})
+
+    assert [(r["to_number"], r["pack_type_name"], r["scan_number"]) for r in rows] == [
+        ("S1", "Single", "SC1"),
+        ("M2", "Bag", "M2-F0"), ("M2", "Bag", "M2-F1"),
+        ("BAD", "Bag", "SC3"),
+        ("M2", "Bag", "M2-F0"), ("M2", "Bag", "M2-F1"),
+    ]
+    assert rows[0]["to_weight"] == 1.5
+    assert sorted(detail_calls) == ["BAD", "M2"]
+
+    # TO detail được cache: gọi lại không tốn request (lỗi thì không cache)
+    lh_trips.expand_items(items, {})
+    assert sorted(detail_calls) == ["BAD", "BAD", "M2"]
+
+
+def _trip(i, station=lh_trips.STATION_ID):
+    return {"id": i, "trip_number": f"LT{i}", "trip_station": [{"station": station, "sequence_number": 2,
+                                                               "load_quantity": i, "seal_time": 0}]}
+
+
+def test_fetch_trips_walks_every_page_and_dedupes(monkeypatch):
+    size = lh_trips.TRIP_PAGE_SIZE
+    all_trips = [_trip(i) for i in range(size * 2 + 5)]
+
+    def fake_get(url, params=None, **kwargs):
+        assert url == lh_trips.URL_TRIP_HISTORY_LIST
+        p = params["pageno"]
+        page = all_trips[(p - 1) * size:p * size]
+        if p == 2:
+            page = page + all_trips[:1]   # trang chồng nhau khi list đổi giữa các lần gọi
+        return _ok({"list": page, "total": len(all_trips)})
+
+    monkeypatch.setattr(http_client, "get", fake_get)
+    trips = lh_trips.fetch_trips("outbound", {}, 0, 1)
+
+    assert [t["id"] for t in trips] == list(range(len(all_trips)))
+    assert trips[3] == {
+        "id": 3, "trip_number": "LT3", "kind": "outbound", "driver_name": "", "seal_time": "",
+        "loading_time": "", "sequence_number": 2, "load_quantity": 3, "to_parcel_quantity": 0,
+        "vehicle_number": "", "vehicle_type_name": "",
+    }
+
+
+def test_fetch_trips_without_total_pages_until_short_page(monkeypatch):
+    size = lh_trips.TRIP_PAGE_SIZE
+    pages = {1: [_trip(i) for i in range(size)], 2: [_trip(size + i, station=1) for i in range(3)]}
+    seen = []
+
+    def fake_get(url, params=None, **kwargs):
+        seen.append(params["pageno"])
+        return _ok({"list": pages.get(params["pageno"], [])})
+
+    monkeypatch.setattr(http_client, "get", fake_get)
+    trips = lh_trips.fetch_trips("handover", {}, 0, 1)
+
+    assert seen == [1, 2]
+    assert len(trips) == size + 3
+    assert trips[-1]["kind"] == "handover" and trips[-1]["load_quantity"] == size + 2
+
+
+def test_list_trips_returns_errors_per_kind(monkeypatch):
+    def fake_get(url, params=None, **kwargs):
+        if url == lh_trips.URL_TRIP_LIST:
+            return FakeResponse(json={"retcode": 3, "message": "denied"})
+        return _ok({"list": [_trip(1)], "total": 1})
+
+    monkeypatch.setattr(http_client, "get", fake_get)
+    res = lh_trips.list_trips({}, 0, 1)
+
+    assert [t["id"] for t in res["outbound"]] == [1]
+    assert isinstance(res["handover"], lh_trips.UpstreamError)
+
+
+def test_normalize_trip_station_fallback_only_for_handover():
+    trip = {"id": 1, "trip_number": "LT1",
+            "trip_station": [{"station": 100, "load_quantity": 7, "sequence_number": 2}]}
+    assert lh_trips.normalize_trip(trip, "handover")["load_quantity"] == 7
+    row = lh_trips.normalize_trip(trip, "outbound")
+    assert (row["load_quantity"], row["sequence_number"], row["seal_time"]) == (0, 1, "")
+
+    trip["trip_station"].append({"station": lh_trips.STATION_ID, "load_quantity": 3})
+    assert lh_trips.normalize_trip(trip, "outbound")["load_quantity"] == 3
@@ -0,0 +1,94 @@
+import os
+import time
+
+from utils.outbox import Outbox
+
+
+def _wait(cond, timeout=3.0):
+    deadline = time.time() + timeout
+    while not cond() and time.time() < deadline:
+        time.sleep(0.01)
+    return cond()
+
+
+def test_delivers_and_reports_sent(tmp_path):
+    got = []
+    box = Outbox(str(tmp_path), {"text": lambda p, att: got.append(p["text"])}, base_delay=0.01)
+    msg_id = box.put("text", {"text": "hi"})
+
+    assert _wait(lambda: box.status(msg_id)["state"] == "sent")
+    assert got == ["hi"]
+    assert os.listdir(tmp_path) == []
+    assert box.status("nope")["state"] == "unknown"
+
+
+def test_retries_then_delivers_attachment(tmp_path):
+    calls = []
+
+    def handler(payload, att):
+        with open(att, "rb") as f:
+            calls.append(f.read())
+        if len(calls) < 3:
+            raise RuntimeError("HTTP 502")
+
+    box = Outbox(str(tmp_path), {"file": handler}, base_delay=0.01)
+    msg_id = box.put("file", {"filename": "a.xlsx"}, data=b"xlsx")
+
+    assert _wait(lambda: box.status(msg_id)["state"] == "sent")
+    assert calls == [b"xlsx"] * 3
+
+
+def test_gives_up_after_max_attempts(tmp_path):
+    def handler(payload, att):
+        raise RuntimeError("HTTP 500")
+
+    box = Outbox(str(tmp_path), {"text": handler}, max_attempts=2, base_delay=0.01)
+    msg_id = box.put("text", {"text": "hi"})
+
+    assert _wait(lambda: box.status(msg_id)["state"] == "failed")
+    assert box.status(msg_id) == {"state": "failed", "attempts": 2, "error": "HTTP 500"}
+    assert box.stats() == {"pending": 0, "failed": 1}
+
+
+def test_disk_error_does_not_kill_worker(tmp_path, monkeypatch):
+    box = Outbox(str(tmp_path), {"text": lambda p, att: None}, base_delay=0.01)
+    real_remove = os.remove
+    broken = [True]
+
+    def remove(path):
+        if broken[0]:
+            broken[0] = False
+            raise PermissionError("busy")
+        real_remove(path)
+
+    monkeypatch.setattr(os, "remove", remove)
+    first = box.put("text", {"text": "a"})
+    assert _wait(lambda: box.status(first)["state"] == "sent")
+    second = box.put("text", {"text": "b"})
+    assert _wait(lambda: box.status(second)["state"] == "sent")
+    assert box._worker.is_alive()
+
+
+def test_resumes_messages_left_on_disk(tmp_path):
+    Outbox(str(tmp_path), {"text": lambda p, att: None})._save(
+        {"id": "1-abc", "kind": "text", "payload": {"text": "old"}, "attachment": None,
+         "attempts": 3, "next_at": time.time() + 3600, "created_at": 1, "error": "x"})
+    got = []
+    box = Outbox(str(tmp_path), {"text": lambda p, att: got.append(p["text"])})
+    box.start()
+
+    assert _wait(lambda: box.status("1-abc")["state"] == "sent")
+    assert got == ["old"]
+
+
+def test_status_route_404_for_unknown_id(tmp_path, monkeypatch):
+    from routes import report
+    from tests.helpers import make_app
+
+    box = Outbox(str(tmp_path), {"text": lambda p, att: None})
+    monkeypatch.setattr(report.seatalk, "outbox", box)
+    client = make_app(report.bp, "/api/report").test_client()
+
+    r = client.get("/api/report/seatalk/1-missing")
+    assert r.status_code == 404
+    assert r.get_json()["state"] == "unknown"
@@ -0,0 +1,38 @@
+from utils.regions import RegionClassifier, norm_vn_name
+
+TABLE = {
+    "DN": r"\bda\s*nang\b|\bdanang\b",
+    "HUE": r"\bhue\b|\bthua\s*thien\s*hue\b",
+}
+
+
+def test_norm_vn_name():
+    assert norm_vn_name("TP Đà Nẵng") == "da nang"
+    assert norm_vn_name("Tỉnh Thừa Thiên-Huế") == "thua thien hue"
+    assert norm_vn_name(None) == ""
+
+
+def test_classify_first_matching_region():
+    rc = RegionClassifier(TABLE)
+    assert rc.classify("Thành phố Đà Nẵng") == "DN"
+    assert rc.classify("Danang") == "DN"
+    assert rc.classify("Thừa Thiên Huế") == "HUE"
+    assert rc.classify("Hà Nội") == ""
+    assert rc.classify(None) == ""
+
+
+def test_each_distinct_value_normalized_once(monkeypatch):
+    import utils.regions as regions
+
+    seen = []
+    real = regions.norm_vn_name
+    monkeypatch.setattr(regions, "norm_vn_name", lambda v: seen.append(v) or real(v))
+    rc = RegionClassifier(TABLE, max_memo=2)
+
+    for v in ["Đà Nẵng", "Huế", "Đà Nẵng", "Huế"]:
+        rc.classify(v)
+    assert seen == ["Đà Nẵng", "Huế"]
+
+    # Quá max_memo -> xoá memo, vẫn phân loại đúng
+    assert rc.classify("Hà Nội") == "" and rc.classify("Đà Nẵng") == "DN"
+    assert len(rc._memo) <= 2
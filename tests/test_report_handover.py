@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from routes import report
+from utils.file_cache import ArtifactStore
+from tests.helpers import make_app
+
+DIGEST = "0123456789abcdef" * 4
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=1 << 20)
+    store.put(DIGEST, lambda f: f.write(b"PK-xlsx-bytes"), suffix=".xlsx")
+    monkeypatch.setattr(report, "_artifacts", store)
+    return make_app(report.bp, "/api/report").test_client()
+
+
+def test_artifact_served_with_digest_etag(client):
+    r = client.get(f"/api/report/artifacts/{DIGEST}.xlsx?name=../Handover.xlsx")
+    assert r.status_code == 200
+    assert r.data == b"PK-xlsx-bytes"
+    assert r.headers["ETag"] == f'"{DIGEST}"'
+    assert "Handover.xlsx" in r.headers["Content-Disposition"]
+    assert "../" not in r.headers["Content-Disposition"]
+
+    assert client.get(f"/api/report/artifacts/{DIGEST}.xlsx",
+                      headers={"If-None-Match": f'"{DIGEST}"'}).status_code == 304
+    r = client.get(f"/api/report/artifacts/{DIGEST}.xlsx", headers={"Range": "bytes=0-1"})
+    assert r.status_code == 206 and r.data == b"PK"
+
+
+@pytest.mark.parametrize("digest", ["fedcba9876543210" * 4, "not-a-digest"])
+def test_artifact_missing_or_invalid_is_404(client, digest):
+    assert client.get(f"/api/report/artifacts/{digest}.xlsx").status_code == 404
+
+
+def test_run_builds_report_from_live_snapshot(client, monkeypatch):
+    from types import SimpleNamespace
+    from utils.handover_live import HandoverDay
+
+    day = HandoverDay("17/10")
+    day.scan.apply("put", "/", {"SPX": {"a": {"ts": 1}, "b": {"ts": 2}}, "GHN": {"c": {"is_cancelled": "Yes"}}})
+    monkeypatch.setattr(report, "_live", SimpleNamespace(get=lambda d: day))
+    queued = []
+    monkeypatch.setattr(report.seatalk, "queue_text", lambda text: queued.append(text) or "t1")
+    monkeypatch.setattr(report.seatalk, "queue_file",
+                        lambda path, name, caption="": queued.append(name) or "f1")
+
+    r = client.post("/api/report/run", json={"date": "17/10"})
+    body = r.get_json()
+    assert r.status_code == 200 and body["ok"]
+    assert body["counters"] == {"per_channel_non_cancel": {"SPX": 2, "GHN": 0},
+                                "total_cancel": 1, "total_non_cancel": 2}
+    assert body["seatalk"]["file"]["id"] == "f1"
+    assert client.get(body["file_url"]).status_code == 200
+
+
+def test_run_queues_artifact_evicted_before_queue(client, monkeypatch, tmp_path):
+    from types import SimpleNamespace
+    from utils.handover_live import HandoverDay
+    from utils.outbox import Outbox
+
+    day = HandoverDay("17/10")
+    day.scan.apply("put", "/", {"SPX": {"a": {"ts": 1}}})
+    monkeypatch.setattr(report, "_live", SimpleNamespace(get=lambda d: day))
+    sent = []
+    box = Outbox(str(tmp_path / "outbox"), {"text": lambda p, att: None,
+                                            "file": lambda p, att: sent.append(open(att, "rb").read())})
+    monkeypatch.setattr(report.seatalk, "outbox", box)
+    monkeypatch.setattr(report.seatalk, "WEBHOOK_URL", "https://hook")
+
+    real_queue_file = report.seatalk.queue_file
+
+    def queue_file(*args, **kwargs):
+        # put của request khác evict file ngay trước khi queue
+        report._artifacts.max_bytes = 0
+        report._artifacts.evict()
+        return real_queue_file(*args, **kwargs)
+
+    monkeypatch.setattr(report.seatalk, "queue_file", queue_file)
+    body = client.post("/api/report/run", json={"date": "17/10"}).get_json()
+    assert body["seatalk"]["file"]["ok"], body["seatalk"]["error"]
+
+    deadline = time.time() + 3
+    while not sent and time.time() < deadline:
+        time.sleep(0.01)
+    assert sent and sent[0].startswith(b"PK")
@@ -0,0 +1,177 @@
+import pytest
+
+from routes import report
+from utils import http_client, lh_trips
+from tests.helpers import FakeResponse, make_app
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(lh_trips.time, "sleep", lambda s: None)
+    lh_trips._parcel_count_cache.clear()
+    report._report_cache.clear()
+    return make_app(report.bp, "/api/report").test_client()
+
+
+def test_batch_parcel_counts_keep_order_and_isolate_failures(client, monkeypatch):
+    calls = []
+
+    def fake_get(url, params=None, **kwargs):
+        calls.append((url, params["trip_id"]))
+        if params["trip_id"] == 2:
+            return FakeResponse(json={"retcode": 9, "message": "trip not found"})
+        return FakeResponse(json={"retcode": 0, "data": {"total_parcel": params["trip_id"] * 10}})
+
+    monkeypatch.setattr(http_client, "get", fake_get)
+    resp = client.post("/api/report/LH_get_parcel_counts", json={"items": [
+        {"trip_id": 1, "seq": 1, "kind": "outbound"},
+        [2, 1, "handover"],
+        {"trip_id": 3, "kind": "handover"},
+        {"trip_id": 1, "seq": 1, "kind": "outbound"},
+    ]})
+    body = resp.get_json()
+
+    assert resp.status_code == 200
+    assert [r["trip_id"] for r in body["results"]] == [1, 2, 3, 1]
+    assert [r.get("total_parcel") for r in body["results"]] == [10, None, 30, 10]
+    assert body["failed"] == 1 and not body["results"][1]["ok"]
+    assert (lh_trips.URL_LOADING_CURRENT, 3) in calls
+    # Trip lặp lại trong batch dùng chung kết quả đã cache
+    assert calls.count((lh_trips.URL_LOADING_HISTORY, 1)) == 1
+
+
+def test_batch_parcel_counts_rejects_bad_items(client):
+    resp = client.post("/api/report/LH_get_parcel_counts", json={"items": [{"trip_id": 1, "kind": "inbound"}]})
+    assert resp.status_code == 400
+
+
+def _fake_loading_list(monkeypatch, total=60):
+    def fake_get(url, params=None, **kwargs):
+        p, count = params["pageno"], params["count"]
+        items = [{"to_number": f"TO{i}", "to_parcel_quantity": 1, "scan_number": f"SC{i}",
+                  "operator": "op", "to_weight": 1000, "ctime": 1700000000 + i}
+                 for i in range((p - 1) * count, min(p * count, total))]
+        return FakeResponse(json={"retcode": 0, "data": {"list": items, "total": total, "count": count,
+                                                         "total_parcel": total}})
+
+    monkeypatch.setattr(http_client, "get", fake_get)
+
+
+def test_get_list_streaming_csv_matches_buffered(client, monkeypatch):
+    _fake_loading_list(monkeypatch)
+    streamed = client.get("/api/report/LH_get_list/7/LT7?stream=1")
+    buffered = client.get("/api/report/LH_get_list/7/LT7")
+
+    assert streamed.status_code == buffered.status_code == 200
+    assert streamed.is_streamed
+    assert "LT7_60_60.csv" in streamed.headers["Content-Disposition"]
+    body = streamed.get_data()
+    assert body == buffered.get_data()
+
+    lines = body.decode("utf-8-sig").splitlines()
+    assert lines[0] == "to_number,pack_type_name,scan_number,operator,to_weight,ctime"
+    assert len(lines) == 61
+    assert lines[1] == "TO0,Single,SC0,op,1.0,2023-11-15 05:13:20"
+
+
+def test_download_pdf_served_from_cache_handle(client, monkeypatch, tmp_path):
+    from utils.file_cache import DiskLRUCache
+
+    monkeypatch.setattr(report, "_pdf_cache", DiskLRUCache(str(tmp_path), 1 << 20))
+    pdf = b"%PDF-1.4 " + b"x" * 1000
+    upstream = []
+
+    def fake_get(url, params=None, **kwargs):
+        upstream.append(url)
+        if url == lh_trips.URL_RUN_SHEET_LIST:
+            return FakeResponse(json={"retcode": 0, "data": {"list": [
+                {"station_id": 2259, "sheet_url": "/files/rs_9.pdf"}]}})
+        return FakeResponse(content=pdf, headers={"Content-Length": str(len(pdf))})
+
+    monkeypatch.setattr(http_client, "get", fake_get)
+    lh_trips._run_sheet_cache.clear()
+
+    first = client.get("/api/report/LH_download_pdf/9")
+    assert first.get_data() == pdf
+
+    opened = []
+    real_open = report._pdf_cache.open
+
+    def open_then_evict(*a, **k):
+        # evict() ở thread khác xoá file ngay sau khi đã mở handle
+        f = real_open(*a, **k)
+        opened.append(f)
+        report._pdf_cache.max_bytes = 0
+        report._pdf_cache.evict()
+        return f
+
+    monkeypatch.setattr(report._pdf_cache, "open", open_then_evict)
+    second = client.get("/api/report/LH_download_pdf/9")
+
+    assert second.status_code == 200
+    assert second.get_data() == pdf
+    assert second.headers["Content-Length"] == str(len(pdf))
+    assert opened and upstream.count("https://spx.shopee.vn/files/rs_9.pdf") == 1
+    second.close()
+
+
+def test_bulk_export_zip_lists_failed_trips(client, monkeypatch):
+    import io
+    import zipfile
+
+    def fake_get(url, params=None, **kwargs):
+        if params["trip_id"] == 2:
+            return FakeResponse(json={"retcode": 5, "message": "trip gone"})
+        items = [{"to_number": f"TO{params['trip_id']}", "to_parcel_quantity": 1, "ctime": 0}]
+        return FakeResponse(json={"retcode": 0, "data": {"list": items, "total": 1, "total_parcel": 1}})
+
+    monkeypatch.setattr(http_client, "get", fake_get)
+    resp = client.post("/api/report/LH_bulk_export", json={"pdf": False, "name": "LH_test", "trips": [
+        {"trip_id": 1, "trip_number": "LT1"},
+        {"trip_id": 2, "trip_number": "LT2"},
+        {"trip_id": 3, "trip_number": "LT1"},
+    ]})
+
+    assert resp.status_code == 200
+    assert "LH_test.zip" in resp.headers["Content-Disposition"]
+    zf = zipfile.ZipFile(io.BytesIO(resp.get_data()))
+    names = sorted(zf.namelist())
+    assert names == ["LT1_1_1 (2).csv", "LT1_1_1.csv", "_errors.txt"]
+    assert zf.read("_errors.txt").decode() == "LT2 CSV: trip gone\n"
+    bodies = sorted(zf.read(n).decode("utf-8-sig").splitlines()[1].split(",")[0] for n in names[:2])
+    assert bodies == ["TO1", "TO3"]
+
+
+def test_lh_trips_cached_with_etag(client, monkeypatch):
+    from utils import lh_sync
+
+    lh_sync._tables.clear()
+    calls = []
+
+    def fake_get(url, params=None, **kwargs):
+        calls.append(url)
+        return FakeResponse(json={"retcode": 0, "data": {"total": 1, "list": [
+            {"id": 1, "trip_number": "LT1", "trip_station": []}]}})
+
+    monkeypatch.setattr(http_client, "get", fake_get)
+    first = client.get("/api/report/LH_trips?kind=outbound&date=2024-01-02")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and first.headers["X-Cache"] == "MISS"
+    assert first.get_json()["outbound"]["total_trips"] == 1
+
+    second = client.get("/api/report/LH_trips?kind=outbound&date=2024-01-02", headers={"If-None-Match": etag})
+    assert second.status_code == 304 and second.headers["X-Cache"] == "HIT"
+    assert len(calls) == 1
+
+
+def test_lh_trips_error_is_not_cached(client, monkeypatch):
+    from utils import lh_sync
+
+    lh_sync._tables.clear()
+    answers = [{"retcode": 2, "message": "busy"},
+               {"retcode": 0, "data": {"total": 0, "list": []}}]
+    monkeypatch.setattr(http_client, "get", lambda url, **k: FakeResponse(json=answers.pop(0)))
+
+    assert client.get("/api/report/LH_trips?kind=handover&date=2024-01-03").get_json()["ok"] is False
+    resp = client.get("/api/report/LH_trips?kind=handover&date=2024-01-03")
+    assert resp.get_json()["ok"] is True and resp.headers["X-Cache"] == "MISS"
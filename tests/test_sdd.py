@@ -0,0 +1,188 @@
+import threading
+import time
+
+import pytest
+
+from routes import sdd
+
+STATUS = {"normal": 1, "oos_picking": 0, "oos_whs": 0}
+
+
+@pytest.fixture(autouse=True)
+def _fresh():
+    sdd._runs.clear()
+
+
+def _fake_run(monkeypatch, results, delay=0.0):
+    calls = []
+
+    def fake(wh, time_from, time_to, lane_filter, time_mode, progress, shard_seconds):
+        calls.append(wh)
+        time.sleep(delay)
+        return results.pop(0)
+
+    monkeypatch.setattr(sdd, "_run_for_wh", fake)
+    return calls
+
+
+def test_identical_runs_share_one_export(monkeypatch):
+    orders = [{"wms_order_no": "SO1"}]
+    calls = _fake_run(monkeypatch, [("VNDB", orders, "", STATUS)], delay=0.1)
+    out = []
+    threads = [threading.Thread(target=lambda: out.append(sdd._run_for_wh_cached("VNDB", 1, 2, "l-vn11"))),
+               threading.Thread(target=lambda: out.append(sdd._run_for_wh_cached("VNDB", 1, 2, "L-VN11 ")))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert out == [("VNDB", orders, "", STATUS)] * 2
+    assert calls == ["VNDB"]
+    # Đã cache: gọi lại không chạy export
+    assert sdd._run_for_wh_cached("VNDB", 1, 2)[1] == orders
+    assert calls == ["VNDB"]
+
+
+def test_refresh_bypasses_cache(monkeypatch):
+    calls = _fake_run(monkeypatch, [("VNDB", [], "", STATUS), ("VNDB", [], "", STATUS)])
+    sdd._run_for_wh_cached("VNDB", 1, 2)
+    sdd._run_for_wh_cached("VNDB", 1, 2, refresh=True)
+    assert calls == ["VNDB", "VNDB"]
+
+
+@pytest.mark.parametrize("failed", [
+    ("VNDB", [], "RuntimeError: Create task failed", {}),
+    ("VNDB", [{"wms_order_no": "SO1"}], "", {}),     # status breakdown lỗi
+])
+def test_failed_or_incomplete_run_is_not_cached(monkeypatch, failed):
+    calls = _fake_run(monkeypatch, [failed, ("VNDB", [], "", STATUS)])
+    assert sdd._run_for_wh_cached("VNDB", 1, 2) == failed
+    assert sdd._run_for_wh_cached("VNDB", 1, 2) == ("VNDB", [], "", STATUS)
+    assert calls == ["VNDB", "VNDB"]
+
+
+def test_status_breakdown_sums_batches_per_warehouse(monkeypatch):
+    from utils import http_client
+    from tests.helpers import FakeResponse
+
+    calls = []
+
+    def fake_post(url, json=None, headers=None, **kwargs):
+        calls.append((headers["wh"], json["order_oos_type"], len(json["order_no_list"])))
+        # VNDB: mọi đơn Normal; VNDL: mọi đơn OOS_WHS
+        hit = (headers["wh"], json["order_oos_type"]) in (("VNDB", 1), ("VNDL", 3))
+        return FakeResponse(json={"data": {"total": len(json["order_no_list"]) if hit else 0}})
+
+    monkeypatch.setattr(http_client, "post", fake_post)
+    orders = [f"SO{i}" for i in range(250)] + ["SO1"]
+
+    vndb = sdd._status_breakdown({"wh": "VNDB"}, orders, batch_size=100)
+    vndl = sdd._status_breakdown({"wh": "VNDL"}, orders, batch_size=100)
+
+    assert vndb == {"normal": 250, "oos_picking": 0, "oos_whs": 0}
+    assert vndl == {"normal": 0, "oos_picking": 0, "oos_whs": 250}
+    assert sorted(n for wh, t, n in calls if wh == "VNDB" and t == 1) == [50, 100, 100]
+    assert len(calls) == 18
+
+
+def test_read_orders_filters_lane_and_region():
+    from tests.helpers import xlsx
+
+    f = xlsx([
+        ["WMS Order No", "Lane Code", "Buyer State", "SKU"],
+        ["SO1", "L-VN11", "TP Đà Nẵng", "a"],
+        ["SO2", "L-VN11", "Hà Nội", "b"],
+        ["SO3", "l-vn12", "Thừa Thiên Huế", "c"],
+        ["SO4", "L-VN11", "Quảng Nam", "d"],
+        [None, "L-VN11", "Huế", "e"],
+    ])
+    orders = sdd._read_orders(f, "VNDB", "L-VN11, L-VN12")
+    assert [o["wms_order_no"] for o in orders] == ["SO1", "SO3", "SO4"]
+    assert orders[0] == {"wms_order_no": "SO1", "buyer_state": "TP Đà Nẵng", "lane_code": "L-VN11",
+                         "warehouse": "VNDB", "status": "Normal", "raw_wms_order_no": "SO1"}
+
+
+@pytest.fixture
+def client():
+    from tests.helpers import make_app
+
+    return make_app(sdd.bp, "/api/report").test_client()
+
+
+def test_job_api_submit_poll_result_and_events(client, monkeypatch):
+    seen = []
+
+    def fake_run_sdd(params, req_id, job=None):
+        seen.append(params)
+        job.update("VNDB", stage="done", orders=1)
+        return {"success": True, "total_orders": 1}
+
+    monkeypatch.setattr(sdd, "_run_sdd", fake_run_sdd)
+    resp = client.post("/api/report/sdd/jobs", json={"time_from": 1, "time_to": 2, "shard_hours": 24})
+    assert resp.status_code == 202
+    job = resp.get_json()
+
+    for _ in range(100):
+        result = client.get(job["result_url"])
+        if result.status_code != 202:
+            break
+        time.sleep(0.01)
+    assert result.status_code == 200 and result.get_json()["total_orders"] == 1
+    assert seen[0]["shard_seconds"] == 24 * 3600
+
+    status = client.get(job["status_url"]).get_json()
+    assert status["status"] == "done" and status["progress"]["VNDB"]["orders"] == 1
+    events = client.get(job["events_url"]).get_data(as_text=True)
+    assert events.startswith("event: done\n")
+
+    assert client.get("/api/report/sdd/jobs/nope").status_code == 404
+    assert client.post("/api/report/sdd/jobs", json={"time_from": 1}).status_code == 400
+
+
+def test_run_timeout_scales_with_shards(monkeypatch):
+    monkeypatch.setattr(sdd, "EXEC_WH_LIMIT", 3)
+    assert sdd._run_timeout(0, 3600, 0) == 300
+    # 4 shards, 3 at a time -> 2 waves
+    assert sdd._run_timeout(0, 4 * 3600, 3600) == 2 * (sdd.MAX_WAIT + sdd.DL_TIMEOUT) + sdd.RUN_MARGIN
+
+
+def test_timed_out_warehouse_reports_error(monkeypatch):
+    from utils.jobs import Job
+
+    release = threading.Event()
+
+    def fake(wh, time_from, time_to, lane_filter, time_mode, refresh, progress, shard_seconds):
+        if wh == "VNDL":
+            release.wait(5)
+            progress("parse", shards=1)   # progress đến sau timeout -> bỏ qua
+            return wh, [], "", STATUS
+        return wh, [{"wms_order_no": "SO1"}], "", STATUS
+
+    monkeypatch.setattr(sdd, "_run_for_wh_cached", fake)
+    monkeypatch.setattr(sdd, "_run_timeout", lambda *a: 0.2)
+    job = Job("sdd")
+    params = {"time_from": 1, "time_to": 2, "lane_filter": "L-VN11", "time_mode": "status", "refresh": False}
+    try:
+        out = sdd._run_sdd(params, "t", job)
+    finally:
+        release.set()
+    time.sleep(0.1)
+
+    assert [o["wms_order_no"] for o in out["vndb_orders"]] == ["SO1"]
+    assert out["vndl_orders"] == []
+    assert out["errors"] == {"VNDL": "Timeout after 0s"}
+    assert job.progress["VNDB"]["stage"] == "done"
+    assert job.progress["VNDL"] == {"stage": "error", "error": "Timeout after 0s"}
+
+
+def test_sharding_is_opt_in(monkeypatch):
+    body = {"time_from": 1, "time_to": 3 * 86400}
+    params, err = sdd._parse_sdd_request(body)
+    assert err is None and params["shard_seconds"] == 0
+
+    params, _ = sdd._parse_sdd_request({**body, "shard_hours": 24})
+    assert params["shard_seconds"] == 24 * 3600
+
+    monkeypatch.setattr(sdd, "SDD_SHARD_HOURS", 12)
+    params, _ = sdd._parse_sdd_request(body)
+    assert params["shard_seconds"] == 12 * 3600
@@ -0,0 +1,46 @@
+import pytest
+
+from utils import seatalk, http_client
+from tests.helpers import FakeResponse
+
+
+@pytest.fixture
+def accepted(monkeypatch, tmp_path):
+    path = str(tmp_path / "accepted_variants.state")
+    monkeypatch.setattr(seatalk, "ACCEPTED_PATH", path)
+    monkeypatch.setattr(seatalk, "_accepted", {})
+    monkeypatch.setattr(seatalk, "WEBHOOK_URL", "https://hook")
+    return path
+
+
+def test_queue_without_webhook_fails_at_once(monkeypatch):
+    monkeypatch.setattr(seatalk, "WEBHOOK_URL", "")
+    with pytest.raises(RuntimeError, match="WEBHOOK_URL"):
+        seatalk.queue_text("hi")
+    with pytest.raises(RuntimeError, match="WEBHOOK_URL"):
+        seatalk.queue_file(b"x", "a.xlsx")
+
+
+def test_accepted_variant_survives_restart(monkeypatch, accepted):
+    bodies = []
+
+    def fake_post(url, json=None, data=None, **kwargs):
+        bodies.append(json or data)
+        return FakeResponse(200 if data == {"content": "hi"} else 400)
+
+    monkeypatch.setattr(http_client, "post", fake_post)
+    assert seatalk.seatalk_text("hi")["variant"] == "form_content"
+    assert len(bodies) == 4
+
+    # "Restart": bảng variant nạp lại từ đĩa -> variant đã nhận được thử đầu tiên
+    monkeypatch.setattr(seatalk, "_accepted", seatalk._load_accepted(accepted))
+    bodies.clear()
+    assert seatalk.seatalk_text("hi")["variant"] == "form_content"
+    assert bodies == [{"content": "hi"}]
+
+
+def test_unreadable_state_is_ignored(tmp_path):
+    path = tmp_path / "accepted_variants.state"
+    path.write_text("{not json")
+    assert seatalk._load_accepted(str(path)) == {}
+    assert seatalk._load_accepted(str(tmp_path / "missing")) == {}
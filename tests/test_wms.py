@@ -0,0 +1,57 @@
+import pytest
+
+from routes import wms
+from utils import http_client
+from tests.helpers import FakeResponse, make_app
+
+
+@pytest.fixture
+def client(monkeypatch):
+    loads = []
+
+    def fake_get(url, **kwargs):
+        loads.append(url)
+        return FakeResponse(json=f"cookie-{len(loads)}")
+
+    monkeypatch.setattr(http_client, "get", fake_get)
+    wms._cookies.invalidate("VNDB")
+    app = make_app(wms.bp, "/wms")
+    c = app.test_client()
+    with c.session_transaction() as s:
+        s["authenticated"] = True
+    c.loads = loads
+    return c
+
+
+def test_activity_auth_retcode_drops_cookie(client, monkeypatch):
+    answers = [{"retcode": 401, "message": "session expired"}, {"retcode": 0, "data": {"staff_name": "A"}}]
+    sent = []
+
+    def fake_post(url, headers=None, **kwargs):
+        sent.append(headers["Cookie"])
+        return FakeResponse(json=answers.pop(0))
+
+    monkeypatch.setattr(http_client, "post", fake_post)
+    body = {"warehouse": "VNDB", "staff_no": "S1", "act_no": "a1"}
+    client.post("/wms/activity", json=body)
+    client.post("/wms/activity", json=body)
+
+    # retcode 401 trong response 200 -> lần sau đọc cookie mới
+    assert sent == ["cookie-1", "cookie-2"]
+    assert len(client.loads) == 2
+
+
+def test_attendance_ok_keeps_cookie(client, monkeypatch):
+    sent = []
+
+    def fake_post(url, headers=None, **kwargs):
+        sent.append(headers["Cookie"])
+        return FakeResponse(json={"retcode": 0, "data": {}})
+
+    monkeypatch.setattr(http_client, "post", fake_post)
+    body = {"warehouse": "VNDB", "staff_no": "S1", "type": 1}
+    assert client.post("/wms/attendance", json=body).status_code == 200
+    client.post("/wms/attendance", json=body)
+
+    assert sent == ["cookie-1", "cookie-1"]
+    assert len(client.loads) == 1
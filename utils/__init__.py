@@ -3,11 +3,8 @@ Utils Package
 """
 
 from .firebase_config import ensure_firebase, get_db
-from .report import build_report_message, create_excel_report
 
 __all__ = [
     'ensure_firebase',
     'get_db',
-    'build_report_message',
-    'create_excel_report',
 ]
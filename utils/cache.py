@@ -0,0 +1,201 @@
+"""
+In-process Cache
+Thread-safe TTL cache with single-flight loading
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _Flight:
+    """One in-progress load shared by every caller asking for the same key"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """Thread-safe dict with per-entry expiry.
+
+    get_or_load() runs at most one loader per key at a time; concurrent callers
+    for the same key wait for that result instead of loading again.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 0):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}       # key -> (expires_at, value)
+        self._inflight = {}   # key -> _Flight
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[0] <= time.time():
+                self._data.pop(key, None)
+                return default
+            return item[1]
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            if self.maxsize and key not in self._data and len(self._data) >= self.maxsize:
+                self._evict_locked()
+            self._data[key] = (time.time() + ttl, value)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+
+    def discard_where(self, pred) -> int:
+        """Drop every entry whose (key, value) matches pred; returns number dropped"""
+        with self._lock:
+            keys = [k for k, (_, v) in self._data.items() if pred(k, v)]
+            for k in keys:
+                del self._data[k]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _evict_locked(self):
+        now = time.time()
+        expired = [k for k, (exp, _) in self._data.items() if exp <= now]
+        for k in expired:
+            del self._data[k]
+        if len(self._data) >= self.maxsize:
+            # Bỏ entry sắp hết hạn nhất
+            oldest = min(self._data, key=lambda k: self._data[k][0])
+            del self._data[oldest]
+
+    def get_or_load(self, key, loader, ttl: float = None):
+        """Return cached value or call loader() once for all concurrent callers"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > time.time():
+                return item[1]
+            flight = self._inflight.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._inflight[key] = _Flight()
+
+        if not owner:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+            self.set(key, flight.value, ttl)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+
+class SWRCache:
+    """Cache with stale-while-revalidate.
+
+    An entry is fresh for its ttl, then served stale for up to stale_ttl more
+    while a single background load refreshes it. Misses are single-flight like
+    TTLCache.get_or_load().
+
+    loader() -> (value, ttl); ttl <= 0 means "return it but do not cache"
+    (e.g. an error answer). A failed background refresh keeps the stale entry.
+    """
+
+    def __init__(self, stale_ttl: float, maxsize: int = 0, workers: int = 2):
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self._data = {}          # key -> (fresh_until, stale_until, value)
+        self._inflight = {}      # key -> _Flight
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="swr")
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_or_load(self, key, loader):
+        """Return (value, state) with state in "hit" | "stale" | "miss" """
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > now:
+                return item[2], "hit"
+            if item is not None and item[1] > now:
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    self._pool.submit(self._refresh, key, loader)
+                return item[2], "stale"
+            flight = self._inflight.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._inflight[key] = _Flight()
+
+        if not owner:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, "miss"
+
+        try:
+            flight.value = self._load(key, loader)
+            return flight.value, "miss"
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def _load(self, key, loader):
+        value, ttl = loader()
+        if ttl and ttl > 0:
+            now = time.time()
+            with self._lock:
+                if self.maxsize and key not in self._data and len(self._data) >= self.maxsize:
+                    self._evict_locked(now)
+                self._data[key] = (now + ttl, now + ttl + self.stale_ttl, value)
+        return value
+
+    def _refresh(self, key, loader):
+        try:
+            self._load(key, loader)
+        except Exception as e:
+            print(f"[SWRCache] refresh {key!r} failed: {type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _evict_locked(self, now: float):
+        expired = [k for k, (_, stale, _) in self._data.items() if stale <= now]
+        for k in expired:
+            del self._data[k]
+        if len(self._data) >= self.maxsize:
+            oldest = min(self._data, key=lambda k: self._data[k][1])
+            del self._data[oldest]
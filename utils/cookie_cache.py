@@ -0,0 +1,63 @@
+"""
+Warehouse Cookie Cache
+Keep WMS/SPX cookies in memory instead of re-reading RTDB on every request
+"""
+
+from config import COOKIE_CACHE_TTL, COOKIE_AUTH_RETCODES
+from .cache import TTLCache
+from . import http_client
+
+_caches = []
+
+
+def is_auth_failure(status: int = None, retcode=None) -> bool:
+    """True if an upstream HTTP status / JSON retcode means the cookie was rejected"""
+    if status in (401, 403):
+        return True
+    try:
+        return retcode is not None and int(retcode) in COOKIE_AUTH_RETCODES
+    except (TypeError, ValueError):
+        return False
+
+
+class CookieCache:
+    """Cookie per warehouse with TTL; concurrent misses share a single RTDB read.
+
+    loader(wh) -> cookie string. Entries are dropped when any upstream call made
+    with that cookie answers 401/403 (via http_client), or when check() sees an
+    auth retcode.
+    """
+
+    def __init__(self, loader, ttl: float = COOKIE_CACHE_TTL):
+        self._loader = loader
+        self._cache = TTLCache(ttl)
+        _caches.append(self)
+
+    def get(self, wh: str) -> str:
+        cookie = self._cache.get_or_load(wh, lambda: self._loader(wh))
+        if not cookie:
+            # Không cache cookie rỗng, lần sau đọc lại RTDB
+            self._cache.pop(wh)
+        return cookie
+
+    def invalidate(self, wh: str):
+        self._cache.pop(wh)
+
+    def invalidate_value(self, cookie: str) -> int:
+        return self._cache.discard_where(lambda _, v: v == cookie)
+
+    def check(self, wh: str, data=None, status: int = None) -> bool:
+        """Invalidate wh's cookie if the upstream answer is an auth failure; returns True if so"""
+        retcode = data.get("retcode") if isinstance(data, dict) else None
+        if is_auth_failure(status, retcode):
+            self.invalidate(wh)
+            return True
+        return False
+
+
+def _on_auth_failure(cookie: str):
+    for c in _caches:
+        c.invalidate_value(cookie)
+
+
+http_client.add_auth_failure_listener(_on_auth_failure)
@@ -2,7 +2,12 @@
 Excel Utilities
 """
 
-from openpyxl.styles import Alignment, Font, PatternFill, Border, Side
+import hashlib
+import io
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill, Border, Side, NamedStyle
 from openpyxl.utils import get_column_letter
 from datetime import datetime
 
@@ -11,37 +16,143 @@ BORDER_ALL = Border(left=THIN, right=THIN, top=THIN, bottom=THIN)
 CENTER = Alignment(horizontal="center", vertical="center")
 
 
-def autosize_columns(ws):
-    """Auto-size worksheet columns"""
-    maxw = {}
-    for row in ws.iter_rows(values_only=True):
-        for c_idx, val in enumerate(row, start=1):
-            ln = len(str(val)) if val is not None else 0
-            maxw[c_idx] = max(maxw.get(c_idx, 0), ln)
-
-    for c_idx, w in maxw.items():
-        ws.column_dimensions[get_column_letter(c_idx)].width = min(max(w + 2, 10), 50)
-
-
-def style_all_center(ws):
-    """Apply centered styling to worksheet"""
-    # Header
-    for cell in ws[1]:
-        cell.font = Font(bold=True, color="FFFFFF")
-        cell.fill = PatternFill("solid", fgColor="4F81BD")
-        cell.alignment = CENTER
-        cell.border = BORDER_ALL
-
-    # Body
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, max_col=ws.max_column):
-        for cell in row:
-            cell.alignment = CENTER
-            cell.border = BORDER_ALL
-
-    ws.freeze_panes = "A2"
-    ws.auto_filter.ref = ws.dimensions
-    ws.row_dimensions[1].height = 22
-    autosize_columns(ws)
+# Đổi khi format / style thay đổi -> fingerprint cũ không còn trùng
+TABLE_FORMAT = "table-v1"
+HEADER_STYLE = "table_header"
+BODY_STYLE = "table_body"
+
+
+def _table_styles():
+    """Named styles for header / body cells (registered once per workbook)"""
+    header = NamedStyle(name=HEADER_STYLE, font=Font(bold=True, color="FFFFFF"),
+                        fill=PatternFill("solid", fgColor="4F81BD"), alignment=CENTER, border=BORDER_ALL)
+    body = NamedStyle(name=BODY_STYLE, alignment=CENTER, border=BORDER_ALL)
+    return header, body
+
+
+def _column_width(max_len: int) -> int:
+    return min(max(max_len + 2, 10), 50)
+
+
+def _styled_row(ws, values, style: str) -> list:
+    cells = []
+    for v in values:
+        cell = WriteOnlyCell(ws, value=v)
+        cell.style = style
+        cells.append(cell)
+    return cells
+
+
+class TableSheet:
+    """One sheet of a TableWorkbook: header + rows, column widths tracked on append"""
+
+    def __init__(self, title: str, header: list):
+        self.title = title
+        self.header = tuple(header)
+        self.rows = []
+        self.widths = [len(str(h)) for h in self.header]
+
+    def append(self, row):
+        row = tuple(row)
+        widths = self.widths
+        for i, v in enumerate(row):
+            if v is None:
+                continue
+            ln = len(v) if isinstance(v, str) else len(str(v))
+            if i >= len(widths):
+                widths.extend([0] * (i + 1 - len(widths)))
+            if ln > widths[i]:
+                widths[i] = ln
+        self.rows.append(row)
+
+
+class TableWorkbook:
+    """Styled header + rows sheets written through a write-only openpyxl workbook.
+
+    Rows are styled as they are written (one named style for the header, one
+    for the body) and column widths come from TableSheet.append, so there is
+    no per-cell styling or measuring pass afterwards.
+    """
+
+    def __init__(self):
+        self.sheets = []
+
+    def add_sheet(self, title: str, header: list) -> TableSheet:
+        sheet = TableSheet(title, header)
+        self.sheets.append(sheet)
+        return sheet
+
+    def fingerprint(self) -> str:
+        """sha256 of the sheet titles, headers and rows: equal fingerprints give the same report.
+
+        (The .xlsx bytes themselves embed save timestamps, so they cannot be compared.)
+        """
+        h = hashlib.sha256(TABLE_FORMAT.encode())
+        for sheet in self.sheets:
+            h.update(repr((sheet.title, sheet.header, len(sheet.rows))).encode("utf-8"))
+            for row in sheet.rows:
+                h.update(repr(row).encode("utf-8"))
+        return h.hexdigest()
+
+    def save(self, fileobj):
+        wb = Workbook(write_only=True)
+        for style in _table_styles():
+            wb.add_named_style(style)
+
+        for sheet in self.sheets:
+            ws = wb.create_sheet(sheet.title)
+            # Write-only: kích thước cột / dòng phải set trước khi ghi dòng đầu tiên
+            for c_idx, w in enumerate(sheet.widths, start=1):
+                ws.column_dimensions[get_column_letter(c_idx)].width = _column_width(w)
+            ws.row_dimensions[1].height = 22
+            ws.freeze_panes = "A2"
+
+            ws.append(_styled_row(ws, sheet.header, HEADER_STYLE))
+            for row in sheet.rows:
+                ws.append(_styled_row(ws, row, BODY_STYLE))
+
+            last_col = get_column_letter(max(len(sheet.widths), 1))
+            ws.auto_filter.ref = f"A1:{last_col}{len(sheet.rows) + 1}"
+
+        wb.save(fileobj)
+
+    def to_bytes(self) -> bytes:
+        output = io.BytesIO()
+        self.save(output)
+        return output.getvalue()
+
+
+def iter_xlsx_columns(fileobj, columns: list, header_scan: int = 10):
+    """Stream rows of the first sheet as tuples of the named `columns` only.
+
+    The workbook is opened read-only, so rows are parsed one at a time and
+    other columns are never materialized. The header is the first row (within
+    header_scan rows) that has every requested column.
+    """
+    wb = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        idx, first_header = None, None
+        for _ in range(header_scan):
+            header = next(rows, None)
+            if header is None:
+                break
+            names = [str(h).strip() if h is not None else "" for h in header]
+            if first_header is None:
+                first_header = names
+            if all(c in names for c in columns):
+                idx = [names.index(c) for c in columns]
+                break
+
+        if idx is None:
+            names = first_header or []
+            missing = [c for c in columns if c not in names]
+            raise KeyError(f"Missing required columns: {missing}. Available columns: {names[:10]}")
+
+        for row in rows:
+            yield tuple(row[i] if i < len(row) else None for i in idx)
+    finally:
+        wb.close()
 
 
 def parse_scan_ts(ev: dict) -> int:
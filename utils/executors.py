@@ -0,0 +1,202 @@
+"""
+Shared Executors
+Process-wide named worker pools and per-key concurrency limits
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+
+from config import EXEC_IO_WORKERS, EXEC_CPU_WORKERS, EXEC_WH_LIMIT, EXEC_HOST_LIMIT
+
+# Tên pool -> số worker
+POOLS = {
+    "io": EXEC_IO_WORKERS,    # upstream calls (WMS, SPX, report center)
+    "cpu": EXEC_CPU_WORKERS,  # parse / transform (Excel, CSV)
+}
+
+# Prefix của key -> số slot đồng thời
+LIMITS = {
+    "wh": EXEC_WH_LIMIT,      # report-center exports per warehouse
+    "host": EXEC_HOST_LIMIT,  # in-flight HTTP requests per upstream host
+}
+
+
+class NamedPool:
+    """ThreadPoolExecutor with counters and ordered / unordered map helpers.
+
+    map() lets the calling thread run queued items itself when the pool is
+    busy, so code already running on a pool worker can fan out into the same
+    pool without deadlocking it.
+    """
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self._exe = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._started = 0
+        self._completed = 0
+        self._inline = 0
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def submit(self, fn, *args, **kwargs):
+        def _run():
+            self._count("_started")
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._count("_completed")
+
+        self._count("_submitted")
+        return self._exe.submit(_run)
+
+    def map(self, fn, items, limit: int = None):
+        """Yield fn(item) in item order with at most `limit` items in flight"""
+        it = iter(items)
+        window = max(1, min(limit or self.workers, self.workers))
+        futures = deque()
+
+        def _fill():
+            while len(futures) < window:
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+                futures.append((item, self.submit(fn, item)))
+
+        _fill()
+        try:
+            while futures:
+                item, fut = futures.popleft()
+                if fut.cancel():
+                    # Chưa có worker nhận -> chạy luôn trong thread hiện tại
+                    with self._lock:
+                        self._submitted -= 1
+                        self._inline += 1
+                    result = fn(item)
+                else:
+                    result = fut.result()
+                _fill()
+                yield result
+        finally:
+            for _, fut in futures:
+                if fut.cancel():
+                    with self._lock:
+                        self._submitted -= 1
+
+    def map_unordered(self, fn, items, limit: int = None, discard=None):
+        """Yield fn(item) as each finishes, at most `limit` in flight.
+
+        Blocks on the pool: call it from a request thread, not from a pool worker.
+        If the consumer stops early, unstarted items are cancelled and
+        discard(result) is called for every result that was never yielded.
+        """
+        it = iter(items)
+        window = max(1, limit or self.workers)
+        pending = set()
+
+        def _fill():
+            while len(pending) < window:
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+                pending.add(self.submit(fn, item))
+
+        _fill()
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    pending.discard(fut)
+                    _fill()
+                    yield fut.result()
+        finally:
+            for fut in pending:
+                if fut.cancel():
+                    with self._lock:
+                        self._submitted -= 1
+                elif discard is not None:
+                    fut.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": self._submitted - self._started,
+                "running": self._started - self._completed,
+                "completed": self._completed,
+                "inline": self._inline,
+            }
+
+
+class _Limit:
+    def __init__(self, size: int):
+        self.size = size
+        self.sem = threading.BoundedSemaphore(size)
+        self.active = 0
+        self.waiting = 0
+        self.peak = 0
+
+
+_pools = {}
+_limits = {}
+_lock = threading.Lock()
+
+
+def pool(name: str) -> NamedPool:
+    """The process-wide pool called `name` (see POOLS)"""
+    p = _pools.get(name)
+    if p is None:
+        with _lock:
+            p = _pools.get(name)
+            if p is None:
+                p = _pools[name] = NamedPool(name, POOLS[name])
+    return p
+
+
+def map(name: str, fn, items, limit: int = None) -> list:
+    """list(pool(name).map(fn, items, limit))"""
+    return list(pool(name).map(fn, items, limit))
+
+
+def _get_limit(key: str) -> _Limit:
+    with _lock:
+        lim = _limits.get(key)
+        if lim is None:
+            lim = _limits[key] = _Limit(LIMITS[key.split(":", 1)[0]])
+        return lim
+
+
+@contextmanager
+def limit(key: str):
+    """Hold one slot of `key` (e.g. "wh:VNDB", "host:spx.shopee.vn") for the block"""
+    lim = _get_limit(key)
+    with _lock:
+        lim.waiting += 1
+    lim.sem.acquire()
+    with _lock:
+        lim.waiting -= 1
+        lim.active += 1
+        lim.peak = max(lim.peak, lim.active)
+    try:
+        yield
+    finally:
+        with _lock:
+            lim.active -= 1
+        lim.sem.release()
+
+
+def stats() -> dict:
+    """Queue depth per pool and slot usage per limited key"""
+    with _lock:
+        limits = {k: {"size": v.size, "active": v.active, "waiting": v.waiting, "peak": v.peak}
+                  for k, v in _limits.items()}
+        pools = list(_pools.values())
+    return {"pools": {p.name: p.stats() for p in pools}, "limits": limits}
@@ -0,0 +1,197 @@
+"""
+Export Task Tracker
+One shared poller per warehouse for WMS report-center export tasks
+"""
+
+import threading
+import time
+
+
+class TrackedTask:
+    """A report-center task somebody is waiting on.
+
+    task_id may be empty (create_export_task did not return one); `match`
+    then picks the task out of the list instead.
+    """
+
+    def __init__(self, task_id=None, match=None):
+        self.task_id = str(task_id) if task_id else ""
+        self.match = match
+        self.task = None          # latest row seen in search_export_task
+        self.done = False
+        self.error = None         # set by the poller when it gives up; wait() raises it
+        self.registered_at = time.time()
+        self._perc = -1
+        self._perc_at = self.registered_at
+        self.rate = None          # % per second, once progress has been seen
+
+    def matches(self, task: dict) -> bool:
+        if self.task_id:
+            return str(task.get("task_id")) == self.task_id
+        return bool(self.match and self.match(task))
+
+    def update(self, task: dict, now: float) -> bool:
+        """Record the latest row; True if processed_percentage moved"""
+        self.task = task
+        perc = int(task.get("processed_percentage") or 0)
+        moved = perc != self._perc
+        if moved:
+            if self._perc >= 0 and now > self._perc_at:
+                self.rate = (perc - self._perc) / (now - self._perc_at)
+            self._perc, self._perc_at = perc, now
+        if perc >= 100 and task.get("download_link"):
+            self.done = True
+        return moved
+
+    @property
+    def percentage(self) -> int:
+        return max(self._perc, 0)
+
+
+class _Warehouse:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.entries = []
+        self.headers = None
+        self.poller = None
+
+
+class ExportTaskTracker:
+    """Tracks outstanding export tasks and polls the task list once per warehouse.
+
+    fetch_page(headers, pageno, count) -> list of task rows (newest first).
+    A poll pages through the list only until every tracked task of that
+    warehouse has been seen. The next poll is scheduled from the observed
+    processed_percentage rate (min_delay..max_delay). Waiters block on a
+    condition variable and are woken after each poll.
+
+    Waiters fail fast instead of running into their timeout when max_errors
+    polls in a row raise (expired cookie, upstream down), or when a task is
+    still not in the list unseen_timeout seconds after it was tracked (bad id).
+    """
+
+    def __init__(self, fetch_page, max_pages: int = 5, page_size: int = 100,
+                 min_delay: float = 1.0, max_delay: float = 10.0, default_delay: float = 3.0,
+                 max_errors: int = 5, unseen_timeout: float = 60.0, log_prefix: str = ""):
+        self.fetch_page = fetch_page
+        self.max_pages = max_pages
+        self.page_size = page_size
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.max_errors = max_errors
+        self.unseen_timeout = unseen_timeout
+        self.log_prefix = log_prefix
+        self._whs = {}
+        self._lock = threading.Lock()
+
+    def _wh(self, wh: str) -> _Warehouse:
+        with self._lock:
+            return self._whs.setdefault(wh, _Warehouse())
+
+    def track(self, wh: str, headers: dict, task_id=None, match=None, first_delay: float = 2.0) -> TrackedTask:
+        """Start tracking a task; the warehouse poller starts if it is not running"""
+        entry = TrackedTask(task_id, match)
+        w = self._wh(wh)
+        with w.cond:
+            w.entries.append(entry)
+            w.headers = headers
+            if w.poller is None:
+                w.poller = threading.Thread(target=self._poll_loop, args=(wh, w, first_delay),
+                                            name=f"export-poll-{wh}", daemon=True)
+                w.poller.start()
+        return entry
+
+    def untrack(self, wh: str, entry: TrackedTask):
+        w = self._wh(wh)
+        with w.cond:
+            if entry in w.entries:
+                w.entries.remove(entry)
+
+    def wait(self, wh: str, entry: TrackedTask, timeout: float, on_progress=None) -> dict:
+        """Block until the task is finished (100% with a download link); returns its row.
+
+        on_progress(percentage) is called after every poll that saw the task.
+        Raises TimeoutError after `timeout` seconds. The task is untracked either way.
+        """
+        w = self._wh(wh)
+        deadline = time.time() + timeout
+        try:
+            with w.cond:
+                while not entry.done and entry.error is None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise TimeoutError("Report not ready within timeout")
+                    w.cond.wait(remaining)
+                    if on_progress and entry.task is not None:
+                        on_progress(entry.percentage)
+                if entry.error is not None:
+                    raise entry.error
+                return entry.task
+        finally:
+            self.untrack(wh, entry)
+
+    def _next_delay(self, pending: list) -> float:
+        """Poll sooner when a task is about to finish, back off while they crawl"""
+        delays = []
+        for e in pending:
+            if e.task is None or not e.rate or e.rate <= 0:
+                delays.append(self.default_delay)
+            else:
+                delays.append((100 - e.percentage) / e.rate)
+        delay = min(delays) if delays else self.default_delay
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def _poll_loop(self, wh: str, w: _Warehouse, delay: float):
+        errors = 0
+        while True:
+            with w.cond:
+                # Chờ đến lượt poll; thoát nếu không còn ai theo dõi
+                w.cond.wait_for(lambda: not w.entries, timeout=delay)
+                if not w.entries:
+                    w.poller = None
+                    return
+                pending = [e for e in w.entries if not e.done]
+                headers = w.headers
+
+            try:
+                self._poll_once(wh, headers, pending)
+                errors = 0
+            except Exception as e:
+                errors += 1
+                print(f"{self.log_prefix}[{wh}] ⚠️ Poll error: {e}")
+                if errors >= self.max_errors:
+                    for entry in pending:
+                        entry.error = RuntimeError(f"Task list poll failed {errors} times: {e}")
+
+            with w.cond:
+                w.cond.notify_all()
+                pending = [e for e in w.entries if not e.done]
+                if errors:
+                    delay = min(self.default_delay * (2 ** (errors - 1)), self.max_delay)
+                else:
+                    delay = self._next_delay(pending)
+
+    def _poll_once(self, wh: str, headers: dict, pending: list):
+        """Page through the task list until every pending task has been seen"""
+        missing = list(pending)
+        for p in range(1, self.max_pages + 1):
+            if not missing:
+                break
+            tasks = self.fetch_page(headers, p, self.page_size)
+            if not tasks:
+                break
+            now = time.time()
+            for t in tasks:
+                for e in list(missing):
+                    if e.matches(t):
+                        if e.update(t, now):
+                            print(f"{self.log_prefix}[{wh}] ⏳ Task {t.get('task_id')} processing: {e.percentage}%")
+                        missing.remove(e)
+                        break
+
+        now = time.time()
+        for e in missing:
+            if e.task is None and now - e.registered_at > self.unseen_timeout:
+                e.error = LookupError(f"Task {e.task_id or '(match)'} not found in the task list "
+                                      f"after {self.unseen_timeout:.0f}s")
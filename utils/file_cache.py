@@ -0,0 +1,188 @@
+"""
+Disk Cache
+Size-bounded LRU file cache for downloaded artifacts (run-sheet PDFs, ...)
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+
+
+class DiskLRUCache:
+    """Files keyed by an arbitrary string, evicted least-recently-used first
+    once the directory grows past max_bytes (and, with max_age, once unused
+    for max_age seconds).
+
+    Writes go to a temp file and are renamed into place only when complete,
+    so readers never see a partial file.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_age: float = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key: str, suffix: str = "") -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + suffix)
+
+    def get(self, key: str, suffix: str = ""):
+        """Path of the cached file or None; a hit refreshes its LRU position.
+
+        evict() on another thread may delete the file right after; to serve
+        it, use open() instead.
+        """
+        path = self.path_for(key, suffix)
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def open(self, key: str, suffix: str = ""):
+        """Open the cached file for reading (caller closes it) or None; a hit refreshes its LRU position.
+
+        The handle stays readable even if the file is evicted meanwhile
+        (on Windows evict() just skips a file that is open).
+        """
+        path = self.path_for(key, suffix)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return f
+
+    def tee(self, key: str, chunks, suffix: str = "", expected_size: int = None):
+        """Yield chunks through while writing them to the cache.
+
+        The file is committed only if the iteration completes (and matches
+        expected_size when given); an aborted download leaves nothing behind.
+        """
+        final = self.path_for(key, suffix)
+        tmp = f"{final}.{uuid.uuid4().hex}.part"
+        size = 0
+        complete = False
+        f = open(tmp, "wb")
+        try:
+            for chunk in chunks:
+                if chunk:
+                    f.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            complete = expected_size is None or size == expected_size
+        finally:
+            f.close()
+            if complete:
+                try:
+                    os.replace(tmp, final)
+                except OSError:
+                    # Windows: file đích đang được gửi cho client khác -> giữ bản cũ
+                    complete = False
+                else:
+                    self.evict()
+            if not complete:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+    def put(self, key: str, write, suffix: str = "") -> str:
+        """Create the cached file with write(fileobj) and return its path.
+
+        write gets a seekable temp file; the result is renamed into place only
+        if write returns normally.
+        """
+        final = self.path_for(key, suffix)
+        self._write(final, write, keep_open=False)
+        self.evict()
+        return final
+
+    def open_or_put(self, key: str, write, suffix: str = ""):
+        """open(key), creating the file with write(fileobj) first when it is missing.
+
+        A new file is opened before evict() can see it, so the returned handle
+        is always usable (caller closes it).
+        """
+        f = self.open(key, suffix)
+        if f is None:
+            f = self._write(self.path_for(key, suffix), write, keep_open=True)
+            self.evict()
+        return f
+
+    def _write(self, final: str, write, keep_open: bool):
+        tmp = f"{final}.{uuid.uuid4().hex}.part"
+        try:
+            with open(tmp, "w+b") as f:
+                write(f)
+            # Dưới _lock: evict() của thread khác không xoá được file trước khi mở
+            with self._lock:
+                os.replace(tmp, final)
+                return open(final, "rb") if keep_open else None
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def evict(self):
+        """Drop files unused for max_age, then least-recently-used ones until total size <= max_bytes"""
+        with self._lock:
+            entries, total = [], 0
+            now = time.time()
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if name.endswith(".part"):
+                    # Temp file bị bỏ dở quá 1 giờ -> dọn
+                    if now - st.st_mtime > 3600:
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+                    continue
+                if self.max_age is not None and now - st.st_mtime > self.max_age:
+                    try:
+                        os.remove(path)
+                        continue
+                    except OSError:
+                        pass
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+            entries.sort()
+            for _, fsize, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= fsize
+                except OSError:
+                    pass
+
+
+_DIGEST = re.compile(r"[0-9a-f]{16,128}")
+
+
+class ArtifactStore(DiskLRUCache):
+    """Content-addressed variant: the key is a hex digest of the content and is
+    used as the file name as-is, so identical content is stored once and the
+    digest doubles as a strong ETag.
+    """
+
+    def path_for(self, key: str, suffix: str = "") -> str:
+        if not _DIGEST.fullmatch(key or ""):
+            raise ValueError(f"Invalid artifact key: {key!r}")
+        return os.path.join(self.directory, key + suffix)
@@ -3,6 +3,7 @@ Firebase utilities wrapper
 """
 
 from firebase_admin import db
+from config import RTDB_CHUNK_SIZE
 from .firebase_config import ensure_firebase
 
 # Ensure Firebase is initialized
@@ -10,3 +11,33 @@ ensure_firebase()
 
 # Export db as rtdb for backward compatibility
 rtdb = db
+
+
+def iter_children(path: str, chunk_size: int = RTDB_CHUNK_SIZE):
+    """Yield (key, value) of the children of `path` in key order, chunk_size per request.
+
+    Pages with order_by_key().start_at(last_key).limit_to_first(), so neither
+    the RTDB response nor the caller ever holds more than one chunk; large
+    days no longer come back as a single huge JSON body.
+    """
+    ref = db.reference(path)
+    last = None
+    while True:
+        query = ref.order_by_key()
+        if last is None:
+            page = query.limit_to_first(chunk_size).get()
+        else:
+            # start_at là inclusive -> lấy dư 1 rồi bỏ key cuối của trang trước
+            page = query.start_at(last).limit_to_first(chunk_size + 1).get()
+        if isinstance(page, list):
+            page = {str(i): v for i, v in enumerate(page) if v is not None}
+        items = [(k, v) for k, v in (page or {}).items() if k != last]
+        yield from items
+        if len(items) < chunk_size:
+            return
+        last = items[-1][0]
+
+
+def count_children(path: str) -> int:
+    """Number of children of `path` from a shallow read (keys only, no values)"""
+    return len(db.reference(path).get(shallow=True) or {})
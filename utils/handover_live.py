@@ -0,0 +1,261 @@
+"""
+Live Handover Aggregator
+Per-day handover counters and scan-time index kept current by RTDB listeners
+"""
+
+import bisect
+import copy
+import threading
+import time
+
+from .excel import parse_scan_ts
+from .report import CHANNELS
+from .timeutils import today_short
+
+
+class ChannelTree:
+    """Mirror of a /{date}/<node> tree shaped {channel: {id: event}}.
+
+    apply() takes the listener's put / patch events; on_change(ch, id, old, new)
+    is called for every event that changed (None = absent), so subclasses keep
+    their aggregates incremental.
+    """
+
+    def __init__(self):
+        self.channels = {}
+        self.synced = False
+
+    def apply(self, event_type: str, path: str, data):
+        parts = [p for p in (path or "/").split("/") if p]
+        if event_type == "put":
+            self._put(parts, data)
+            if not parts:
+                self.synced = True
+        elif event_type == "patch":
+            for key, value in (data or {}).items():
+                self._put(parts + [p for p in key.split("/") if p], value)
+
+    def _put(self, parts, value):
+        if not parts:
+            value = value if isinstance(value, dict) else {}
+            for ch in list(self.channels):
+                if ch not in value:
+                    self._replace_channel(ch, {})
+            for ch, items in value.items():
+                self._replace_channel(ch, items)
+        elif len(parts) == 1:
+            self._replace_channel(parts[0], value)
+        elif len(parts) == 2:
+            self._set(parts[0], parts[1], value)
+        else:
+            # Ghi vào 1 field bên trong event (vd .../is_cancelled)
+            ch, oid, fields = parts[0], parts[1], parts[2:]
+            ev = copy.deepcopy(self.channels.get(ch, {}).get(oid)) or {}
+            if not isinstance(ev, dict):
+                ev = {}
+            node = ev
+            for f in fields[:-1]:
+                if not isinstance(node.get(f), dict):
+                    node[f] = {}
+                node = node[f]
+            if value is None:
+                node.pop(fields[-1], None)
+            else:
+                node[fields[-1]] = value
+            self._set(ch, oid, ev or None)
+
+    def _replace_channel(self, ch: str, items):
+        items = items if isinstance(items, dict) else {}
+        for oid in [oid for oid in self.channels.get(ch, {}) if oid not in items]:
+            self._set(ch, oid, None)
+        for oid, ev in items.items():
+            self._set(ch, oid, ev)
+
+    def _set(self, ch: str, oid: str, ev):
+        current = self.channels.setdefault(ch, {})
+        old = current.get(oid)
+        if ev is None:
+            current.pop(oid, None)
+        else:
+            current[oid] = ev
+        if old != ev:
+            self.on_change(ch, oid, old, ev)
+
+    def on_change(self, ch, oid, old, new):
+        pass
+
+
+class ScanTree(ChannelTree):
+    """DATA_SCAN: non-cancelled / cancelled count per channel, ids sorted newest scan first"""
+
+    def __init__(self):
+        super().__init__()
+        self.non_cancel = {}
+        self.cancelled = {}
+        self._order = {}   # ch -> sorted [(-scan_ts, id)]
+        self._bulk = False
+
+    @staticmethod
+    def _is_cancelled(ev) -> bool:
+        return isinstance(ev, dict) and ev.get("is_cancelled") == "Yes"
+
+    @staticmethod
+    def _sort_key(oid, ev):
+        return (-parse_scan_ts(ev if isinstance(ev, dict) else {}), oid)
+
+    def on_change(self, ch, oid, old, new):
+        order = self._order.setdefault(ch, [])
+        if old is not None:
+            if self._is_cancelled(old):
+                self.cancelled[ch] = self.cancelled.get(ch, 0) - 1
+            else:
+                self.non_cancel[ch] = self.non_cancel.get(ch, 0) - 1
+            if not self._bulk:
+                key = self._sort_key(oid, old)
+                i = bisect.bisect_left(order, key)
+                if i < len(order) and order[i] == key:
+                    del order[i]
+        if new is not None:
+            if self._is_cancelled(new):
+                self.cancelled[ch] = self.cancelled.get(ch, 0) + 1
+            else:
+                self.non_cancel[ch] = self.non_cancel.get(ch, 0) + 1
+            if not self._bulk:
+                bisect.insort(order, self._sort_key(oid, new))
+
+    def _replace_channel(self, ch, items):
+        # Nạp cả kênh một lần (put "/" đầu tiên): sắp xếp lại 1 lần thay vì insort từng event
+        self._bulk = True
+        try:
+            super()._replace_channel(ch, items)
+        finally:
+            self._bulk = False
+        self._order[ch] = sorted(self._sort_key(oid, ev) for oid, ev in self.channels.get(ch, {}).items())
+
+    def sorted_items(self, ch: str) -> list:
+        events = self.channels.get(ch, {})
+        return [(oid, events[oid] if isinstance(events[oid], dict) else {}) for _, oid in self._order.get(ch, [])]
+
+
+class CancelTree(ChannelTree):
+    """Data-cancel: cancel records per channel"""
+
+    def __init__(self):
+        super().__init__()
+        self.count = {}
+
+    def on_change(self, ch, oid, old, new):
+        self.count[ch] = self.count.get(ch, 0) + (new is not None) - (old is not None)
+
+
+class HandoverDay:
+    """Live DATA_SCAN + Data-cancel of one day"""
+
+    def __init__(self, date_str: str):
+        self.date_str = date_str
+        self.scan = ScanTree()
+        self.cancel = CancelTree()
+        self.updated_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.scan.synced and self.cancel.synced
+
+    def listener(self, tree: ChannelTree, name: str):
+        def _on_event(event):
+            if event.event_type not in ("put", "patch"):
+                if event.event_type in ("cancel", "auth_revoked"):
+                    print(f"[HandoverLive] ⚠️ {self.date_str}/{name}: {event.event_type}")
+                    tree.synced = False
+                return
+            with self._lock:
+                tree.apply(event.event_type, event.path, event.data)
+                self.updated_at = time.time()
+        return _on_event
+
+    def snapshot(self, items: bool = True) -> dict:
+        """Counters and scan order read under one lock, so they describe the same events.
+
+        {"non_cancel": {ch: n}, "cancelled": n, "cancel_counts": {ch: n},
+         "items": {ch: [(order_id, ev), ...] newest scan first} or None}
+        """
+        with self._lock:
+            return {
+                "non_cancel": {ch: self.scan.non_cancel.get(ch, 0) for ch in CHANNELS},
+                # Chỉ tính CHANNELS, giống collect_handover khi đọc từ RTDB
+                "cancelled": sum(self.scan.cancelled.get(ch, 0) for ch in CHANNELS),
+                "cancel_counts": {ch: self.cancel.count.get(ch, 0) for ch in CHANNELS},
+                "items": {ch: self.scan.sorted_items(ch) for ch in CHANNELS} if items else None,
+            }
+
+
+class HandoverLive:
+    """Keeps a HandoverDay for today, re-subscribing when the date rolls over or
+    when the day is still not ready resync_after seconds after subscribing
+    (initial load never finished, or a listener was cancelled / auth revoked).
+
+    reference(path) is firebase_admin db.reference. Listeners are opened from
+    this daemon thread so their own threads are daemons too (firebase_admin
+    starts them non-daemon, which would block process exit).
+    """
+
+    def __init__(self, reference, check_interval: float = 30.0, resync_after: float = 120.0):
+        self.reference = reference
+        self.check_interval = check_interval
+        self.resync_after = resync_after
+        self._day = None
+        self._subscribed_at = 0.0
+        self._registrations = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="handover-live", daemon=True)
+            self._thread.start()
+
+    def get(self, date_str: str):
+        """HandoverDay of date_str if it is live and fully loaded, else None (caller reads RTDB)"""
+        self.start()
+        day = self._day
+        if day is None or day.date_str != date_str or not day.ready:
+            return None
+        return day
+
+    def _run(self):
+        while True:
+            self._check()
+            time.sleep(self.check_interval)
+
+    def _check(self):
+        date_str = today_short()
+        day = self._day
+        if day is not None and day.date_str == date_str:
+            if day.ready or time.time() - self._subscribed_at < self.resync_after:
+                return
+            print(f"[HandoverLive] 🔁 {date_str} not in sync, re-subscribing")
+        try:
+            self._switch(date_str)
+        except Exception as e:
+            print(f"[HandoverLive] ❌ Subscribe {date_str} failed: {e}")
+            self._day = None
+
+    def _switch(self, date_str: str):
+        for reg in self._registrations:
+            try:
+                reg.close()
+            except Exception:
+                pass
+        self._registrations = []
+
+        day = HandoverDay(date_str)
+        self._day = day
+        self._subscribed_at = time.time()
+        self._registrations = [
+            self.reference(f"/{date_str}/DATA_SCAN").listen(day.listener(day.scan, "DATA_SCAN")),
+            self.reference(f"/{date_str}/Data-cancel").listen(day.listener(day.cancel, "Data-cancel")),
+        ]
+        print(f"[HandoverLive] 📡 Listening /{date_str}/DATA_SCAN + Data-cancel")
@@ -0,0 +1,200 @@
+"""
+Shared HTTP Client
+Pooled keep-alive session for upstream calls (WMS, SPX, SeaTalk, RTDB)
+"""
+
+import tempfile
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+
+from config import HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_SPOOL_MB
+from . import executors
+
+# Only advertise encodings urllib3 can actually decode (br needs brotli installed)
+ACCEPT_ENCODING = make_headers(accept_encoding=True)["accept-encoding"]
+
+_session = None
+_session_lock = threading.Lock()
+_auth_failure_listeners = []
+
+
+def _build_session() -> requests.Session:
+    s = requests.Session()
+    # Mỗi host (wms.ssc / spx / seatalk / rtdb) có pool riêng, đủ cho EXEC_HOST_LIMIT request song song
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=HTTP_POOL_SIZE, pool_block=False)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    s.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    # Cookie luôn truyền qua header theo từng warehouse -> không giữ Set-Cookie giữa các request
+    s.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    s.hooks["response"].append(_auth_hook)
+    return s
+
+
+def session() -> requests.Session:
+    """Get the process-wide pooled session"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def _timeout(timeout):
+    """Normalize timeout to (connect, read); a bare number is the read timeout"""
+    if timeout is None:
+        return (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    if isinstance(timeout, (int, float)):
+        return (min(HTTP_CONNECT_TIMEOUT, timeout), timeout)
+    return timeout
+
+
+def _clean_headers(headers):
+    if not headers:
+        return headers
+    return {k: v for k, v in headers.items() if k.lower() != "accept-encoding"}
+
+
+def request(method: str, url: str, headers: dict = None, timeout=None, **kwargs) -> requests.Response:
+    """Send a request through the shared pool (same signature as requests.request).
+
+    At most EXEC_HOST_LIMIT requests per host are in flight; the rest wait here.
+    """
+    with executors.limit(f"host:{urlsplit(url).hostname}"):
+        return session().request(method, url, headers=_clean_headers(headers), timeout=_timeout(timeout), **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+# ───── Streaming download ─────
+def _content_range_total(value: str, offset: int):
+    """Total size from 'bytes <offset>-<end>/<total>'; None if it does not start at offset"""
+    unit, _, spec = (value or "").partition(" ")
+    rng, _, total = spec.partition("/")
+    start = rng.partition("-")[0]
+    if unit != "bytes" or not start.isdigit() or int(start) != offset:
+        return None
+    return int(total) if total.isdigit() else -1
+
+
+def download(url: str, headers: dict = None, timeout=None, retries: int = 3, backoff: float = 1.5,
+             chunk_size: int = 64 * 1024):
+    """Stream url into a SpooledTemporaryFile and return it rewound (caller closes it).
+
+    A retry continues with a Range request from the bytes already received when
+    the server advertised Accept-Ranges and sent the body unencoded; otherwise it
+    starts over. The size is checked against Content-Length / Content-Range.
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=HTTP_SPOOL_MB * 1024 * 1024)
+    expected = None
+    resumable = False
+    last_err = None
+    try:
+        for i in range(1, retries + 1):
+            offset = out.tell() if resumable else 0
+            out.seek(offset)
+            out.truncate()
+            h = dict(headers or {})
+            if offset:
+                h["Range"] = f"bytes={offset}-"
+            try:
+                with request("GET", url, headers=h, timeout=timeout, stream=True) as resp:
+                    resp.raise_for_status()
+                    encoded = resp.headers.get("Content-Encoding", "identity").lower() != "identity"
+                    if offset and resp.status_code == 206:
+                        total = _content_range_total(resp.headers.get("Content-Range"), offset)
+                        if total is None:
+                            raise IOError(f"Unexpected Content-Range: {resp.headers.get('Content-Range')}")
+                        if total >= 0:
+                            expected = total
+                    else:
+                        # 200 cho request có Range -> server bỏ qua Range, tải lại từ đầu
+                        out.seek(0)
+                        out.truncate()
+                        length = resp.headers.get("Content-Length")
+                        expected = int(length) if length and length.isdigit() and not encoded else None
+                    resumable = not encoded and resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+
+                    for chunk in resp.iter_content(chunk_size):
+                        out.write(chunk)
+
+                if expected is not None and out.tell() != expected:
+                    raise IOError(f"Incomplete download: {out.tell()}/{expected} bytes")
+                out.seek(0)
+                return out
+            except Exception as e:
+                last_err = e
+                if i < retries:
+                    print(f"[HTTP] ⚠️ Download attempt {i} failed at {out.tell()} bytes: {e}")
+                    time.sleep(backoff ** (i - 1))
+    except BaseException:
+        out.close()
+        raise
+    out.close()
+    raise last_err
+
+
+# ───── Auth failure notification ─────
+def add_auth_failure_listener(fn):
+    """Register fn(cookie), called when an upstream answers 401/403 to a request carrying that cookie"""
+    _auth_failure_listeners.append(fn)
+
+
+def _auth_hook(resp, *args, **kwargs):
+    if resp.status_code in (401, 403) and resp.request is not None:
+        cookie = resp.request.headers.get("Cookie")
+        if cookie:
+            for fn in list(_auth_failure_listeners):
+                try:
+                    fn(cookie)
+                except Exception:
+                    pass
+    return resp
+
+
+# ───── Stats ─────
+def stats() -> dict:
+    """Per-host pool stats: hits = requests served on a reused connection, misses = new connections"""
+    hosts = {}
+    if _session is None:
+        return {"pool_maxsize": HTTP_POOL_SIZE, "hosts": hosts, "hits": 0, "misses": 0}
+
+    adapters = {id(a): a for a in _session.adapters.values()}
+    for adapter in adapters.values():
+        pools = getattr(adapter.poolmanager, "pools", None)
+        if pools is None:
+            continue
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = f"{pool.scheme}://{pool.host}" + (f":{pool.port}" if pool.port else "")
+            h = hosts.setdefault(host, {"requests": 0, "connections": 0, "idle": 0})
+            h["requests"] += pool.num_requests
+            h["connections"] += pool.num_connections
+            h["idle"] += sum(1 for c in list(pool.pool.queue) if c is not None) if pool.pool is not None else 0
+
+    for h in hosts.values():
+        h["misses"] = h["connections"]
+        h["hits"] = max(h["requests"] - h["connections"], 0)
+
+    return {
+        "pool_maxsize": HTTP_POOL_SIZE,
+        "hosts": hosts,
+        "hits": sum(h["hits"] for h in hosts.values()),
+        "misses": sum(h["misses"] for h in hosts.values()),
+    }
+
@@ -0,0 +1,108 @@
+"""
+Background Jobs
+Run long requests on a worker pool and expose progress / result by job id
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """One background run; progress is a dict of sections (e.g. per warehouse)"""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.status = "queued"      # queued | running | done | error
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0            # bumps on every change (SSE / long-poll)
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "error")
+
+    def update(self, section: str, **info):
+        """Merge info into progress[section] and wake watchers"""
+        with self._cond:
+            self.progress[section] = {**self.progress.get(section, {}), **info}
+            self.version += 1
+            self._cond.notify_all()
+
+    def _set(self, **fields):
+        with self._cond:
+            for k, v in fields.items():
+                setattr(self, k, v)
+            self.version += 1
+            self._cond.notify_all()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until the job finished; False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.finished, timeout=timeout)
+
+    def wait_change(self, version: int, timeout: float = None) -> int:
+        """Block until version moves past `version` (or timeout); returns the current version"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version or self.finished, timeout=timeout)
+            return self.version
+
+    def to_dict(self) -> dict:
+        with self._cond:
+            now = self.finished_at or time.time()
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "progress": {k: dict(v) for k, v in self.progress.items()},
+                "error": self.error,
+                "version": self.version,
+                "elapsed": round(now - (self.started_at or self.created_at), 2),
+            }
+
+
+class JobStore:
+    """Bounded pool of background workers plus finished jobs kept for `ttl` seconds"""
+
+    def __init__(self, workers: int, ttl: float, name: str = "job"):
+        self.ttl = ttl
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn) -> Job:
+        """Queue fn(job) -> result; its exception becomes job.error"""
+        job = Job(kind)
+        with self._lock:
+            self._prune_locked()
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            self._prune_locked()
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job, fn):
+        job._set(status="running", started_at=time.time())
+        try:
+            result = fn(job)
+        except Exception as e:
+            print(f"[JOB {job.id}] ❌ {type(e).__name__}: {e}")
+            job._set(status="error", error=f"{type(e).__name__}: {e}", finished_at=time.time())
+        else:
+            job._set(status="done", result=result, finished_at=time.time())
+
+    def _prune_locked(self):
+        now = time.time()
+        expired = [jid for jid, j in self._jobs.items() if j.finished_at and now - j.finished_at > self.ttl]
+        for jid in expired:
+            del self._jobs[jid]
@@ -0,0 +1,206 @@
+"""
+LH Trip Sync
+In-memory per-day trip tables kept current through upstream mtime windows
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from config import LH_SYNC_MIN_INTERVAL, LH_SYNC_FULL_INTERVAL, LH_SYNC_OVERLAP, LH_SYNC_MAX_TABLES
+from . import executors, lh_trips
+
+# Version tăng dần dùng chung cho mọi bảng; epoch đổi mỗi lần restart process
+_EPOCH = uuid.uuid4().hex[:8]
+_version = 0
+_version_lock = threading.Lock()
+
+
+def _next_version() -> int:
+    global _version
+    with _version_lock:
+        _version += 1
+        return _version
+
+
+def _current_version() -> int:
+    with _version_lock:
+        return _version
+
+
+def _scope(kinds, from_time: int, to_time: int) -> str:
+    return f"{'+'.join(kinds)}.{int(from_time)}.{int(to_time)}"
+
+
+def make_cursor(version: int, kinds, from_time: int, to_time: int) -> str:
+    """Cursor for `version` of the tables (kinds, day window); epoch + scope are encoded in it"""
+    return f"{_EPOCH}.{_scope(kinds, from_time, to_time)}.{version}"
+
+
+def parse_cursor(cursor: str, kinds, from_time: int, to_time: int):
+    """Version encoded in a cursor from this process for the same kinds / day window,
+    else None (client needs a full list)"""
+    if not cursor:
+        return None
+    head, _, version = str(cursor).rpartition(".")
+    if head != f"{_EPOCH}.{_scope(kinds, from_time, to_time)}":
+        return None
+    try:
+        return int(version)
+    except ValueError:
+        return None
+
+
+class TripTable:
+    """Normalized trips of one kind for one day window.
+
+    The first sync (and one every LH_SYNC_FULL_INTERVAL seconds) downloads the
+    whole day and diffs it against the table; that is the only way to notice
+    trips that left the upstream list. In between, sync() asks only for trips
+    modified since the watermark and merges them. Every change is stamped with
+    a process-wide version so callers can ask for a delta.
+
+    snapshot() / delta() return the process-wide version read under the table
+    lock: every change of this table up to it is in the result (changes of
+    other tables may be newer than it or not, so a cursor over several tables
+    takes the min).
+    """
+
+    def __init__(self, kind: str, from_time: int, to_time: int):
+        self.kind = kind
+        self.from_time = from_time
+        self.to_time = to_time
+        # Cursor cũ hơn lúc tạo bảng (bảng bị evict rồi tạo lại) -> không biết trip nào đã bị xoá
+        with _version_lock:
+            self.base = _version
+        self.watermark = None    # mtime lower bound of the next incremental sync
+        self.synced_at = 0.0
+        self.full_at = 0.0
+        self._trips = {}         # id -> trip
+        self._changed = {}       # id -> version of last upsert
+        self._removed = {}       # id -> version of removal
+        self._lock = threading.Lock()       # table state
+        self._sync_lock = threading.Lock()  # one upstream sync at a time
+
+    def sync(self, headers: dict, force_full: bool = False):
+        """Bring the table up to date; a no-op if synced less than LH_SYNC_MIN_INTERVAL ago.
+
+        Concurrent callers wait for the running sync instead of starting another.
+        """
+        with self._sync_lock:
+            started = time.time()
+            if not force_full and started - self.synced_at < LH_SYNC_MIN_INTERVAL:
+                return
+            full = force_full or self.watermark is None or started - self.full_at >= LH_SYNC_FULL_INTERVAL
+
+            if full:
+                trips = lh_trips.fetch_trips(self.kind, headers, self.from_time, self.to_time)
+            elif self.watermark > self.to_time:
+                # Ngày đã qua: cửa sổ mtime của ngày không còn thay đổi
+                trips = []
+            else:
+                trips = lh_trips.fetch_trips(self.kind, headers, self.from_time, self.to_time,
+                                             mtime_from=self.watermark)
+
+            self._merge(trips, full)
+            # Lùi watermark một khoảng để không hụt trip do lệch giờ / ghi chậm phía upstream
+            self.watermark = started - LH_SYNC_OVERLAP
+            self.synced_at = started
+            if full:
+                self.full_at = started
+
+    def _merge(self, trips: list, full: bool):
+        with self._lock:
+            changed = [t for t in trips if self._trips.get(t["id"]) != t]
+            if full:
+                present = {t["id"] for t in trips}
+                gone = [tid for tid in self._trips if tid not in present]
+            else:
+                gone = []
+            if not changed and not gone:
+                return
+
+            v = _next_version()
+            for t in changed:
+                self._trips[t["id"]] = t
+                self._changed[t["id"]] = v
+                self._removed.pop(t["id"], None)
+            for tid in gone:
+                del self._trips[tid]
+                self._changed.pop(tid, None)
+                self._removed[tid] = v
+
+    def snapshot(self):
+        """(version, trips)"""
+        with self._lock:
+            return _current_version(), list(self._trips.values())
+
+    def delta(self, since: int):
+        """(version, upserted trips, removed ids) for changes after version `since`"""
+        with self._lock:
+            upserts = [self._trips[tid] for tid, v in self._changed.items() if v > since]
+            removed = [tid for tid, v in self._removed.items() if v > since]
+            return _current_version(), upserts, removed
+
+
+_tables = OrderedDict()   # (kind, from_time, to_time) -> TripTable
+_tables_lock = threading.Lock()
+
+
+def get_table(kind: str, from_time: int, to_time: int) -> TripTable:
+    key = (kind, from_time, to_time)
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is None:
+            table = _tables[key] = TripTable(kind, from_time, to_time)
+            while len(_tables) > LH_SYNC_MAX_TABLES:
+                _tables.popitem(last=False)
+        else:
+            _tables.move_to_end(key)
+        return table
+
+
+def _per_kind(kinds, fn) -> dict:
+    """{kind: fn(kind) or Exception}, kinds run concurrently"""
+    def _one(kind):
+        try:
+            return fn(kind)
+        except Exception as e:
+            return e
+
+    return dict(zip(kinds, executors.map("io", _one, kinds)))
+
+
+def list_trips(headers: dict, from_time: int, to_time: int, kinds=lh_trips.TRIP_KINDS) -> dict:
+    """Same contract as lh_trips.list_trips, served from the synced tables"""
+    def _one(kind):
+        table = get_table(kind, from_time, to_time)
+        table.sync(headers)
+        return table.snapshot()[1]
+
+    return _per_kind(kinds, _one)
+
+
+def sync_trips(headers: dict, from_time: int, to_time: int, kinds=lh_trips.TRIP_KINDS,
+               since: str = None) -> dict:
+    """
+    {kind: section or Exception}; section is
+        {"version", "full": True, "trips": [...]}                   when since is unusable
+        {"version", "full": False, "trips": upserts, "removed": ids} otherwise
+
+    The cursor for the next call is make_cursor(min of the versions): a kind
+    synced earlier may have missed changes stamped before a later kind's version.
+    """
+    since_v = parse_cursor(since, kinds, from_time, to_time)
+
+    def _one(kind):
+        table = get_table(kind, from_time, to_time)
+        table.sync(headers)
+        if since_v is None or since_v < table.base:
+            version, trips = table.snapshot()
+            return {"version": version, "full": True, "trips": trips, "removed": []}
+        version, upserts, removed = table.delta(since_v)
+        return {"version": version, "full": False, "trips": upserts, "removed": removed}
+
+    return _per_kind(kinds, _one)
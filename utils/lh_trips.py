@@ -0,0 +1,371 @@
+"""
+LH Trip Helpers
+SPX trip loading-list paging and CSV row building for the LH tool
+"""
+
+import codecs
+import csv
+import io
+import math
+import time
+from datetime import datetime, timezone, timedelta
+
+import requests
+
+from config import (
+    LH_PAGE_WORKERS, LH_PAGE_RETRIES, LH_DETAIL_WORKERS, LH_TO_DETAIL_TTL,
+    LH_BATCH_WORKERS, LH_PARCEL_COUNT_TTL, LH_RUN_SHEET_TTL,
+)
+from . import executors, http_client
+from .cache import TTLCache
+
+URL_LOADING_HISTORY = "https://spx.shopee.vn/api/admin/transportation/trip/history/loading/list"
+URL_LOADING_CURRENT = "https://spx.shopee.vn/api/admin/transportation/trip/loading/list"
+URL_TO_DETAIL = "https://spx.shopee.vn/api/in-station/general_to/detail/search"
+URL_TRIP_HISTORY_LIST = "https://spx.shopee.vn/api/admin/transportation/trip/history/list"
+URL_TRIP_LIST = "https://spx.shopee.vn/api/admin/transportation/trip/list"
+URL_RUN_SHEET_LIST = "https://spx.shopee.vn/api/admin/transportation/run_sheet/list"
+SPX_BASE = "https://spx.shopee.vn"
+
+TRIP_KINDS = ("outbound", "handover")
+MIDDLE_STATION = 3983
+STATION_ID = 2259
+GMT7 = timezone(timedelta(hours=7))
+
+PAGE_SIZE = 50
+TRIP_PAGE_SIZE = 100
+CSV_FIELDS = ['to_number', 'pack_type_name', 'scan_number', 'operator', 'to_weight', 'ctime']
+
+# to_number -> fleet_order_ids; TO đã seal không đổi nên cache được lâu
+_to_detail_cache = TTLCache(LH_TO_DETAIL_TTL, maxsize=50000)
+# (trip_id, seq, kind) -> total_parcel; chỉ giữ ngắn vì trip đang load vẫn tăng
+_parcel_count_cache = TTLCache(LH_PARCEL_COUNT_TTL, maxsize=5000)
+# trip_id -> run sheets; LH_run_sheet rồi LH_download_pdf chỉ gọi run_sheet/list 1 lần
+_run_sheet_cache = TTLCache(LH_RUN_SHEET_TTL, maxsize=2000)
+
+
+class UpstreamError(RuntimeError):
+    """SPX answered with retcode != 0"""
+
+    def __init__(self, message: str, retcode=None):
+        super().__init__(message)
+        self.retcode = retcode
+
+
+def loading_list_url(kind: str) -> str:
+    """Handover uses current loading list; outbound uses history loading list"""
+    return URL_LOADING_CURRENT if kind == "handover" else URL_LOADING_HISTORY
+
+
+def fetch_loading_page(base_url: str, headers: dict, trip_id, sequence_number: int, page: int,
+                       count: int = PAGE_SIZE, timeout: int = 30) -> dict:
+    """Fetch one loading-list page, returns the `data` object"""
+    params = {
+        "trip_id": trip_id,
+        "pageno": page,
+        "count": count,
+        "loaded_sequence_number": sequence_number,
+        "type": "outbound"
+    }
+    response = http_client.get(base_url, params=params, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+    if data.get("retcode") != 0:
+        raise UpstreamError(data.get("message", "Unknown error from API"), data.get("retcode"))
+    return data.get("data") or {}
+
+
+def _with_retry(fn, retries=LH_PAGE_RETRIES, backoff=1.5):
+    last_err = None
+    for i in range(1, retries + 1):
+        try:
+            return fn()
+        except (requests.exceptions.RequestException, UpstreamError, ValueError) as e:
+            last_err = e
+            if i < retries:
+                time.sleep(backoff ** (i - 1))
+    raise last_err
+
+
+def _fetch_page_with_retry(base_url, headers, trip_id, sequence_number, page, count=PAGE_SIZE):
+    return _with_retry(lambda: fetch_loading_page(base_url, headers, trip_id, sequence_number, page, count=count))
+
+
+def total_pages(first_page: dict) -> int:
+    total = first_page.get("total", 0) or 0
+    count = first_page.get("count") or PAGE_SIZE
+    return math.ceil(total / count)
+
+
+def iter_remaining_pages(base_url: str, headers: dict, trip_id, sequence_number: int, pages: int,
+                         count: int = PAGE_SIZE, workers: int = LH_PAGE_WORKERS):
+    """Yield `data` of pages 2..pages in page order, fetched concurrently.
+
+    Each page is retried on its own; if it still fails the error is raised
+    (no silently missing pages).
+    """
+    if pages < 2:
+        return
+    yield from executors.pool("io").map(
+        lambda p: _fetch_page_with_retry(base_url, headers, trip_id, sequence_number, p, count=count),
+        range(2, pages + 1),
+        limit=workers,
+    )
+
+
+def fetch_parcel_count(headers: dict, trip_id, sequence_number: int, kind: str) -> int:
+    """total_parcel of a trip (first loading-list page only), cached briefly"""
+    key = (str(trip_id), int(sequence_number), kind)
+    return _parcel_count_cache.get_or_load(
+        key,
+        lambda: fetch_loading_page(loading_list_url(kind), headers, trip_id, sequence_number, 1, timeout=10).get("total_parcel", 0),
+    )
+
+
+def fetch_parcel_counts(headers: dict, items: list, workers: int = LH_BATCH_WORKERS) -> list:
+    """Parcel counts for [(trip_id, seq, kind), ...] fetched concurrently; results keep input order"""
+    def _one(it):
+        trip_id, seq, kind = it
+        res = {"trip_id": trip_id, "seq": seq, "kind": kind}
+        try:
+            res.update(ok=True, total_parcel=fetch_parcel_count(headers, trip_id, seq, kind))
+        except Exception as e:
+            res.update(ok=False, error=str(e))
+        return res
+
+    if not items:
+        return []
+    return executors.map("io", _one, items, limit=workers)
+
+
+def _row(item: dict, pack_type_name: str, scan_number: str) -> dict:
+    return {
+        "to_number": item.get("to_number", ""),
+        "pack_type_name": pack_type_name,
+        "scan_number": scan_number,
+        "operator": item.get("operator", ""),
+        "to_weight": round(item.get("to_weight", 0) / 1000, 3),
+        "ctime": item.get("ctime", 0)
+    }
+
+
+def fetch_fleet_ids(to_number: str, headers: dict) -> list:
+    """fleet_order_ids inside a multi-parcel TO (memoized per to_number)"""
+    def _load():
+        detail_params = {"to_number": to_number, "pageno": 1, "count": 300}
+        detail_resp = http_client.get(URL_TO_DETAIL, params=detail_params, headers=headers, timeout=30)
+        detail_resp.raise_for_status()
+        detail_json = detail_resp.json()
+        if detail_json.get("retcode") != 0:
+            raise UpstreamError(detail_json.get("message", "TO detail error"), detail_json.get("retcode"))
+        lst = (detail_json.get("data") or {}).get("list") or []
+        return [row.get("fleet_order_id", "") for row in lst if row.get("fleet_order_id")]
+
+    return _to_detail_cache.get_or_load(to_number, _load)
+
+
+def expand_items(items: list, headers: dict, workers: int = LH_DETAIL_WORKERS) -> list:
+    """CSV rows for loading items, keeping item order.
+
+    Multi-parcel TOs (to_parcel_quantity > 1) expand into one row per
+    fleet_order_id; their details are fetched concurrently in one stage
+    instead of one blocking call per item.
+    """
+    multi = list(dict.fromkeys(
+        item.get("to_number", "") for item in items if item.get("to_parcel_quantity", 0) > 1
+    ))
+
+    fleet = {}
+    if multi:
+        def _safe(to_number):
+            try:
+                return fetch_fleet_ids(to_number, headers)
+            except Exception:
+                return None
+
+        fleet = dict(zip(multi, executors.map("io", _safe, multi, limit=workers)))
+
+    rows = []
+    for item in items:
+        scan_number = item.get("scan_number", "")
+        if item.get("to_parcel_quantity", 0) <= 1:
+            # to_parcel_quantity <= 1, pack_type_name = "Single"
+            rows.append(_row(item, "Single", scan_number))
+            continue
+
+        pack_type_name = item.get("pack_type_name", "")
+        fleet_ids = fleet.get(item.get("to_number", ""))
+        if fleet_ids:
+            # Ghi mỗi fleet_order_id thành 1 dòng riêng
+            rows.extend(_row(item, pack_type_name, fleet_id) for fleet_id in fleet_ids)
+        else:
+            # Không có fleet_id hoặc lỗi -> giữ nguyên dòng gốc
+            rows.append(_row(item, pack_type_name, scan_number))
+    return rows
+
+
+def iter_trip_rows(base_url: str, headers: dict, trip_id, sequence_number: int, first: dict, pages: int):
+    """Yield CSV rows page by page (page order): page 1 first, then pages 2..N as they arrive.
+
+    Multi-parcel TOs of each page are expanded before the page is yielded.
+    """
+    yield expand_items(first.get("list") or [], headers)
+    for page_data in iter_remaining_pages(base_url, headers, trip_id, sequence_number, pages):
+        yield expand_items(page_data.get("list") or [], headers)
+
+
+def _fmt_ctime(ctime) -> str:
+    if ctime and ctime > 0:
+        return datetime.fromtimestamp(ctime, tz=timezone.utc).astimezone(GMT7).strftime("%Y-%m-%d %H:%M:%S")
+    return ""
+
+
+def csv_header(bom: bool = False) -> bytes:
+    """CSV header line (UTF-8, optional BOM so Excel opens Vietnamese text correctly)"""
+    line = ",".join(CSV_FIELDS) + "\r\n"
+    return (codecs.BOM_UTF8 if bom else b"") + line.encode("utf-8")
+
+
+def csv_rows(rows: list) -> bytes:
+    """Encode rows as CSV lines, ctime converted to GMT+7"""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=CSV_FIELDS)
+    for row in rows:
+        writer.writerow(dict(row, ctime=_fmt_ctime(row["ctime"])))
+    return buf.getvalue().encode("utf-8")
+
+
+# ───── Run sheets ─────
+def fetch_run_sheets(headers: dict, trip_id) -> list:
+    """run_sheet/list of a trip (cached; empty lists are not cached since sheets may appear later)"""
+    key = str(trip_id)
+
+    def _load():
+        resp = http_client.get(URL_RUN_SHEET_LIST, params={"trip_id": trip_id}, headers=headers, timeout=15)
+        resp.raise_for_status()
+        data = resp.json()
+        if data.get("retcode") != 0:
+            raise UpstreamError(data.get("message", "API error"), data.get("retcode"))
+        return (data.get("data") or {}).get("list") or []
+
+    sheets = _run_sheet_cache.get_or_load(key, _load)
+    if not sheets:
+        _run_sheet_cache.pop(key)
+    return sheets
+
+
+def find_run_sheet(headers: dict, trip_id, station_id: int = STATION_ID):
+    """Run sheet with a sheet_url, matching station_id first; None if the trip has none"""
+    sheets = fetch_run_sheets(headers, trip_id)
+    sheet = next((s for s in sheets if s.get("station_id") == station_id and s.get("sheet_url")), None)
+    if not sheet:
+        sheet = next((s for s in sheets if s.get("sheet_url")), None)
+    return sheet
+
+
+def sheet_download_url(sheet_url: str) -> str:
+    return f"{SPX_BASE}{sheet_url}" if sheet_url.startswith('/') else sheet_url
+
+
+# ───── Trip listing (outbound = trip history, handover = current trips) ─────
+def _fmt_ts(ts) -> str:
+    if not ts:
+        return ""
+    return datetime.fromtimestamp(ts, tz=GMT7).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def normalize_trip(trip: dict, kind: str) -> dict:
+    """One trip row for the LH table from station 2259.
+
+    Handover trips without station 2259 fall back to their first station;
+    outbound rows stay empty then, as the old outbound view did.
+    """
+    stations = trip.get("trip_station") or []
+    station = next((s for s in stations if s.get("station") == STATION_ID), None)
+    if station is None:
+        fallback = kind == "handover" and isinstance(stations, list) and stations
+        station = stations[0] if fallback else {}
+
+    return {
+        "id": trip["id"],
+        "trip_number": trip["trip_number"],
+        "kind": kind,
+        "driver_name": trip.get("driver_name", ""),
+        "seal_time": _fmt_ts(station.get("seal_time")),
+        "loading_time": _fmt_ts(station.get("loading_time")),
+        "sequence_number": station.get("sequence_number", 1),
+        "load_quantity": station.get("load_quantity", 0),
+        "to_parcel_quantity": 0,  # Will be fetched by frontend (LH_get_parcel_counts)
+        "vehicle_number": trip.get("vehicle_number", ""),
+        "vehicle_type_name": trip.get("vehicle_type_name", ""),
+    }
+
+
+def fetch_trip_page(kind: str, headers: dict, from_time: int, to_time: int, page: int,
+                    count: int = TRIP_PAGE_SIZE, mtime_from: int = None) -> dict:
+    """One page of the upstream trip list, returns the `data` object.
+
+    mtime_from narrows the list to trips modified since then (incremental sync).
+    """
+    url = URL_TRIP_LIST if kind == "handover" else URL_TRIP_HISTORY_LIST
+    params = {
+        "loading_time": f"{from_time},{to_time}",
+        "pageno": page,
+        "count": count,
+        "mtime": f"{int(mtime_from) if mtime_from else from_time},{to_time}",
+        "query_type": 2,
+        "middle_station": MIDDLE_STATION,
+    }
+    response = http_client.get(url, params=params, headers=headers, timeout=30)
+    response.raise_for_status()
+    data = response.json()
+    if data.get("retcode") != 0:
+        raise UpstreamError(data.get("message", "Unknown error from API"), data.get("retcode"))
+    return data.get("data") or {}
+
+
+def fetch_trips(kind: str, headers: dict, from_time: int, to_time: int,
+                workers: int = LH_PAGE_WORKERS, mtime_from: int = None) -> list:
+    """Every trip of one kind in the window (all pages, fetched concurrently), normalized"""
+    def _page(p):
+        return fetch_trip_page(kind, headers, from_time, to_time, p, mtime_from=mtime_from)
+
+    first = _page(1)
+    raw = list(first.get("list") or [])
+    total = first.get("total")
+
+    if total is not None:
+        pages = math.ceil(int(total) / TRIP_PAGE_SIZE)
+        if pages > 1:
+            for data in executors.pool("io").map(lambda p: _with_retry(lambda: _page(p)),
+                                                 range(2, pages + 1), limit=workers):
+                raw.extend(data.get("list") or [])
+    else:
+        # Upstream không trả total -> đi tiếp tới khi gặp trang thiếu
+        page, last_len = 1, len(raw)
+        while last_len >= TRIP_PAGE_SIZE:
+            page += 1
+            data = _with_retry(lambda: _page(page))
+            batch = data.get("list") or []
+            raw.extend(batch)
+            last_len = len(batch)
+
+    # Trang có thể chồng nhau nếu list thay đổi giữa các lần gọi -> dedupe theo id
+    seen, trips = set(), []
+    for trip in raw:
+        if trip.get("id") in seen:
+            continue
+        seen.add(trip.get("id"))
+        trips.append(normalize_trip(trip, kind))
+    return trips
+
+
+def list_trips(headers: dict, from_time: int, to_time: int, kinds=TRIP_KINDS) -> dict:
+    """{kind: trips or Exception} for each requested kind, kinds fetched concurrently"""
+    def _one(kind):
+        try:
+            return fetch_trips(kind, headers, from_time, to_time)
+        except Exception as e:
+            return e
+
+    return dict(zip(kinds, executors.map("io", _one, kinds)))
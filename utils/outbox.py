@@ -0,0 +1,204 @@
+"""
+Delivery Outbox
+Disk-backed queue of outgoing messages drained by one background worker
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class Outbox:
+    """Persist outgoing messages, deliver them in the background, retry with backoff.
+
+    Every message is `<id>.json` in `directory`, with its attachment (if any)
+    next to it as `<id>.bin`, so undelivered messages survive a restart.
+    handlers[kind](payload, attachment_path) delivers one message and raises
+    on failure. After max_attempts failures the message is renamed to
+    `<id>.failed.json` and left for inspection. Ids of the last `keep_sent`
+    delivered messages are kept in memory so status() can report them.
+    """
+
+    def __init__(self, directory: str, handlers: dict, max_attempts: int = 8,
+                 base_delay: float = 5.0, max_delay: float = 600.0, name: str = "outbox",
+                 keep_sent: int = 1000):
+        self.directory = directory
+        self.handlers = handlers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.name = name
+        self.keep_sent = keep_sent
+        self._items = {}   # id -> record (pending only)
+        self._sent = OrderedDict()   # id -> sent_at, newest last
+        self._cond = threading.Condition()
+        self._worker = None
+
+    # ───── Queue ─────
+    def put(self, kind: str, payload: dict, data: bytes = None, src_path: str = None,
+            src_file=None) -> str:
+        """Queue one message; the attachment is `data`, the file at `src_path` or
+        the open binary file `src_file` (copied from its current position).
+
+        src_path is hard-linked when possible (no copy; the outbox keeps its own
+        name for it, so the original may be deleted meanwhile), else copied.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown outbox kind: {kind}")
+        os.makedirs(self.directory, exist_ok=True)
+        msg_id = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+        record = {"id": msg_id, "kind": kind, "payload": payload, "attachment": None,
+                  "attempts": 0, "next_at": 0, "created_at": time.time(), "error": None}
+
+        if data is not None or src_path or src_file is not None:
+            att = self._path(msg_id, ".bin")
+            tmp = att + ".tmp"
+            if data is not None:
+                with open(tmp, "wb") as f:
+                    f.write(data)
+            elif src_file is not None:
+                with open(tmp, "wb") as f:
+                    shutil.copyfileobj(src_file, f)
+            else:
+                try:
+                    os.link(src_path, tmp)
+                except OSError:
+                    shutil.copyfile(src_path, tmp)
+            os.replace(tmp, att)
+            record["attachment"] = os.path.basename(att)
+
+        self._save(record)
+        with self._cond:
+            self._items[msg_id] = record
+            self._cond.notify_all()
+        self.start()
+        return msg_id
+
+    def status(self, msg_id: str) -> dict:
+        """{"state": pending|sent|failed|unknown, ...}; unknown = never queued, or sent too long ago"""
+        with self._cond:
+            rec = self._items.get(msg_id)
+            if rec is not None:
+                return {"state": "pending", "attempts": rec["attempts"], "error": rec["error"],
+                        "next_at": rec["next_at"]}
+            sent_at = self._sent.get(msg_id)
+            if sent_at is not None:
+                return {"state": "sent", "sent_at": sent_at}
+        failed = self._path(msg_id, ".failed.json")
+        if os.path.exists(failed):
+            with open(failed, encoding="utf-8") as f:
+                rec = json.load(f)
+            return {"state": "failed", "attempts": rec["attempts"], "error": rec["error"]}
+        return {"state": "unknown"}
+
+    def stats(self) -> dict:
+        with self._cond:
+            pending = len(self._items)
+        try:
+            failed = sum(1 for n in os.listdir(self.directory) if n.endswith(".failed.json"))
+        except FileNotFoundError:
+            failed = 0
+        return {"pending": pending, "failed": failed}
+
+    # ───── Worker ─────
+    def start(self):
+        """Load messages left on disk and start the worker (idempotent)"""
+        with self._cond:
+            if self._worker is not None:
+                return
+            self._load()
+            self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                rec = self._next_due()
+                while rec is None:
+                    wake = min((r["next_at"] for r in self._items.values()), default=None)
+                    self._cond.wait(None if wake is None else max(wake - time.time(), 0.05))
+                    rec = self._next_due()
+            try:
+                self._deliver(rec)
+            except Exception as e:
+                # Lỗi ghi đĩa (_save / os.replace) không được làm chết worker; thử lại sau base_delay
+                print(f"[{self.name}] ❌ {rec['kind']} {rec['id']} bookkeeping failed: {e}")
+                with self._cond:
+                    if rec["id"] in self._items:
+                        rec["next_at"] = max(rec["next_at"], time.time() + self.base_delay)
+
+    def _next_due(self):
+        now = time.time()
+        due = [r for r in self._items.values() if r["next_at"] <= now]
+        return min(due, key=lambda r: r["created_at"]) if due else None
+
+    def _deliver(self, rec: dict):
+        att = os.path.join(self.directory, rec["attachment"]) if rec["attachment"] else None
+        try:
+            self.handlers[rec["kind"]](rec["payload"], att)
+        except Exception as e:
+            rec["attempts"] += 1
+            rec["error"] = str(e)[:500]
+            if rec["attempts"] >= self.max_attempts:
+                print(f"[{self.name}] ❌ {rec['kind']} {rec['id']} failed after {rec['attempts']} attempts: {e}")
+                self._save(rec)
+                os.replace(self._path(rec["id"], ".json"), self._path(rec["id"], ".failed.json"))
+                with self._cond:
+                    self._items.pop(rec["id"], None)
+                return
+            delay = min(self.base_delay * (2 ** (rec["attempts"] - 1)), self.max_delay)
+            rec["next_at"] = time.time() + delay
+            print(f"[{self.name}] ⚠️ {rec['kind']} {rec['id']} attempt {rec['attempts']} failed, retry in {delay:.0f}s: {e}")
+            self._save(rec)
+            return
+
+        print(f"[{self.name}] ✅ {rec['kind']} {rec['id']} delivered")
+        with self._cond:
+            self._items.pop(rec["id"], None)
+            self._sent[rec["id"]] = time.time()
+            while len(self._sent) > self.keep_sent:
+                self._sent.popitem(last=False)
+        for path in (self._path(rec["id"], ".json"), att):
+            if path:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    # ───── Disk ─────
+    def _path(self, msg_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, msg_id + suffix)
+
+    def _save(self, rec: dict):
+        path = self._path(rec["id"], ".json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(rec, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _load(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        loaded = 0
+        for n in names:
+            if not n.endswith(".json") or n.endswith(".failed.json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, n), encoding="utf-8") as f:
+                    rec = json.load(f)
+            except Exception as e:
+                print(f"[{self.name}] ⚠️ Skip unreadable {n}: {e}")
+                continue
+            if rec.get("id") not in self._items:
+                # Sau restart gửi lại ngay, không chờ hết backoff cũ
+                rec["next_at"] = 0
+                self._items[rec["id"]] = rec
+                loaded += 1
+        if loaded:
+            print(f"[{self.name}] 📬 Resuming {loaded} undelivered message(s)")
@@ -0,0 +1,50 @@
+"""
+Region Classifier
+Map Vietnamese province / city names (buyer state) to configured regions
+"""
+
+import re
+import threading
+import unicodedata
+
+_DROP_WORDS = re.compile(r"\b(tp|thanh pho|city|province|tinh|quan|huyen)\b")
+_SEPARATORS = re.compile(r"[-_/]")
+_SPACES = re.compile(r"\s+")
+
+
+def norm_vn_name(value) -> str:
+    """Lowercase, strip accents and administrative words: 'TP Đà Nẵng' -> 'da nang'"""
+    v = str(value if value is not None else "").strip().lower()
+    v = "".join(c for c in unicodedata.normalize("NFD", v) if unicodedata.category(c) != "Mn")
+    v = v.replace("đ", "d")
+    v = _SEPARATORS.sub(" ", v)
+    v = _DROP_WORDS.sub(" ", v)
+    return _SPACES.sub(" ", v).strip()
+
+
+class RegionClassifier:
+    """Classify buyer states against a {region: regex} table.
+
+    Patterns are matched against norm_vn_name(value); the first matching
+    region wins, "" means no region. Every distinct raw value is normalized
+    and matched once, then remembered (up to max_memo values) across calls.
+    """
+
+    def __init__(self, table: dict, max_memo: int = 20000):
+        self.table = dict(table)
+        self._patterns = [(region, re.compile(p)) for region, p in self.table.items()]
+        self._memo = {}
+        self._max_memo = max_memo
+        self._lock = threading.Lock()
+
+    def classify(self, value) -> str:
+        key = "" if value is None else str(value)
+        region = self._memo.get(key)
+        if region is None:
+            norm = norm_vn_name(key)
+            region = next((r for r, p in self._patterns if p.search(norm)), "")
+            with self._lock:
+                if len(self._memo) >= self._max_memo:
+                    self._memo.clear()
+                self._memo[key] = region
+        return region
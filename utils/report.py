@@ -3,21 +3,16 @@ Report Generation Module
 Excel report creation for Handover data
 """
 
-import io
-import openpyxl
-from openpyxl.styles import Alignment, Font, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
 from datetime import datetime
 
+from .excel import TableWorkbook
+
 try:
     from zoneinfo import ZoneInfo
 except ImportError:
     ZoneInfo = None
 
 CHANNELS = ["SPX", "GHN"]
-THIN = Side(style="thin", color="CCCCCC")
-BORDER_ALL = Border(left=THIN, right=THIN, top=THIN, bottom=THIN)
-CENTER = Alignment(horizontal="center", vertical="center")
 
 
 def now_vn():
@@ -27,39 +22,6 @@ def now_vn():
     return datetime.utcnow()
 
 
-def _autosize_columns(ws):
-    """Auto-size worksheet columns based on content"""
-    maxw = {}
-    for row in ws.iter_rows(values_only=True):
-        for c_idx, val in enumerate(row, start=1):
-            ln = len(str(val)) if val is not None else 0
-            maxw[c_idx] = max(maxw.get(c_idx, 0), ln)
-
-    for c_idx, w in maxw.items():
-        ws.column_dimensions[get_column_letter(c_idx)].width = min(max(w + 2, 10), 50)
-
-
-def _style_all_center(ws):
-    """Apply centered styling to worksheet"""
-    # Header
-    for cell in ws[1]:
-        cell.font = Font(bold=True, color="FFFFFF")
-        cell.fill = PatternFill("solid", fgColor="4F81BD")
-        cell.alignment = CENTER
-        cell.border = BORDER_ALL
-
-    # Body
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, max_col=ws.max_column):
-        for cell in row:
-            cell.alignment = CENTER
-            cell.border = BORDER_ALL
-
-    ws.freeze_panes = "A2"
-    ws.auto_filter.ref = ws.dimensions
-    ws.row_dimensions[1].height = 22
-    _autosize_columns(ws)
-
-
 def _parse_scan_ts(ev: dict) -> int:
     """Parse scan timestamp from event data"""
     ts = ev.get("ts")
@@ -79,19 +41,36 @@ def _parse_scan_ts(ev: dict) -> int:
             return 0
 
 
-def build_report_message(date_str, snap):
-    """Build report message text with statistics"""
+def collect_handover(events_by_channel: dict, keep_rows: bool = True):
+    """Counters (and sorted rows) from {channel: iterable of (order_id, ev)} consumed as a stream.
+
+    Only the fields the report uses are kept per event, so a chunked reader
+    (firebase.iter_children) never needs the whole day in memory.
+    Returns (per_ch_non_cancel, count_cancel, {channel: [(order_id, ev), ...] newest first}).
+    """
     count_cancel = 0
     per_ch_non_cancel = {ch: 0 for ch in CHANNELS}
+    rows = {}
 
     for ch in CHANNELS:
-        data_ch = (snap.get(ch) or {})
-        for _, ev in data_ch.items():
-            if (ev or {}).get("is_cancelled") == "Yes":
+        items = []
+        for order_id, ev in events_by_channel.get(ch) or ():
+            ev = ev if isinstance(ev, dict) else {}
+            if ev.get("is_cancelled") == "Yes":
                 count_cancel += 1
             else:
                 per_ch_non_cancel[ch] += 1
+            if keep_rows:
+                items.append((order_id, {k: ev[k] for k in ("ts", "time_vn", "time", "user") if k in ev}))
+        if keep_rows:
+            items.sort(key=lambda kv: _parse_scan_ts(kv[1]), reverse=True)
+            rows[ch] = items
+
+    return per_ch_non_cancel, count_cancel, rows
 
+
+def format_report_message(date_str, per_ch_non_cancel, count_cancel):
+    """Report text + filename from precomputed counters"""
     total_non_cancel = sum(per_ch_non_cancel.values())
     t = now_vn()
     current_time = t.strftime("%H:%M:%S")
@@ -109,34 +88,19 @@ def build_report_message(date_str, snap):
     return msg, filename, per_ch_non_cancel, count_cancel, total_non_cancel
 
 
-def create_excel_report(snap, filename):
-    """Create Excel workbook with handover data"""
-    wb = openpyxl.Workbook()
-    wb.remove(wb.active)
+def handover_book(sorted_items_by_channel: dict) -> TableWorkbook:
+    """Handover sheets from {channel: [(order_id, ev), ...]} already sorted newest first"""
+    book = TableWorkbook()
 
     for ch in CHANNELS:
-        ws = wb.create_sheet(ch)
-        ws.append(["STT", "Scan Time", "LM Tracking", "Người Bàn Giao"])
-
-        data_ch = (snap.get(ch) or {})
-        sorted_items = sorted(
-            data_ch.items(),
-            key=lambda kv: _parse_scan_ts(kv[1]),
-            reverse=True
-        )
-
-        for i, (order_id, ev) in enumerate(sorted_items, start=1):
-            ws.append([
+        sheet = book.add_sheet(ch, ["STT", "Scan Time", "LM Tracking", "Người Bàn Giao"])
+
+        for i, (order_id, ev) in enumerate(sorted_items_by_channel.get(ch) or [], start=1):
+            sheet.append((
                 i,
                 ev.get("time_vn") or ev.get("time") or "",
                 order_id,
                 ev.get("user", "")
-            ])
-
-        _style_all_center(ws)
+            ))
 
-    # Save to BytesIO
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    return output.getvalue()
+    return book
@@ -3,17 +3,69 @@ SeaTalk Integration Module
 Send messages and files to SeaTalk webhook
 """
 
+import io
+import json
 import os
 import logging
-import requests
+import threading
+import uuid
+
+from config import SEATALK_OUTBOX_DIR, SEATALK_MAX_ATTEMPTS, SEATALK_RETRY_BASE, SEATALK_RETRY_MAX
+from . import http_client
+from .outbox import Outbox
 
 WEBHOOK_URL = os.getenv("SEATALK_WEBHOOK_URL", "")
 
-def seatalk_text(text: str):
-    """Send text message to SeaTalk; tries few payload variants."""
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Variant webhook đã nhận lần gần nhất -> thử nó trước, khỏi dò lại từ đầu.
+# Lưu cạnh outbox để còn sau restart (không đuôi .json: outbox sẽ đọc nhầm thành message)
+ACCEPTED_PATH = os.path.join(SEATALK_OUTBOX_DIR, "accepted_variants.state")
+
+
+def _load_accepted(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+_accepted = _load_accepted(ACCEPTED_PATH)
+_accepted_lock = threading.Lock()
+
+
+def _ordered(kind: str, tries: list) -> list:
+    with _accepted_lock:
+        label = _accepted.get(kind)
+    return sorted(tries, key=lambda t: t[0] != label)
+
+
+def _remember(kind: str, label: str):
+    with _accepted_lock:
+        if _accepted.get(kind) == label:
+            return
+        _accepted[kind] = label
+        try:
+            os.makedirs(os.path.dirname(ACCEPTED_PATH), exist_ok=True)
+            tmp = ACCEPTED_PATH + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(_accepted, f)
+            os.replace(tmp, ACCEPTED_PATH)
+        except OSError as e:
+            logging.warning("[Seatalk] Could not save accepted variants: %s", e)
+
+
+def _require_webhook():
     if not WEBHOOK_URL:
         raise RuntimeError("WEBHOOK_URL trống. Set env SEATALK_WEBHOOK_URL.")
 
+
+def seatalk_text(text: str):
+    """Send text message to SeaTalk; tries few payload variants (the accepted one first)."""
+    _require_webhook()
+
     tries = [
         ("json_text", {"json": {"text": text}, "data": None}),
         ("json_content", {"json": {"content": text}, "data": None}),
@@ -23,43 +75,119 @@ def seatalk_text(text: str):
     ]
 
     last = None
-    for label, payload in tries:
-        try:
-            r = requests.post(WEBHOOK_URL, json=payload["json"], data=payload["data"], timeout=12)
-            last = r
-            logging.info("[Seatalk %s] HTTP %s body=%s", label, r.status_code, (r.text or "")[:500])
-            if r.status_code < 300:
-                return {"ok": True, "status": r.status_code, "body": r.text, "variant": label}
-        except Exception as e:
-            logging.exception("[Seatalk %s] exception: %s", label, e)
-
-    if last is None:
-        raise RuntimeError("Seatalk request không thực hiện được (network error).")
+    for label, payload in _ordered("text", tries):
+        # Lỗi mạng không liên quan tới variant -> dừng, để outbox retry sau
+        r = http_client.post(WEBHOOK_URL, json=payload["json"], data=payload["data"], timeout=12)
+        last = r
+        logging.info("[Seatalk %s] HTTP %s body=%s", label, r.status_code, (r.text or "")[:500])
+        if r.status_code < 300:
+            _remember("text", label)
+            return {"ok": True, "status": r.status_code, "body": r.text, "variant": label}
+
     raise RuntimeError(f"Seatalk HTTP {last.status_code}: {(last.text or '')[:500]}")
 
 
-def seatalk_file(bytes_data: bytes, filename: str, caption: str = ""):
-    """Send file to SeaTalk (tries common field names)."""
-    if not WEBHOOK_URL:
-        raise RuntimeError("WEBHOOK_URL trống. Set env SEATALK_WEBHOOK_URL.")
+class _MultipartFile:
+    """multipart/form-data body with text fields and one file part read from disk.
+
+    Has `len`, so requests sends a Content-Length and streams the file in
+    blocks instead of building the whole body in memory.
+    """
+
+    def __init__(self, fields: dict, field: str, filename: str, path: str, content_type: str):
+        self.boundary = uuid.uuid4().hex
+        b = self.boundary
+        name = filename.replace("\\", "\\\\").replace('"', '\\"')
+        head = "".join(
+            f'--{b}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n' for k, v in fields.items()
+        )
+        head += (f'--{b}\r\nContent-Disposition: form-data; name="{field}"; filename="{name}"\r\n'
+                 f"Content-Type: {content_type}\r\n\r\n")
+        head, tail = head.encode("utf-8"), f"\r\n--{b}--\r\n".encode()
+        self.len = len(head) + os.path.getsize(path) + len(tail)
+        self._parts = [io.BytesIO(head), open(path, "rb"), io.BytesIO(tail)]
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def read(self, size: int = -1) -> bytes:
+        out = b""
+        while self._parts and (size < 0 or len(out) < size):
+            chunk = self._parts[0].read(-1 if size < 0 else size - len(out))
+            if not chunk:
+                self._parts.pop(0).close()
+                continue
+            out += chunk
+        return out
+
+    def __iter__(self):
+        return iter(lambda: self.read(64 * 1024), b"")
+
+    def close(self):
+        for p in self._parts:
+            p.close()
+        self._parts = []
+
+
+def seatalk_file(data, filename: str, caption: str = ""):
+    """Send file to SeaTalk (tries common field names, the accepted one first).
+
+    data: bytes, or the path of a file that is streamed from disk.
+    """
+    _require_webhook()
+
+    tries = [
+        ("file", XLSX_MIME),
+        ("attachment", "application/octet-stream"),
+    ]
+
+    fails = []
+    for field, mime in _ordered("file", tries):
+        if isinstance(data, (bytes, bytearray)):
+            r = http_client.post(WEBHOOK_URL, data={"text": caption}, files={field: (filename, data, mime)},
+                                 timeout=30)
+        else:
+            body = _MultipartFile({"text": caption}, field, filename, data, mime)
+            try:
+                r = http_client.post(WEBHOOK_URL, data=body, headers={"Content-Type": body.content_type},
+                                     timeout=30)
+            finally:
+                body.close()
+        logging.info("[Seatalk file %s] HTTP %s body=%s", field, r.status_code, (r.text or "")[:500])
+        if r.status_code < 300:
+            _remember("file", field)
+            return {"ok": True, "status": r.status_code, "body": r.text, "variant": field}
+        fails.append(f"{r.status_code}:{(r.text or '')[:200]}")
+
+    raise RuntimeError(f"Seatalk upload fail: {' | '.join(fails)}")
+
+
+# ───── Outbox ─────
+def _send_text(payload: dict, attachment: str):
+    seatalk_text(payload["text"])
+
+
+def _send_file(payload: dict, attachment: str):
+    seatalk_file(attachment, payload["filename"], caption=payload.get("caption", ""))
+
+
+outbox = Outbox(SEATALK_OUTBOX_DIR, {"text": _send_text, "file": _send_file},
+                max_attempts=SEATALK_MAX_ATTEMPTS, base_delay=SEATALK_RETRY_BASE,
+                max_delay=SEATALK_RETRY_MAX, name="seatalk-outbox")
+
+
+def queue_text(text: str) -> str:
+    """Queue a text message for background delivery; returns the outbox id"""
+    _require_webhook()
+    return outbox.put("text", {"text": text})
+
 
-    files = {
-        "file": (filename, bytes_data, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
-    }
-    data = {"text": caption}
-
-    r = requests.post(WEBHOOK_URL, data=data, files=files, timeout=30)
-    logging.info("[Seatalk file] HTTP %s body=%s", r.status_code, (r.text or "")[:500])
-
-    if r.status_code >= 300:
-        # fallback with 'attachment'
-        files2 = {"attachment": (filename, bytes_data, "application/octet-stream")}
-        r2 = requests.post(WEBHOOK_URL, data={"text": caption}, files=files2, timeout=30)
-        logging.info("[Seatalk file2] HTTP %s body=%s", r2.status_code, (r2.text or "")[:500])
-        if r2.status_code >= 300:
-            raise RuntimeError(
-                f"Seatalk upload fail: {r.status_code}:{(r.text or '')[:200]} | {r2.status_code}:{(r2.text or '')[:200]}"
-            )
-        return {"ok": True, "status": r2.status_code, "body": r2.text, "variant": "attachment"}
-
-    return {"ok": True, "status": r.status_code, "body": r.text, "variant": "file"}
+def queue_file(data, filename: str, caption: str = "") -> str:
+    """Queue a file (bytes, an open binary file or a path on disk) for background delivery; returns the outbox id"""
+    _require_webhook()
+    if isinstance(data, (bytes, bytearray)):
+        return outbox.put("file", {"filename": filename, "caption": caption}, data=data)
+    if hasattr(data, "read"):
+        return outbox.put("file", {"filename": filename, "caption": caption}, src_file=data)
+    return outbox.put("file", {"filename": filename, "caption": caption}, src_path=data)